@@ -1,14 +1,23 @@
 import os
 import time
+import asyncio
 import uvicorn
-import wave
-from openai import OpenAI
+from openai import AsyncOpenAI
 from fastapi import FastAPI, WebSocket
 from io import BytesIO
 from pydub import AudioSegment
+from app.redis.redis_client import create_redis
+from app.redis import transcription, turns
+from app.redis.transcription import transcribe, require_batcher, TranscriptionUnavailable
+from app.config import SPECULATION_ENABLED, UTTERANCE_MEMORY_KB
+from app.speculation import EndOfTurnDetector, SpeculativeResponder
+from app.admission import track_upstream
+from app.utterance_buffer import UtteranceBuffer, UtteranceTooLong, peak_rss_kib
 
 app = FastAPI()
-client = OpenAI()
+client = AsyncOpenAI()
+# Utterances are transcribed in batches with other connections' by the transcription service
+redis_conn = create_redis()
 FIREBASE_CREDENTIALS_PATH="./bern-8dbc2-firebase-adminsdk-fbsvc-f2d05b268c.json"
 SAMPLE_RATE = 8000
 CHANNELS = 1
@@ -34,16 +43,6 @@ Avoid unnecessary details, prioritize curiosity and interaction over lengthy exp
 Note: Avoid emojis in your responses.
 Focus on fostering curiosity, companionship, and active participation to make learning an engaging and enriching experience'''
 
-def pcm_to_wav(pcm_bytes: bytes) -> bytes:
-    """Convert PCM data to WAV format."""
-    wav_buffer = BytesIO()
-    with wave.open(wav_buffer, 'wb') as wav_file:
-        wav_file.setnchannels(CHANNELS)
-        wav_file.setsampwidth(SAMPLE_WIDTH)
-        wav_file.setframerate(SAMPLE_RATE)
-        wav_file.writeframes(pcm_bytes)
-    return wav_buffer.getvalue()
-
 def mp3_to_wav(mp3_data: bytes) -> bytes:
     """Convert MP3 chunk to WAV (PCM 16-bit)."""
     mp3_buffer = BytesIO(mp3_data)
@@ -53,58 +52,143 @@ def mp3_to_wav(mp3_data: bytes) -> bytes:
     audio.export(wav_buffer, format="wav")
     return wav_buffer.getvalue()
 
+async def generate_reply(transcribed_text: str) -> str:
+    """Generate AI response (Limit to 3 lines)"""
+    # Counted towards the servers' upstream concurrency signal
+    async with track_upstream():
+        chat_response = await client.chat.completions.create(
+            model="gpt-4o",
+            messages=[
+                {"role": "system", "content": system_msg},
+                {"role": "user", "content": transcribed_text}
+            ],
+            max_tokens=50  # Limit response length
+        )
+    return chat_response.choices[0].message.content
+
 @app.websocket("/upload")
 async def websocket_audio_receiver(websocket: WebSocket):
     await websocket.accept()
     print("Client connected: Receiving PCM data...")
-    audio_buffer = bytearray()
+    # Spills to a temp file past UTTERANCE_MEMORY_KB, capped at UTTERANCE_MAX_MB
+    audio_buffer = UtteranceBuffer()
+    stream_id = f"ztl_{id(websocket)}"
+    detector = EndOfTurnDetector(SAMPLE_RATE)
+    responder = SpeculativeResponder(generate_reply, redis_conn)
+    early_transcript = None
+    disconnected = False
+
+    async def speculate(pcm_bytes: memoryview):
+        # Start the reply from what has been said so far while we wait for END
+        try:
+            text = await asyncio.to_thread(transcribe, redis_conn, stream_id, pcm_bytes)
+        except TranscriptionUnavailable:
+            # The answer itself reports it
+            return
+        if text:
+            print(f"Speculating on: {text}")
+            responder.speculate(text)
+
+    async def answer(pcm_bytes: memoryview, request_id: str) -> str:
+        # Transcribe through the batching service
+        transcribed_text = await asyncio.to_thread(
+            transcribe, redis_conn, stream_id, pcm_bytes, request_id=request_id
+        )
+        print(f"Transcribed: {transcribed_text}")
+        if not transcribed_text:
+            # Nothing to answer; don't ask the model about an empty prompt
+            return None
+        
+        # Reuses the speculative reply when the transcript still matches
+        return await responder.resolve(transcribed_text)
     
     try:
+        pending = None
         while True:
-            data = await websocket.receive_bytes()
-            if data == b"NODATA":
-                audio_buffer.clear()
-                break
-            if data == b"END":
-                print("Received END signal. Processing audio...")
+            while True:
+                data = pending if pending is not None else await websocket.receive_bytes()
+                pending = None
+                if data == b"NODATA":
+                    audio_buffer.reset()
+                    break
+                if data == b"END":
+                    print("Received END signal. Processing audio...")
+                    break
+                audio_buffer.append(data)
+                if SPECULATION_ENABLED and detector.feed(data):
+                    if early_transcript is not None:
+                        early_transcript.cancel()
+                    early_transcript = asyncio.create_task(speculate(audio_buffer.view()))
+                
+            # A speculative transcript that hasn't arrived yet is no use now
+            if early_transcript is not None and not early_transcript.done():
+                early_transcript.cancel()
+
+            if not audio_buffer:
                 break
-            audio_buffer.extend(data)
             
-        if audio_buffer:
-            pcm_bytes = bytes(audio_buffer)
-            # Convert PCM to WAV
-            wav_audio = pcm_to_wav(pcm_bytes)
+            # Keep listening while answering, so new speech or a hang-up
+            # cancels the answer instead of waiting for it
+            request_id = transcription.new_request_id()
+            # The transcription request is written straight from the buffer's view
+            reply = asyncio.create_task(answer(audio_buffer.view(), request_id))
+            listen = asyncio.create_task(websocket.receive())
+            await asyncio.wait({reply, listen}, return_when=asyncio.FIRST_COMPLETED)
             
-            # Transcribe using Whisper
-            audio_file = BytesIO(wav_audio)
-            audio_file.name = "audio.wav"
-            response = client.audio.transcriptions.create(
-                model="whisper-1",
-                file=audio_file,
-                response_format="text",
-                language="en"
-            )
-            transcribed_text = response.strip()
-            print(f"Transcribed: {transcribed_text}")
+            if reply.done():
+                listen.cancel()
+                # Send response back to client
+                ai_text = reply.result()
+                print(f"AI response: {ai_text}")
+                if ai_text:
+                    await websocket.send_text(ai_text)
+                break
             
-            # Generate AI response (Limit to 3 lines)
-            chat_response = client.chat.completions.create(
-                model="gpt-4o",
-                messages=[
-                    {"role": "system", "content": system_msg},
-                    {"role": "user", "content": transcribed_text}
-                ],
-                max_tokens=50  # Limit response length
-            )
+            # Barge-in: drop the transcription and chat requests in flight
+            reply.cancel()
+            responder.cancel()
+            avoided = {"answers_cancelled": 1}
+            if await asyncio.to_thread(transcription.cancel, redis_conn, request_id):
+                avoided["stt_skipped"] = 1
+            message = listen.result()
+            disconnected = message["type"] == "websocket.disconnect"
+            await asyncio.to_thread(turns.record, redis_conn, "disconnect" if disconnected else "speech", avoided)
+            if disconnected:
+                print("Client disconnected, answer cancelled")
+                break
             
-            # Send response back to client
-            ai_text = chat_response.choices[0].message.content
-            print(f"AI response: {ai_text}")
-            await websocket.send_text(ai_text)
+            print("Client spoke again, answer cancelled")
+            audio_buffer.reset()
+            detector = EndOfTurnDetector(SAMPLE_RATE)
+            early_transcript = None
+            pending = message.get("bytes") or b""
+    except UtteranceTooLong as e:
+        print(f"Closing connection: {e}")
+        await websocket.close(code=1009)
+        disconnected = True
+    except TranscriptionUnavailable as e:
+        print(f"Error: {e}")
+        await websocket.close(code=1011, reason="Transcription unavailable")
+        disconnected = True
     except Exception as e:
         print(f"Error: {e}")
     finally:
-        await websocket.close()
+        responder.cancel()
+        audio_buffer.close()
+        print(f"Connection memory: peak {audio_buffer.peak_memory // 1024} KiB buffered, "
+              f"{audio_buffer.peak_spilled // 1024} KiB spilled in {audio_buffer.spills} utterances, "
+              f"process peak RSS {peak_rss_kib()} KiB")
+        if not disconnected:
+            await websocket.close()
+
+@app.on_event("startup")
+async def check_transcription():
+    # Every answer depends on the batcher, so say so now rather than per utterance
+    try:
+        await asyncio.to_thread(require_batcher)
+    except TranscriptionUnavailable as e:
+        print(f"WARNING: {e}")
 
 if __name__ == "__main__":
-    uvicorn.run(app, host="0.0.0.0", port=5000)
\ No newline at end of file
+    # No single frame may be larger than what a connection keeps in memory
+    uvicorn.run(app, host="0.0.0.0", port=5000, ws_max_size=int(UTTERANCE_MEMORY_KB * 1024))
\ No newline at end of file
@@ -0,0 +1,195 @@
+# app/admission.py
+import os
+import time
+import uuid
+import asyncio
+import logging
+from collections import Counter
+from contextlib import asynccontextmanager
+from app.config import (NODE_ID, ADMISSION_MAX_QUEUE_DEPTH, ADMISSION_MAX_LOOP_LAG_MS,
+                        TURN_LATENCY_SLO_MS, MAX_AI_CONCURRENCY, ADMISSION_DEFER,
+                        FRAME_RATE_LIMIT, FRAME_RATE_LIMIT_SHED, FRAME_BURST)
+from app.redis import job_scheduler
+from app.redis.job_scheduler import INTERACTIVE, SHARED_QUEUES, latency_key
+from app.redis.redis_client import get_redis_client
+
+logger = logging.getLogger(__name__)
+
+STATS_KEY = "admission:stats"
+# Upstream AI calls in flight across all workers: a sorted set of call
+# leases scored by expiry, so a worker killed mid-call stops counting once
+# its lease runs out instead of leaking an increment
+AI_INFLIGHT_KEY = "ai:inflight:leases"
+UPSTREAM_LEASE_TTL = 60
+
+# Seconds between load signal refreshes
+REFRESH_INTERVAL = 1.0
+
+class FrameBucket:
+    """Token bucket for one connection's audio frames, held by its handler"""
+
+    __slots__ = ("tokens", "last")
+
+    def __init__(self):
+        self.tokens = float(FRAME_BURST)
+        self.last = time.monotonic()
+
+    def take(self, rate):
+        now = time.monotonic()
+        self.tokens = min(FRAME_BURST, self.tokens + (now - self.last) * rate)
+        self.last = now
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+def percentile(samples, fraction):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+class AdmissionController:
+    """Sheds new sessions and throttles audio while SLOs are at risk.
+
+    Signals are refreshed in the background, so the accept path only
+    reads the last snapshot.
+    """
+
+    def __init__(self, redis_conn, queue_conn):
+        self.redis_conn = redis_conn
+        self.queue_conn = queue_conn
+        # Decisions and dropped frames are counted here and flushed to
+        # STATS_KEY with each refresh, off the accept and frame paths
+        self.counts = Counter()
+        self.signals = {"queue_depth": 0, "loop_lag_ms": 0.0, "turn_p95_ms": 0.0, "ai_inflight": 0}
+        self.reason = None
+
+    def read_queue_signals(self):
+        """Queued jobs across all worker queues, turn latency p95 and upstream AI load"""
+        queue_keys = [f"rq:queue:{name}" for name in SHARED_QUEUES]
+        queue_keys += [key.decode('utf-8') for key in self.queue_conn.smembers("rq:queues")
+                       if key.decode('utf-8').startswith("rq:queue:user_")]
+
+        pipe = self.queue_conn.pipeline()
+        for key in queue_keys:
+            pipe.llen(key)
+        pipe.lrange(latency_key(INTERACTIVE), 0, -1)
+        results = pipe.execute()
+
+        pipe = self.redis_conn.pipeline()
+        pipe.zremrangebyscore(AI_INFLIGHT_KEY, "-inf", time.time())
+        pipe.zcard(AI_INFLIGHT_KEY)
+        ai_inflight = pipe.execute()[1]
+
+        queue_depth = sum(results[:-1])
+        if job_scheduler.local_transport is not None:
+            queue_depth += job_scheduler.local_transport.depth()
+
+        return {
+            "queue_depth": queue_depth,
+            "turn_p95_ms": percentile([float(v) for v in results[-1]], 0.95),
+            "ai_inflight": ai_inflight
+        }
+
+    def evaluate(self):
+        """Name the first SLO at risk, or None"""
+        s = self.signals
+        if s["loop_lag_ms"] > ADMISSION_MAX_LOOP_LAG_MS:
+            return "loop_lag"
+        if s["queue_depth"] > ADMISSION_MAX_QUEUE_DEPTH:
+            return "queue_depth"
+        if s["turn_p95_ms"] > TURN_LATENCY_SLO_MS:
+            return "turn_latency"
+        if s["ai_inflight"] >= MAX_AI_CONCURRENCY:
+            return "ai_concurrency"
+        return None
+
+    async def monitor(self):
+        """Measure event loop lag and refresh the other signals"""
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(REFRESH_INTERVAL)
+            self.signals["loop_lag_ms"] = max(0.0, (loop.time() - start - REFRESH_INTERVAL) * 1000)
+            try:
+                self.signals.update(await asyncio.to_thread(self.read_queue_signals))
+            except Exception as e:
+                logger.error(f"Error reading admission signals: {e}")
+            if self.counts:
+                counts, self.counts = self.counts, Counter()
+                try:
+                    await asyncio.to_thread(self.record_counts, counts)
+                except Exception as e:
+                    logger.error(f"Error recording admission decisions: {e}")
+
+            reason = self.evaluate()
+            if reason != self.reason:
+                if reason:
+                    logger.warning(f"Shedding load ({reason}): {self.signals}")
+                else:
+                    logger.info("Load back within SLOs, admitting sessions")
+                self.reason = reason
+
+    async def admit(self, device_id):
+        """Return None to admit a new session, or the reason it was shed.
+
+        While an SLO is at risk the session is held up to ADMISSION_DEFER
+        seconds in case load clears.
+        """
+        if self.reason is None:
+            self.record("admitted")
+            return None
+
+        deadline = time.monotonic() + ADMISSION_DEFER
+        while time.monotonic() < deadline:
+            await asyncio.sleep(0.25)
+            if self.reason is None:
+                self.record("deferred")
+                return None
+
+        reason = self.reason
+        logger.warning(f"Rejected new session for {device_id}: {reason}")
+        self.record("rejected", reason)
+        return reason
+
+    def allow_frame(self, bucket):
+        """Take a frame from a connection's FrameBucket, tighter while shedding.
+
+        Runs for every frame on the event loop, so it stays in process.
+        """
+        if bucket.take(FRAME_RATE_LIMIT_SHED if self.reason else FRAME_RATE_LIMIT):
+            return True
+        self.record("frames_dropped", self.reason or "frame_rate")
+        return False
+
+    def record(self, decision, reason=None):
+        """Count a decision; monitor() writes the counts out"""
+        self.counts[decision] += 1
+        if reason:
+            self.counts[f"{decision}:{reason}"] += 1
+
+    def record_counts(self, counts):
+        pipe = self.redis_conn.pipeline()
+        for field, count in counts.items():
+            pipe.hincrby(STATS_KEY, field, count)
+        pipe.execute()
+
+    def snapshot(self):
+        """Current signals and decision, for the admin endpoint"""
+        return {"node": NODE_ID, "pid": os.getpid(), "shedding": self.reason,
+                "signals": self.signals}
+
+@asynccontextmanager
+async def track_upstream():
+    """Count an upstream AI call towards the concurrency signal.
+
+    The call holds a lease for up to UPSTREAM_LEASE_TTL seconds.
+    """
+    redis = await get_redis_client()
+    lease = uuid.uuid4().hex
+    await redis.zadd(AI_INFLIGHT_KEY, {lease: time.time() + UPSTREAM_LEASE_TTL})
+    try:
+        yield
+    finally:
+        await redis.zrem(AI_INFLIGHT_KEY, lease)
@@ -0,0 +1,290 @@
+# app/audio_archive.py
+import os
+import mmap
+import time
+import wave
+import sqlite3
+import logging
+import threading
+import argparse
+from app.config import (NODE_ID, ARCHIVE_DIR, ARCHIVE_SEGMENT_MB, ARCHIVE_RETENTION_DAYS,
+                        SAMPLE_RATE, CHANNELS, SAMPLE_WIDTH)
+
+logger = logging.getLogger(__name__)
+
+# Finished utterances are appended as raw PCM to large preallocated
+# segment files; a SQLite index maps each one to its segment, offset and
+# length. Every process fills its own segment, so writers never share a
+# file, while any process can read any segment through mmap. Threads of
+# one process, such as the in-process pipeline's, share its archive and
+# take turns through the archive's lock.
+
+INDEX_NAME = "index.sqlite"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS segments (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    path TEXT NOT NULL,
+    capacity INTEGER NOT NULL,
+    used INTEGER NOT NULL DEFAULT 0,
+    sealed INTEGER NOT NULL DEFAULT 0,
+    created REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS utterances (
+    id INTEGER PRIMARY KEY,
+    segment_id INTEGER NOT NULL,
+    offset INTEGER NOT NULL,
+    length INTEGER NOT NULL,
+    duration REAL NOT NULL,
+    session_id TEXT NOT NULL,
+    device_id TEXT NOT NULL,
+    created REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS utterances_session ON utterances (session_id);
+CREATE INDEX IF NOT EXISTS utterances_device ON utterances (device_id, created);
+CREATE INDEX IF NOT EXISTS utterances_segment ON utterances (segment_id);
+"""
+
+def preallocate(fd, size):
+    try:
+        os.posix_fallocate(fd, 0, size)
+    except (AttributeError, OSError):
+        # Not on every platform or file system; a sparse file still works
+        os.ftruncate(fd, size)
+
+class AudioArchive:
+    """Append-only utterance archive with zero-copy reads"""
+
+    def __init__(self, directory=ARCHIVE_DIR, segment_mb=ARCHIVE_SEGMENT_MB):
+        self.directory = directory
+        self.pid = os.getpid()
+        self.segment_bytes = int(segment_mb * 1024 * 1024)
+        os.makedirs(directory, exist_ok=True)
+        # One connection for all of the process's threads, only used under lock
+        self.lock = threading.RLock()
+        self.db = sqlite3.connect(os.path.join(directory, INDEX_NAME), timeout=30, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.executescript(SCHEMA)
+        # Segment this process appends to: (id, fd, used)
+        self.segment = None
+        # segment_id -> mmap of segments read from
+        self.maps = {}
+
+    def new_segment(self):
+        """Seal the current segment and start a preallocated one"""
+        with self.lock:
+            if self.segment is not None:
+                self.seal(self.segment[0])
+            path = os.path.join(self.directory, f"{NODE_ID}-{os.getpid()}-{time.time_ns()}.seg")
+            fd = os.open(path, os.O_RDWR | os.O_CREAT | os.O_EXCL, 0o644)
+            preallocate(fd, self.segment_bytes)
+            with self.db:
+                segment_id = self.db.execute(
+                    "INSERT INTO segments (path, capacity, created) VALUES (?, ?, ?)",
+                    (os.path.basename(path), self.segment_bytes, time.time())
+                ).lastrowid
+            self.segment = (segment_id, fd, 0)
+
+    def seal(self, segment_id):
+        """Mark a segment full and give back its unused preallocated tail"""
+        with self.lock:
+            if self.segment is not None and self.segment[0] == segment_id:
+                _, fd, used = self.segment
+                os.ftruncate(fd, used)
+                os.close(fd)
+                self.segment = None
+            else:
+                path, used = self.db.execute("SELECT path, used FROM segments WHERE id = ?", (segment_id,)).fetchone()
+                os.truncate(os.path.join(self.directory, path), used)
+            with self.db:
+                self.db.execute("UPDATE segments SET sealed = 1, capacity = ? WHERE id = ?", (used, segment_id))
+
+    def recover(self):
+        """Seal segments left open by processes on this node that have exited"""
+        with self.lock:
+            for segment_id, path in self.db.execute("SELECT id, path FROM segments WHERE sealed = 0").fetchall():
+                node, pid = path.rsplit("-", 2)[:2]
+                if node != NODE_ID or int(pid) == os.getpid():
+                    continue
+                try:
+                    os.kill(int(pid), 0)
+                except ProcessLookupError:
+                    logger.info(f"Sealing archive segment {path} left by exited process {pid}")
+                    self.seal(segment_id)
+                except PermissionError:
+                    pass
+
+    def append(self, session_id, device_id, pcm, duration=None):
+        """Store one utterance; returns its id"""
+        with self.lock:
+            if len(pcm) > self.segment_bytes:
+                raise ValueError(f"Utterance of {len(pcm)} bytes is larger than a segment")
+            if self.segment is None or self.segment[2] + len(pcm) > self.segment_bytes:
+                self.new_segment()
+            segment_id, fd, used = self.segment
+
+            # Audio first, so the index never points at bytes not yet written
+            os.pwrite(fd, pcm, used)
+            self.segment = (segment_id, fd, used + len(pcm))
+            if duration is None:
+                duration = len(pcm) / (SAMPLE_RATE * CHANNELS * SAMPLE_WIDTH)
+            with self.db:
+                self.db.execute("UPDATE segments SET used = ? WHERE id = ?", (used + len(pcm), segment_id))
+                return self.db.execute(
+                    "INSERT INTO utterances (segment_id, offset, length, duration, session_id, device_id, created) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (segment_id, used, len(pcm), round(duration, 3), session_id, device_id, time.time())
+                ).lastrowid
+
+    def mapped(self, segment_id):
+        with self.lock:
+            segment_map = self.maps.get(segment_id)
+            if segment_map is None:
+                row = self.db.execute("SELECT path FROM segments WHERE id = ?", (segment_id,)).fetchone()
+                if row is None:
+                    raise KeyError(f"No archive segment {segment_id}")
+                with open(os.path.join(self.directory, row[0]), "rb") as f:
+                    segment_map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                self.maps[segment_id] = segment_map
+            return segment_map
+
+    def read(self, utterance_id):
+        """PCM of an utterance as a memoryview into the mapped segment, no copy"""
+        with self.lock:
+            row = self.db.execute("SELECT segment_id, offset, length FROM utterances WHERE id = ?",
+                                  (utterance_id,)).fetchone()
+            if row is None:
+                raise KeyError(f"No archived utterance {utterance_id}")
+            segment_id, offset, length = row
+            return memoryview(self.mapped(segment_id))[offset:offset + length]
+
+    def find(self, session_id=None, device_id=None, since=None, limit=100):
+        """Index rows, newest first, as dicts"""
+        with self.lock:
+            clauses, params = [], []
+            for column, value in (("session_id", session_id), ("device_id", device_id)):
+                if value is not None:
+                    clauses.append(f"{column} = ?")
+                    params.append(value)
+            if since is not None:
+                clauses.append("created >= ?")
+                params.append(since)
+            where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+            cursor = self.db.execute(
+                f"SELECT id, session_id, device_id, segment_id, offset, length, duration, created "
+                f"FROM utterances {where} ORDER BY created DESC LIMIT ?", (*params, limit)
+            )
+            columns = [c[0] for c in cursor.description]
+            return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+    def expire(self, days=ARCHIVE_RETENTION_DAYS):
+        """Drop index entries past retention; compact() frees their bytes"""
+        with self.lock:
+            with self.db:
+                return self.db.execute("DELETE FROM utterances WHERE created < ?",
+                                       (time.time() - days * 86400,)).rowcount
+
+    def compact(self, min_live_ratio=0.5):
+        """Rewrite sealed segments that are mostly dead into the current one.
+
+        Returns (segments removed, bytes freed).
+        """
+        with self.lock:
+            self.recover()
+            rows = self.db.execute(
+                "SELECT s.id, s.path, s.used, COALESCE(SUM(u.length), 0) FROM segments s "
+                "LEFT JOIN utterances u ON u.segment_id = s.id WHERE s.sealed = 1 GROUP BY s.id"
+            ).fetchall()
+            removed = freed = 0
+            for segment_id, path, used, live in rows:
+                if used and live / used >= min_live_ratio:
+                    continue
+                for utterance_id, offset, length in self.db.execute(
+                        "SELECT id, offset, length FROM utterances WHERE segment_id = ?", (segment_id,)).fetchall():
+                    self.move(utterance_id, bytes(self.mapped(segment_id)[offset:offset + length]))
+                # Views handed out earlier keep the old mapping alive until dropped
+                self.maps.pop(segment_id, None)
+                with self.db:
+                    self.db.execute("DELETE FROM segments WHERE id = ?", (segment_id,))
+                os.remove(os.path.join(self.directory, path))
+                removed += 1
+                freed += used - live
+            return removed, freed
+
+    def move(self, utterance_id, pcm):
+        """Re-append an utterance's audio and repoint its index entry"""
+        with self.lock:
+            if self.segment is None or self.segment[2] + len(pcm) > self.segment_bytes:
+                self.new_segment()
+            segment_id, fd, used = self.segment
+            os.pwrite(fd, pcm, used)
+            self.segment = (segment_id, fd, used + len(pcm))
+            with self.db:
+                self.db.execute("UPDATE segments SET used = ? WHERE id = ?", (used + len(pcm), segment_id))
+                self.db.execute("UPDATE utterances SET segment_id = ?, offset = ? WHERE id = ?",
+                                (segment_id, used, utterance_id))
+
+    def stats(self):
+        with self.lock:
+            segments, capacity, used = self.db.execute(
+                "SELECT COUNT(*), COALESCE(SUM(capacity), 0), COALESCE(SUM(used), 0) FROM segments").fetchone()
+            utterances, live, duration = self.db.execute(
+                "SELECT COUNT(*), COALESCE(SUM(length), 0), COALESCE(SUM(duration), 0) FROM utterances").fetchone()
+            return {"segments": segments, "allocated_bytes": capacity, "used_bytes": used,
+                    "live_bytes": live, "utterances": utterances, "audio_seconds": round(duration, 1)}
+
+_archive = None
+_archive_lock = threading.Lock()
+
+def get_archive():
+    """This process's archive, shared by its threads; a forked work-horse opens its own"""
+    global _archive
+    with _archive_lock:
+        if _archive is None or _archive.pid != os.getpid():
+            _archive = AudioArchive()
+        return _archive
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO,
+                       format='%(asctime)s [%(levelname)s] %(message)s')
+    parser = argparse.ArgumentParser(description='Inspect and maintain the utterance archive')
+    sub = parser.add_subparsers(dest='command', required=True)
+    sub.add_parser('stats')
+    find = sub.add_parser('find')
+    find.add_argument('--session')
+    find.add_argument('--device')
+    find.add_argument('--limit', type=int, default=20)
+    export = sub.add_parser('export', help='Write one utterance out as WAV')
+    export.add_argument('utterance_id', type=int)
+    export.add_argument('output')
+    expire = sub.add_parser('expire')
+    expire.add_argument('--days', type=float, default=ARCHIVE_RETENTION_DAYS)
+    compact = sub.add_parser('compact')
+    compact.add_argument('--min-live', type=float, default=0.5)
+    compact.add_argument('--expire', action='store_true', help='Drop audio past retention first')
+    args = parser.parse_args()
+
+    archive = AudioArchive()
+    if args.command == 'stats':
+        for name, value in archive.stats().items():
+            print(f"{name:>16}: {value}")
+    elif args.command == 'find':
+        for row in archive.find(args.session, args.device, limit=args.limit):
+            print(f"{row['id']:>8} {row['device_id']:<20} {row['session_id']:<40} "
+                  f"{row['duration']:>6.2f}s {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(row['created']))}")
+    elif args.command == 'export':
+        with wave.open(args.output, 'wb') as wav_file:
+            wav_file.setnchannels(CHANNELS)
+            wav_file.setsampwidth(SAMPLE_WIDTH)
+            wav_file.setframerate(SAMPLE_RATE)
+            wav_file.writeframes(archive.read(args.utterance_id))
+    elif args.command == 'expire':
+        logger.info(f"Expired {archive.expire(args.days)} utterances")
+    else:
+        if args.expire:
+            logger.info(f"Expired {archive.expire()} utterances")
+        removed, freed = archive.compact(args.min_live)
+        # Live audio moved here goes into a segment of its own
+        if archive.segment:
+            archive.seal(archive.segment[0])
+        logger.info(f"Compacted {removed} segments, freed {freed} bytes")
@@ -1,5 +1,6 @@
 # app/config.py
 import os
+import socket
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -8,9 +9,124 @@ load_dotenv()
 REDIS_HOST = os.getenv("REDIS_HOST", "localhost")
 REDIS_PORT = int(os.getenv("REDIS_PORT", 6379))
 REDIS_DB = int(os.getenv("REDIS_DB", 0))
+# Treat REDIS_HOST:REDIS_PORT as a startup node of a Redis Cluster
+REDIS_CLUSTER = os.getenv("REDIS_CLUSTER", "false").lower() in ("1", "true", "yes")
+# RQ needs multi-key transactions across its own keys, so queues live on a
+# standalone Redis; defaults to the data Redis when not clustered
+QUEUE_REDIS_HOST = os.getenv("QUEUE_REDIS_HOST", REDIS_HOST)
+QUEUE_REDIS_PORT = int(os.getenv("QUEUE_REDIS_PORT", REDIS_PORT))
 SAMPLE_RATE = 8000
 CHANNELS = 1
 SAMPLE_WIDTH = 2
+
+# Name of this server node in the connection directory
+NODE_ID = os.getenv("NODE_ID", socket.gethostname())
+
+# Session configuration
+SESSION_TTL = int(os.getenv("SESSION_TTL", 3600))
+# Seconds a dropped session keeps its buffer and state for a reconnect
+SESSION_RESUME_GRACE = int(os.getenv("SESSION_RESUME_GRACE", 30))
+# Seconds a draining server waits for in-flight jobs before exiting
+DRAIN_DEADLINE = float(os.getenv("DRAIN_DEADLINE", 20))
+# Sent as X-Admin-Token to call /admin/drain; unset, only loopback may call it
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+
+# Worker activation
+WORKER_ACTIVATION_CHANNEL = "workers:activate"
+# Pre-forked workers kept ready to take a new user queue
+WARM_POOL_SIZE = int(os.getenv("WARM_POOL_SIZE", 4))
+# "inprocess" runs jobs inside the long-lived worker, "fork" forks one work-horse per job
+WORKER_EXECUTION_MODE = os.getenv("WORKER_EXECUTION_MODE", "inprocess")
+# Worker supervision
+HEARTBEAT_INTERVAL = float(os.getenv("HEARTBEAT_INTERVAL", 5))
+# A job running longer than this marks its worker as stalled
+STALL_TIMEOUT = float(os.getenv("STALL_TIMEOUT", 120))
+RESTART_BACKOFF_MAX = float(os.getenv("RESTART_BACKOFF_MAX", 60))
+# Fallback scan for queues whose activation event was missed
+QUEUE_POLL_INTERVAL = float(os.getenv("QUEUE_POLL_INTERVAL", 30))
+# Job deadlines, seconds from enqueue, per job class
+INTERACTIVE_DEADLINE = float(os.getenv("INTERACTIVE_DEADLINE", 2))
+INGEST_DEADLINE = float(os.getenv("INGEST_DEADLINE", 5))
+BACKGROUND_DEADLINE = float(os.getenv("BACKGROUND_DEADLINE", 60))
+# Jobs a worker takes from one queue in a row before yielding to another
+FAIRNESS_BURST = int(os.getenv("FAIRNESS_BURST", 8))
+# Pipeline transport: "redis" hands jobs to RQ workers and scales across
+# nodes; "inprocess" runs them on a task pool inside each server process,
+# for single-node deployments
+PIPELINE_TRANSPORT = os.getenv("PIPELINE_TRANSPORT", "redis")
+INPROCESS_WORKERS = int(os.getenv("INPROCESS_WORKERS", 8))
+# Jobs of one class waiting in the in-process queue before new ones are refused
+INPROCESS_QUEUE_SIZE = int(os.getenv("INPROCESS_QUEUE_SIZE", 1000))
+
+# Admission control: new sessions are shed while any of these SLOs is at risk
+ADMISSION_MAX_QUEUE_DEPTH = int(os.getenv("ADMISSION_MAX_QUEUE_DEPTH", 500))
+ADMISSION_MAX_LOOP_LAG_MS = float(os.getenv("ADMISSION_MAX_LOOP_LAG_MS", 100))
+# p95 of interactive turn latency
+TURN_LATENCY_SLO_MS = float(os.getenv("TURN_LATENCY_SLO_MS", 1500))
+MAX_AI_CONCURRENCY = int(os.getenv("MAX_AI_CONCURRENCY", 32))
+# Seconds a new session may wait for load to clear before it is rejected
+ADMISSION_DEFER = float(os.getenv("ADMISSION_DEFER", 2))
+# Audio frames per second per connection, normally and while shedding
+FRAME_RATE_LIMIT = float(os.getenv("FRAME_RATE_LIMIT", 32))
+FRAME_RATE_LIMIT_SHED = float(os.getenv("FRAME_RATE_LIMIT_SHED", 16))
+FRAME_BURST = int(os.getenv("FRAME_BURST", 32))
+
+# Event loop lag tracing: stacks of stalls longer than this are captured
+LOOP_LAG_TRACE_MS = float(os.getenv("LOOP_LAG_TRACE_MS", 50))
+# Seconds between event loop lag probes
+LOOP_LAG_INTERVAL = float(os.getenv("LOOP_LAG_INTERVAL", 0.02))
+
+# Worker profiling, switched on per worker or queue at runtime
+PROFILE_SAMPLE_INTERVAL_MS = float(os.getenv("PROFILE_SAMPLE_INTERVAL_MS", 5))
+
+# Session recording for replay, off unless asked for
+RECORD_SESSIONS = os.getenv("RECORD_SESSIONS", "false").lower() in ("1", "true", "yes")
+RECORDING_DIR = os.getenv("RECORDING_DIR", "./recordings")
+# A new segment file is started once the current one reaches this size
+RECORDING_SEGMENT_MB = float(os.getenv("RECORDING_SEGMENT_MB", 64))
+
+# Archive of finished utterances on local disk, off unless asked for
+AUDIO_ARCHIVE = os.getenv("AUDIO_ARCHIVE", "false").lower() in ("1", "true", "yes")
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", "./archive")
+# Segment files are preallocated at this size and filled by one process each
+ARCHIVE_SEGMENT_MB = float(os.getenv("ARCHIVE_SEGMENT_MB", 256))
+ARCHIVE_RETENTION_DAYS = float(os.getenv("ARCHIVE_RETENTION_DAYS", 30))
+
+# Per-connection utterance memory on the standalone upload server: audio
+# past UTTERANCE_MEMORY_KB goes to a temp file, past UTTERANCE_MAX_MB the
+# connection is closed. UTTERANCE_SPILL_DIR defaults to the system temp dir.
+UTTERANCE_MEMORY_KB = float(os.getenv("UTTERANCE_MEMORY_KB", 512))
+UTTERANCE_MAX_MB = float(os.getenv("UTTERANCE_MAX_MB", 16))
+UTTERANCE_SPILL_DIR = os.getenv("UTTERANCE_SPILL_DIR") or None
+
+# DSP front end: batches inbound audio across sessions once per tick
+DSP_FRONTEND = os.getenv("DSP_FRONTEND", "true").lower() in ("1", "true", "yes")
+DSP_TICK = float(os.getenv("DSP_TICK", 0.05))
+DSP_MAX_SESSIONS = int(os.getenv("DSP_MAX_SESSIONS", 512))
+
+# Transcription: "openai", "local", "stub" (empty transcripts, for load
+# tests) or "off"
+TRANSCRIPTION_BACKEND = os.getenv("TRANSCRIPTION_BACKEND", "openai")
+STT_LOCAL_MODEL = os.getenv("STT_LOCAL_MODEL", "openai/whisper-tiny.en")
+# Dynamic batching: dispatch once a batch is full or its first request has
+# waited STT_MAX_WAIT_MS. Larger values raise throughput at the cost of latency.
+STT_MAX_BATCH = int(os.getenv("STT_MAX_BATCH", 16))
+STT_MAX_WAIT_MS = float(os.getenv("STT_MAX_WAIT_MS", 50))
+# Seconds a caller waits for its transcript
+STT_TIMEOUT = float(os.getenv("STT_TIMEOUT", 10))
+
+# Speculative generation: start the LLM once speech seems to have ended
+SPECULATION_ENABLED = os.getenv("SPECULATION_ENABLED", "true").lower() in ("1", "true", "yes")
+# Trailing silence that marks a probable end of turn
+SPECULATION_SILENCE_MS = float(os.getenv("SPECULATION_SILENCE_MS", 400))
+# Frame RMS above which audio counts as speech
+SPEECH_RMS_THRESHOLD = float(os.getenv("SPEECH_RMS_THRESHOLD", 500))
+# How close the final transcript must be to the speculative one to keep its response
+SPECULATION_MIN_SIMILARITY = float(os.getenv("SPECULATION_MIN_SIMILARITY", 0.9))
+
+# Syllabus configuration
+SYLLABUS_DIR = os.getenv("SYLLABUS_DIR", "./syllabus")
+
 # Firebase configuration
 FIREBASE_CREDENTIALS_PATH = os.getenv("FIREBASE_CREDENTIALS_PATH")
 
@@ -0,0 +1,140 @@
+# app/connection_directory.py
+import os
+import json
+import base64
+import logging
+from app.config import NODE_ID, SESSION_TTL
+from app.redis import keys
+from app.redis.redis_client import get_redis_client, get_redis_pubsub
+from app.redis.turns import STATS_KEY as TURN_STATS_KEY
+
+logger = logging.getLogger(__name__)
+
+# Remove a directory entry only if it still points at this process
+_UNREGISTER = """
+if redis.call('HGET', KEYS[1], 'session_id') == ARGV[1] and redis.call('HGET', KEYS[1], 'channel') == ARGV[2] then
+    redis.call('DEL', KEYS[1])
+end
+if redis.call('HGET', KEYS[2], 'channel') == ARGV[2] then
+    redis.call('DEL', KEYS[2])
+end
+return 1
+"""
+
+# Both keys carry the device's hash tag, so the unregister script stays in one slot
+device_key = keys.conn_device
+session_key = keys.conn_session
+
+def local_channel():
+    """PubSub channel this process listens on for routed messages"""
+    return f"conn:route:{NODE_ID}:{os.getpid()}"
+
+def register_connection(redis_conn, device_id, session_id):
+    """Record which node and process holds the socket for a device/session"""
+    entry = {
+        "device_id": device_id,
+        "session_id": session_id,
+        "node": NODE_ID,
+        "pid": os.getpid(),
+        "channel": local_channel()
+    }
+    pipe = redis_conn.pipeline()
+    pipe.hset(device_key(device_id), mapping=entry)
+    pipe.expire(device_key(device_id), SESSION_TTL)
+    pipe.hset(session_key(session_id), mapping=entry)
+    pipe.expire(session_key(session_id), SESSION_TTL)
+    pipe.execute()
+
+def unregister_connection(redis_conn, device_id, session_id):
+    """Drop the directory entries, unless another process took them over"""
+    unregister = redis_conn.register_script(_UNREGISTER)
+    unregister(keys=[device_key(device_id), session_key(session_id)],
+               args=[session_id, local_channel()])
+
+def lookup_session(redis_conn, session_id):
+    """Return the directory entry for a session, or None"""
+    entry = redis_conn.hgetall(session_key(session_id))
+    return {k.decode("utf-8"): v.decode("utf-8") for k, v in entry.items()} or None
+
+def lookup_device(redis_conn, device_id):
+    """Return the directory entry for a device, or None"""
+    entry = redis_conn.hgetall(device_key(device_id))
+    return {k.decode("utf-8"): v.decode("utf-8") for k, v in entry.items()} or None
+
+def encode_route(session_id, data, turn=None):
+    """Wrap a text or binary message for delivery over PubSub"""
+    if isinstance(data, (bytes, bytearray, memoryview)):
+        message = {"session_id": session_id, "bytes": base64.b64encode(bytes(data)).decode("ascii")}
+    else:
+        message = {"session_id": session_id, "text": data}
+    if turn is not None:
+        message["turn"] = turn
+    return json.dumps(message)
+
+def decode_route(raw):
+    """Unwrap a routed message into (session_id, text_or_bytes, turn)"""
+    message = json.loads(raw)
+    if "bytes" in message:
+        return message["session_id"], base64.b64decode(message["bytes"]), message.get("turn")
+    return message["session_id"], message["text"], message.get("turn")
+
+def send_to_session(redis_conn, session_id, data, turn=None):
+    """Deliver a message to a session's socket from any process or node.
+
+    Output belonging to a turn is dropped on arrival if that turn was
+    cancelled meanwhile. Returns False when the session has no live
+    connection.
+    """
+    channel = redis_conn.hget(session_key(session_id), "channel")
+    if not channel:
+        return False
+    return redis_conn.publish(channel, encode_route(session_id, data, turn)) > 0
+
+def send_to_device(redis_conn, device_id, data):
+    """Deliver a message to whichever session currently owns a device"""
+    session_id = redis_conn.hget(device_key(device_id), "session_id")
+    if not session_id:
+        return False
+    return send_to_session(redis_conn, session_id.decode("utf-8"), data)
+
+async def route_listener(connections, cancelled_turns=None):
+    """Forward messages routed to this process onto the local sockets.
+
+    cancelled_turns maps a session to its last cancelled turn; queued
+    output for that turn or an earlier one is discarded.
+    """
+    cancelled_turns = {} if cancelled_turns is None else cancelled_turns
+    redis = await get_redis_client()
+    pubsub = await get_redis_pubsub()
+    channel = local_channel()
+    await pubsub.subscribe(channel)
+    logger.info(f"Listening for routed messages on {channel}")
+
+    try:
+        async for message in pubsub.listen():
+            if message["type"] != "message":
+                continue
+            try:
+                session_id, data, turn = decode_route(message["data"])
+            except (ValueError, KeyError) as e:
+                logger.error(f"Dropping malformed routed message: {e}")
+                continue
+
+            if turn is not None and turn <= cancelled_turns.get(session_id, 0):
+                logger.info(f"Dropping output of cancelled turn {turn} for session {session_id}")
+                await redis.hincrby(TURN_STATS_KEY, "output_dropped", 1)
+                continue
+
+            websocket = connections.get(session_id)
+            if websocket is None:
+                logger.warning(f"Routed message for session {session_id} not held by this process")
+                continue
+            try:
+                if isinstance(data, bytes):
+                    await websocket.send_bytes(data)
+                else:
+                    await websocket.send_text(data)
+            except Exception as e:
+                logger.error(f"Error delivering routed message to {session_id}: {e}")
+    finally:
+        await pubsub.unsubscribe(channel)
@@ -0,0 +1,136 @@
+# app/intent_router.py
+import os
+import re
+import json
+import logging
+from collections import namedtuple, deque
+from app.config import SYLLABUS_DIR
+from app.syllabus_manger import get_syllabus
+
+logger = logging.getLogger(__name__)
+
+# Result of classifying a transcript. response is None for turns the LLM must answer.
+Route = namedtuple("Route", ["intent", "topic", "response", "matched"])
+
+# Lower number wins when several patterns match
+PRIORITY_UNSAFE = 0
+PRIORITY_LESSON = 1
+PRIORITY_INTENT = 2
+
+OPEN_ROUTE = Route("open", None, None, None)
+
+_WORD_RE = re.compile(r"\w+")
+
+def normalize(text):
+    """Lowercase and collapse to space-separated words, padded for whole-word matching"""
+    return " " + " ".join(_WORD_RE.findall(text.lower())) + " "
+
+class PatternMatcher:
+    """Aho-Corasick automaton over whole-word patterns"""
+
+    __slots__ = ("_goto", "_fail", "_out")
+
+    def __init__(self, patterns):
+        # patterns: iterable of (pattern, payload)
+        self._goto = [{}]
+        self._out = [()]
+
+        for pattern, payload in patterns:
+            key = normalize(pattern)
+            if key.strip() == "":
+                continue
+            state = 0
+            for ch in key:
+                nxt = self._goto[state].get(ch)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto[state][ch] = nxt
+                    self._goto.append({})
+                    self._out.append(())
+                state = nxt
+            self._out[state] = self._out[state] + ((pattern, payload),)
+
+        # Breadth-first pass to build failure links and merge outputs
+        self._fail = [0] * len(self._goto)
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in self._goto[state].items():
+                queue.append(nxt)
+                fallback = self._fail[state]
+                while fallback and ch not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                link = self._goto[fallback].get(ch, 0)
+                self._fail[nxt] = link if link != nxt else 0
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+
+    def find_all(self, text):
+        """Return (pattern, payload) for every pattern found in text"""
+        goto, fail, out = self._goto, self._fail, self._out
+        state = 0
+        found = []
+        for ch in normalize(text):
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            if out[state]:
+                found.extend(out[state])
+        return found
+
+class IntentRouter:
+    """Classifies transcripts locally so only open-ended turns reach the LLM"""
+
+    def __init__(self, syllabus, safety_rules):
+        self.version = syllabus.version
+        self.refusal = safety_rules.get("refusal", "Let's stick to learning fun things!")
+
+        patterns = []
+        for category, words in safety_rules.get("categories", {}).items():
+            for word in words:
+                patterns.append((word, (PRIORITY_UNSAFE, "unsafe", category)))
+        for topic, keywords in syllabus.topic_keywords.items():
+            for keyword in keywords:
+                patterns.append((keyword, (PRIORITY_LESSON, "lesson", topic)))
+        self.responses = {}
+        for name, (intent_patterns, response) in syllabus.intents.items():
+            self.responses[name] = response
+            for pattern in intent_patterns:
+                patterns.append((pattern, (PRIORITY_INTENT, name, None)))
+
+        self.matcher = PatternMatcher(patterns)
+
+    def classify(self, transcription):
+        """Route a transcript to a deterministic intent, a refusal or the LLM"""
+        matches = self.matcher.find_all(transcription)
+        if not matches:
+            return OPEN_ROUTE
+
+        pattern, (_, intent, detail) = min(matches, key=lambda match: match[1][0])
+        if intent == "unsafe":
+            return Route(intent, detail, self.refusal, pattern)
+        if intent == "lesson":
+            # The workflow engine builds the lesson response itself
+            return Route(intent, detail, None, pattern)
+        return Route(intent, None, self.responses[intent], pattern)
+
+def load_safety_rules(syllabus_dir=SYLLABUS_DIR):
+    """Read the safety rule file, returning empty rules if it is missing"""
+    path = os.path.join(syllabus_dir, "safety.json")
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        logger.warning(f"Safety rules not found at {path}")
+        return {}
+
+# Per-process router, rebuilt when the syllabus version changes
+_router = None
+
+async def get_intent_router():
+    """Get the compiled router for the current syllabus"""
+    global _router
+    syllabus = await get_syllabus()
+    if _router is None or _router.version != syllabus.version:
+        _router = IntentRouter(syllabus, load_safety_rules())
+        logger.info(f"Compiled intent router for syllabus {syllabus.version}")
+    return _router
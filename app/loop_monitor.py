@@ -0,0 +1,108 @@
+# app/loop_monitor.py
+import os
+import sys
+import time
+import asyncio
+import logging
+import threading
+import traceback
+from app.config import LOOP_LAG_TRACE_MS, LOOP_LAG_INTERVAL
+
+logger = logging.getLogger(__name__)
+
+# Stalls are charged to the innermost frame of code under this directory
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Distinct call sites kept; later ones are lumped together
+MAX_SITES = 100
+# Frames kept from each captured stack
+STACK_DEPTH = 12
+
+def own_frame(filename):
+    return filename.startswith(ROOT) and "site-packages" not in filename and filename != __file__
+
+def describe(frame):
+    return f"{os.path.relpath(frame.filename, ROOT)}:{frame.lineno} in {frame.name}"
+
+class LoopLagMonitor:
+    """Measures event loop lag and finds the calls that block the loop.
+
+    A task on the loop stamps a heartbeat every interval. A watchdog
+    thread samples the loop thread's stack once the heartbeat is late by
+    more than threshold_ms, and when the loop gets going again the whole
+    stall is charged to the innermost frame of our own code on that stack.
+    """
+
+    def __init__(self, threshold_ms=LOOP_LAG_TRACE_MS, interval=LOOP_LAG_INTERVAL):
+        self.threshold = threshold_ms / 1000
+        self.interval = interval
+        self.beat = time.monotonic()
+        self.loop_thread = None
+        # (beat, stack) of the stall the watchdog caught
+        self.captured = None
+        self.lag_ms = 0.0
+        self.max_lag_ms = 0.0
+        self.stalls = 0
+        self.sites = {}
+
+    async def run(self):
+        """Probe the loop forever; start as a task on the loop to watch"""
+        self.loop_thread = threading.get_ident()
+        threading.Thread(target=self.watch, name="loop-lag-watchdog", daemon=True).start()
+        while True:
+            self.beat = time.monotonic()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, time.monotonic() - self.beat - self.interval)
+            self.lag_ms = lag * 1000
+            self.max_lag_ms = max(self.max_lag_ms, self.lag_ms)
+            if lag >= self.threshold:
+                captured = self.captured
+                self.stall(captured[1] if captured and captured[0] == self.beat else None, self.lag_ms)
+
+    def watch(self):
+        """Watchdog thread: grab the loop's stack while it is blocked"""
+        while True:
+            time.sleep(self.interval)
+            beat = self.beat
+            if time.monotonic() - beat - self.interval < self.threshold:
+                continue
+            if self.captured and self.captured[0] == beat:
+                continue
+            frame = sys._current_frames().get(self.loop_thread)
+            if frame is not None:
+                self.captured = (beat, traceback.extract_stack(frame))
+
+    def stall(self, stack, lag_ms):
+        """Charge a stall to its call site and log it"""
+        self.stalls += 1
+        if stack:
+            site = next((describe(frame) for frame in reversed(stack) if own_frame(frame.filename)),
+                        describe(stack[-1]))
+            blocked_in = describe(stack[-1])
+        else:
+            # Over before the watchdog looked
+            site, blocked_in = "untraced", None
+        if site not in self.sites and len(self.sites) >= MAX_SITES:
+            site = "other"
+
+        entry = self.sites.setdefault(site, {"count": 0, "total_ms": 0.0, "max_ms": 0.0})
+        entry["count"] += 1
+        entry["total_ms"] += lag_ms
+        entry["max_ms"] = max(entry["max_ms"], lag_ms)
+        if stack:
+            entry["blocked_in"] = blocked_in
+            entry["stack"] = [describe(frame) for frame in stack[-STACK_DEPTH:]]
+            logger.warning(f"Event loop blocked for {lag_ms:.0f} ms at {site}, in {blocked_in}\n"
+                           + "".join(traceback.format_list(stack[-STACK_DEPTH:])))
+        else:
+            logger.warning(f"Event loop blocked for {lag_ms:.0f} ms (no stack captured)")
+
+    def snapshot(self):
+        """Lag figures and blocking call sites, worst first"""
+        sites = sorted(self.sites.items(), key=lambda item: item[1]["total_ms"], reverse=True)
+        return {
+            "threshold_ms": self.threshold * 1000,
+            "lag_ms": round(self.lag_ms, 2),
+            "max_lag_ms": round(self.max_lag_ms, 2),
+            "stalls": self.stalls,
+            "sites": [{"site": site, **entry} for site, entry in sites]
+        }
@@ -6,14 +6,27 @@ from io import BytesIO
 from pydub import AudioSegment
 import asyncio
 import logging
+import hmac
 import json
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect, BackgroundTasks
+import signal
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, BackgroundTasks, Request
 from fastapi.middleware.cors import CORSMiddleware
-from app.redis.redis_client import get_redis_client, get_redis_pubsub
+from fastapi.responses import JSONResponse
+from app.redis.redis_client import get_redis_client, get_redis_pubsub, create_redis, create_queue_redis
 # from app.firebase_service import get_user_from_firestore
 from app.redis.worker import start_audio_worker
 from app.config import FIREBASE_CREDENTIALS_PATH, SAMPLE_RATE, CHANNELS, SAMPLE_WIDTH
-from redis import Redis
+from app.session_manager import (create_session, resume_session, mark_detached,
+                                 claim_expired_sessions, drop_resume_token)
+from app.redis import session_store, keys, job_scheduler, turns, dsp_frontend
+from app.redis.job_scheduler import INTERACTIVE, INGEST
+from app.connection_directory import register_connection, unregister_connection, route_listener
+from app.admission import AdmissionController, FrameBucket, STATS_KEY as ADMISSION_STATS_KEY
+from app.loop_monitor import LoopLagMonitor
+from app.session_recorder import SessionRecorder
+from app.pipeline_transport import create_transport, TransportFull
+from app.config import (NODE_ID, DRAIN_DEADLINE, ADMIN_TOKEN, WORKER_ACTIVATION_CHANNEL, DSP_FRONTEND,
+                        DSP_TICK, RECORD_SESSIONS)
 from rq import Queue
 
 logging.basicConfig(level=logging.INFO)
@@ -23,11 +36,15 @@ SAMPLE_RATE = 8000
 CHANNELS = 1
 SAMPLE_WIDTH = 2
 
-redis_conn = Redis(host='localhost', port=6379, db=0)
+# Session data, cluster-aware; queues stay on a standalone Redis
+redis_conn = create_redis()
+queue_conn = create_queue_redis()
 app = FastAPI(title="Language Tutor WebSocket Server")
-audio_queue = Queue('audio', connection=redis_conn)
+audio_queue = Queue('audio', connection=queue_conn)
 stream_queues = {}
-session_queue = Queue('session_management', connection=redis_conn)
+# Runs pipeline jobs in this process when PIPELINE_TRANSPORT=inprocess,
+# otherwise None and jobs go to the RQ workers
+transport = create_transport(queue_conn)
 
 app.add_middleware(
     CORSMiddleware,
@@ -38,6 +55,22 @@ app.add_middleware(
 )
 
 active_connections = {}
+# session_id -> user queue name, for waiting on in-flight jobs
+session_queues = {}
+# session_id -> last cancelled turn, so its queued output is dropped
+cancelled_turns = {}
+
+# Sheds new sessions and throttles audio while SLOs are at risk
+admission = AdmissionController(redis_conn, queue_conn)
+
+# Finds the calls that block the event loop
+loop_monitor = LoopLagMonitor()
+
+# Records inbound traffic for replay when enabled
+recorder = SessionRecorder() if RECORD_SESSIONS else None
+
+# Set while the process hands its sessions off before a deploy
+draining = False
 
 def pcm_to_wav(pcm_bytes: bytes) -> bytes:
     """Convert PCM data to WAV format."""
@@ -58,9 +91,55 @@ def mp3_to_wav(mp3_data: bytes) -> bytes:
     audio.export(wav_buffer, format="wav")
     return wav_buffer.getvalue()
 
+async def drain_connections(deadline=DRAIN_DEADLINE):
+    """Stop taking sockets, hand sessions off and wait for their in-flight jobs"""
+    global draining
+    if draining:
+        return
+    draining = True
+    end = time.monotonic() + deadline
+    logger.info(f"Draining {len(active_connections)} connections (deadline {deadline}s)")
+    
+    # Ask every device to reconnect elsewhere. Buffers and job state stay in
+    # Redis and the resume grace period keeps the session alive meanwhile.
+    queues = set(session_queues.values())
+    for session_id, websocket in list(active_connections.items()):
+        try:
+            await websocket.send_text(json.dumps({
+                "type": "reconnect",
+                "message": "Server is restarting, please reconnect"
+            }))
+            await websocket.close(code=1012)
+        except Exception as e:
+            logger.error(f"Error closing {session_id} during drain: {e}")
+    
+    # Wait for jobs already enqueued for these sessions
+    while time.monotonic() < end:
+        if transport:
+            pending = transport.pending(queues)
+        else:
+            pending = await asyncio.to_thread(count_pending_jobs, queues)
+        if pending == 0:
+            logger.info("Drain complete, no in-flight jobs left")
+            return
+        logger.info(f"Draining: {pending} jobs still in flight")
+        await asyncio.sleep(0.5)
+    logger.warning("Drain deadline reached with jobs still in flight")
+
+def count_pending_jobs(queue_names):
+    """Queued plus running jobs across the given queues"""
+    pending = 0
+    for name in queue_names:
+        queue = Queue(name, connection=queue_conn)
+        pending += queue.count + queue.started_job_registry.count
+    return pending
+
 @app.on_event("shutdown")
 async def shutdown_event():
     """Clean up resources on shutdown"""
+    # Hand off sessions and let in-flight work finish first
+    await drain_connections()
+    
     # Close Redis connection
     redis = await get_redis_client()
     
@@ -78,67 +157,249 @@ async def shutdown_event():
 @app.get("/health")
 async def health_check():
     """Simple health check endpoint"""
-    return {"status": "ok"}
+    status = {"status": "draining" if draining else "ok", "node": NODE_ID,
+              "pid": os.getpid(), "connections": len(active_connections)}
+    # Let load balancers take a draining node out of rotation
+    return JSONResponse(status, status_code=503 if draining else 200)
+
+def admin_allowed(request: Request):
+    """The ADMIN_TOKEN header when one is configured, otherwise a loopback caller"""
+    if ADMIN_TOKEN:
+        return hmac.compare_digest(request.headers.get("x-admin-token", ""), ADMIN_TOKEN)
+    return request.client is not None and request.client.host in ("127.0.0.1", "::1")
+
+@app.post("/admin/drain")
+async def drain_endpoint(request: Request, deadline: float = DRAIN_DEADLINE, exit: bool = False):
+    """Drain this process ahead of a deploy, then optionally stop it"""
+    if not admin_allowed(request):
+        return JSONResponse({"status": "forbidden"}, status_code=403)
+    await drain_connections(deadline)
+    if exit:
+        # Uvicorn turns SIGTERM into a normal shutdown
+        asyncio.get_running_loop().call_later(0.1, os.kill, os.getpid(), signal.SIGTERM)
+    return {"status": "drained", "node": NODE_ID, "pid": os.getpid()}
+
+@app.get("/admin/admission")
+async def admission_status():
+    """Live load signals, the shedding decision and decision counts"""
+    stats = await asyncio.to_thread(redis_conn.hgetall, ADMISSION_STATS_KEY)
+    status = admission.snapshot()
+    status["decisions"] = {k.decode('utf-8'): int(v) for k, v in stats.items()}
+    return status
+
+def start_turn(session_id, device_id):
+    """Enqueue the answer to the utterance just ended as a new turn"""
+    turn = turns.begin_turn(redis_conn, session_id)
+    job = job_scheduler.enqueue(
+        queue_conn, INTERACTIVE,
+        'app.redis.audio_processor.answer_turn',
+        kwargs={"session_id": session_id, "device_id": device_id, "turn": turn}
+    )
+    turns.track_job(redis_conn, session_id, job.id)
+    return turn
+
+async def cancel_turn(session_id, reason):
+    """Abort the session's turn in flight and drop its pending output"""
+    try:
+        turn = await asyncio.to_thread(turns.cancel_turn, redis_conn, queue_conn, session_id, reason)
+    except Exception as e:
+        logger.error(f"Error cancelling turn for {session_id}: {e}")
+        return None
+    if turn:
+        cancelled_turns[session_id] = turn
+    return turn
+
+@app.get("/admin/loop_lag")
+async def loop_lag_status():
+    """Event loop lag and the call sites that blocked the loop, worst first"""
+    return {"node": NODE_ID, "pid": os.getpid(), **loop_monitor.snapshot()}
+
+async def dsp_ticker():
+    """The DSP front end's tick over this process's sessions, when the pipeline runs in process"""
+    while True:
+        start = time.perf_counter()
+        try:
+            refused = []
+            if active_connections:
+                await asyncio.to_thread(dsp_frontend.tick_sessions, redis_conn, queue_conn,
+                                        list(active_connections), refused)
+            for session_id in refused:
+                websocket = active_connections.get(session_id)
+                if websocket is not None:
+                    await websocket.send_text(json.dumps({
+                        "type": "slow_down",
+                        "message": "Server is busy, send audio more slowly"
+                    }))
+        except Exception as e:
+            logger.error(f"DSP tick failed: {e}")
+        await asyncio.sleep(max(0.0, DSP_TICK - (time.perf_counter() - start)))
+
+async def expiry_sweeper():
+    """End sessions whose resume grace period ran out, on behalf of any node"""
+    while True:
+        try:
+            for session_id, device_id in await asyncio.to_thread(claim_expired_sessions, redis_conn):
+                logger.info(f"Resume grace expired for session {session_id}")
+                await asyncio.to_thread(
+                    job_scheduler.enqueue, queue_conn, INTERACTIVE,
+                    'app.redis.audio_processor.end_stream_processing',
+                    kwargs={"session_id": session_id, "device_id": device_id, "reason": "disconnect"}
+                )
+        except Exception as e:
+            logger.error(f"Error signaling stream end on disconnect: {e}")
+        await asyncio.sleep(1)
 
 @app.websocket("/ws/{device_id}")
-async def websocket_endpoint(websocket: WebSocket, device_id: str):
+async def websocket_endpoint(websocket: WebSocket, device_id: str, resume: str = None,
+                             rate: int = SAMPLE_RATE):
     await websocket.accept()
     
-    # Generate a unique session ID
-    session_id = f"session:{device_id}:{int(time.time())}"
-    session_id = session_id.replace(":", "_")
-    logger.info(f"New WebSocket connection: device_id={device_id}, session_id={session_id}")
+    # The DSP front end resamples by whole multiples of the server rate;
+    # without it the audio must already be at that rate
+    if rate != SAMPLE_RATE and not (DSP_FRONTEND and dsp_frontend.supports_rate(rate)):
+        await websocket.send_text(json.dumps({
+            "type": "error",
+            "message": f"Unsupported sample rate {rate}, send {SAMPLE_RATE} Hz"
+                       + (f" or a multiple of it up to {dsp_frontend.MAX_INPUT_RATE} Hz" if DSP_FRONTEND else "")
+        }))
+        await websocket.close(code=1003)
+        return
+    
+    if draining:
+        # Send the device to another node, its session can resume there
+        await websocket.send_text(json.dumps({
+            "type": "reconnect",
+            "message": "Server is restarting, please reconnect"
+        }))
+        await websocket.close(code=1013)
+        return
     
     # Create a dedicated queue for this user's audio
     user_queue_name = f"user_{device_id}"
-    redis_conn = Redis(host='localhost', port=6379, db=0)
-    user_queue = Queue(user_queue_name, connection=redis_conn)
-    
-    # Store session info in Redis
-    redis_conn.set(f"session:info:{session_id}", 
-                  json.dumps({
-                      "device_id": device_id, 
-                      "queue": user_queue_name,
-                      "start_time": time.time()
-                  }),
-                  ex=3600)
-    
-    # Start a session processor for this user
-    main_queue = Queue('session_management', connection=redis_conn)
-    main_queue.enqueue(
-        'app.audio_processor.start_user_session_processor',
-        device_id=device_id,
-        session_id=session_id,
-        queue_name=user_queue_name,
-        job_id=f"processor_{device_id}_{session_id}"
-    )
     
-    # Track this connection
+    # Reattach to a dropped session if the device sent its resume token
+    session_id = resume_session(redis_conn, device_id, resume) if resume else None
+    resume_token = resume if session_id else None
+    
+    if not session_id:
+        # Shed new sessions while overloaded; ones in progress keep going
+        shed_reason = await admission.admit(device_id)
+        if shed_reason:
+            await websocket.send_text(json.dumps({
+                "type": "retry",
+                "reason": shed_reason,
+                "retry_after": 5,
+                "message": "Server is busy, please try again shortly"
+            }))
+            await websocket.close(code=1013)
+            return
+    
+    if session_id:
+        # Take over from a stale socket still attached to this session
+        stale = active_connections.get(session_id)
+        active_connections[session_id] = websocket
+        if stale is not None and stale is not websocket:
+            try:
+                await stale.close(code=1000, reason="Session resumed elsewhere")
+            except Exception:
+                pass
+        logger.info(f"Resumed WebSocket connection: device_id={device_id}, session_id={session_id}")
+    else:
+        session_id, resume_token = create_session(redis_conn, device_id, user_queue_name, rate)
+        logger.info(f"New WebSocket connection: device_id={device_id}, session_id={session_id}")
+        
+        # Start a session processor for this user
+        job_scheduler.enqueue(
+            queue_conn, INGEST,
+            'app.redis.audio_processor.start_user_session_processor',
+            kwargs={"device_id": device_id, "session_id": session_id, "queue_name": user_queue_name},
+            job_id=f"processor_{keys.untagged(session_id)}"
+        )
+    
+    # Wake a worker for the device's queue now instead of on the next poll
+    if transport is None:
+        queue_conn.publish(WORKER_ACTIVATION_CHANNEL, user_queue_name)
+    
+    # Frame rate limit for this connection, kept by this handler
+    frame_bucket = FrameBucket()
+    
+    # Track this connection, locally and in the shared directory
     active_connections[session_id] = websocket
+    session_queues[session_id] = user_queue_name
+    register_connection(redis_conn, device_id, session_id)
+    
+    # Tell the device how to resume after a drop
+    await websocket.send_text(json.dumps({
+        "type": "session",
+        "session_id": session_id,
+        "resume_token": resume_token,
+        "resumed": resume_token == resume
+    }))
+    
+    # Set from end_stream until the child speaks again; speech meanwhile
+    # is a barge-in that cancels the answer being prepared
+    turn_open = False
+    
+    recording_id = f"{session_id}/{id(websocket):x}"
+    if recorder:
+        recorder.open(recording_id, device_id, rate, resumed=resume_token == resume)
+    close_reason = "disconnect"
     
     try:
         while True:
             data = await websocket.receive()
             
-            if "bytes" in data:
+            if data.get("type") == "websocket.disconnect":
+                raise WebSocketDisconnect(data.get("code", 1000))
+            
+            if data.get("bytes") is not None:
                 # Handle binary audio data
                 audio_bytes = data["bytes"]
+                if recorder:
+                    recorder.audio(recording_id, audio_bytes)
                 
-                # Store in Redis with a timestamp key
-                timestamp = time.time()
-                audio_key = f"audio:{session_id}:{timestamp}"
-                redis_conn.set(audio_key, audio_bytes, ex=300)
+                # Drop frames from devices sending faster than their bucket allows
+                if not admission.allow_frame(frame_bucket):
+                    await websocket.send_text(json.dumps({
+                        "type": "slow_down",
+                        "message": "Audio frame dropped, sending too fast"
+                    }))
+                    continue
                 
-                # Add this chunk to the user's dedicated queue
-                job = user_queue.enqueue(
-                    'app.audio_processor.process_user_audio_chunk',
-                    session_id=session_id,
-                    audio_key=audio_key,
-                    timestamp=timestamp
-                )
+                if turn_open:
+                    turn_open = False
+                    turn = await cancel_turn(session_id, "speech")
+                    if turn:
+                        await websocket.send_text(json.dumps({"type": "barge_in", "turn": turn}))
                 
-                # Save the last job ID for dependencies if needed
-                redis_conn.set(f"last_job:{session_id}", job.id, ex=300)
+                if DSP_FRONTEND:
+                    # The DSP front end batches this with other sessions' audio
+                    # and enqueues the chunk job once it is processed
+                    session_store.append_raw(redis_conn, session_id, audio_bytes)
+                else:
+                    # Append to the session's capped stream
+                    timestamp = time.time()
+                    entry_id = session_store.append_audio(redis_conn, session_id, audio_bytes)
+                    
+                    # Add this chunk to the user's dedicated queue
+                    try:
+                        job = job_scheduler.enqueue(
+                            queue_conn, INGEST,
+                            'app.redis.audio_processor.process_user_audio_chunk',
+                            kwargs={"session_id": session_id, "entry_id": entry_id,
+                                    "chunk_size": len(audio_bytes), "timestamp": timestamp},
+                            queue=user_queue_name
+                        )
+                    except TransportFull:
+                        # The frame stays in the stream and is read with the next buffer
+                        await websocket.send_text(json.dumps({
+                            "type": "slow_down",
+                            "message": "Server is busy, send audio more slowly"
+                        }))
+                        continue
+                    
+                    # Save the last job ID for dependencies if needed
+                    redis_conn.hset(session_store.session_key(session_id), session_store.F_LAST_JOB, job.id)
                 
                 # Send acknowledgment
                 await websocket.send_text(json.dumps({
@@ -146,7 +407,9 @@ async def websocket_endpoint(websocket: WebSocket, device_id: str):
                     "message": f"Received {len(audio_bytes)} bytes"
                 }))
                 
-            elif "text" in data:
+            elif data.get("text") is not None:
+                if recorder:
+                    recorder.text(recording_id, data["text"])
                 try:
                     message = json.loads(data["text"])
                     logger.info(f"Received message: {message}")
@@ -155,17 +418,31 @@ async def websocket_endpoint(websocket: WebSocket, device_id: str):
                     
                     if command_type == "end_stream":
                         # Signal end of audio stream
-                        await asyncio.to_thread(
-                            session_queue.enqueue,
-                            'app.audio_processor.end_stream_processing',
-                            session_id=session_id,
-                            device_id=device_id
-                        )
+                        # A newer turn supersedes one still being answered
+                        if turn_open:
+                            await cancel_turn(session_id, "new_turn")
+                        # The child is waiting on this turn's answer
+                        await asyncio.to_thread(start_turn, session_id, device_id)
+                        turn_open = True
                         
                         await websocket.send_text(json.dumps({
                             "type": "info",
                             "message": "Stream end acknowledged"
                         }))
+                    
+                    elif command_type == "end_session":
+                        # Deliberate hang-up, skip the resume grace period
+                        drop_resume_token(redis_conn, device_id, resume_token)
+                        resume_token = None
+                        await asyncio.to_thread(
+                            job_scheduler.enqueue, queue_conn, INTERACTIVE,
+                            'app.redis.audio_processor.end_stream_processing',
+                            kwargs={"session_id": session_id, "device_id": device_id,
+                                    "reason": "client_end_session"}
+                        )
+                        close_reason = "end_session"
+                        await websocket.close(code=1000)
+                        break
                         
                 except json.JSONDecodeError:
                     logger.error("Invalid JSON received")
@@ -176,29 +453,58 @@ async def websocket_endpoint(websocket: WebSocket, device_id: str):
     
     except WebSocketDisconnect:
         logger.info(f"ESP device disconnected: {device_id}, session: {session_id}")
-        # Clean up
-        if session_id in active_connections:
-            del active_connections[session_id]
         
-        # Signal stream end when client disconnects
-        try:
-            await asyncio.to_thread(
-                session_queue.enqueue,
-                'app.audio_processor.end_stream_processing',
-                session_id=session_id,
-                device_id=device_id,
-                reason="disconnect"
-            )
-        except Exception as e:
-            logger.error(f"Error signaling stream end on disconnect: {e}")
+        # Nobody is left to hear the answer being prepared
+        if turn_open:
+            await cancel_turn(session_id, "disconnect")
+        
+        # Keep the session around for a reconnect within the grace period
+        if resume_token and active_connections.get(session_id) is websocket:
+            mark_detached(redis_conn, session_id, device_id)
             
     except Exception as e:
         logger.error(f"WebSocket error: {e}")
-        # Clean up
-        if session_id in active_connections:
+        close_reason = "error"
+    
+    finally:
+        if recorder:
+            recorder.close(recording_id, close_reason)
+        
+        # Clean up, unless a resumed socket already replaced this one
+        if active_connections.get(session_id) is websocket:
             del active_connections[session_id]
+            if not draining:
+                session_queues.pop(session_id, None)
+            cancelled_turns.pop(session_id, None)
+            try:
+                await asyncio.to_thread(unregister_connection, redis_conn, device_id, session_id)
+            except Exception as e:
+                logger.error(f"Error removing directory entry for {session_id}: {e}")
 
 @app.on_event("startup")
 async def start_workers():
     """Start the audio worker processes"""
-    asyncio.create_task(start_audio_worker())
\ No newline at end of file
+    asyncio.create_task(start_audio_worker())
+    
+    if transport:
+        # Pipeline jobs run on this process's task pool instead of RQ workers,
+        # including the DSP front end's
+        transport.start()
+        job_scheduler.use_local_transport(transport)
+        if DSP_FRONTEND:
+            asyncio.create_task(dsp_ticker())
+    
+    # Deliver messages other processes route to sockets held here
+    asyncio.create_task(route_listener(active_connections, cancelled_turns))
+    
+    # End sessions that were not resumed in time
+    asyncio.create_task(expiry_sweeper())
+    
+    # Watch load signals for admission control
+    asyncio.create_task(admission.monitor())
+    
+    # Trace calls that block the event loop
+    asyncio.create_task(loop_monitor.run())
+    
+    if recorder:
+        recorder.start()
@@ -0,0 +1,197 @@
+# app/pipeline_transport.py
+import time
+import heapq
+import asyncio
+import logging
+import importlib
+import itertools
+import threading
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from app.config import PIPELINE_TRANSPORT, INPROCESS_WORKERS, INPROCESS_QUEUE_SIZE
+from app.redis import job_scheduler
+
+logger = logging.getLogger(__name__)
+
+# With the "redis" transport every job goes through RQ: the job hash is
+# written, a worker process polls for it, and its status, registries and
+# results go back to Redis. The "inprocess" transport keeps
+# the jobs in the server process and runs the same processor functions on
+# a pool of tasks, so none of that queue traffic happens. Session data
+# stays in Redis either way.
+TRANSPORTS = ("redis", "inprocess")
+
+class TransportFull(Exception):
+    """A job class's in-process queue is at INPROCESS_QUEUE_SIZE"""
+
+_functions = {}
+
+def resolve(func):
+    """Callable for a dotted path, the way RQ names job functions"""
+    if callable(func):
+        return func
+    target = _functions.get(func)
+    if target is None:
+        module, name = func.rsplit(".", 1)
+        target = _functions[func] = getattr(importlib.import_module(module), name)
+    return target
+
+class InProcessJob:
+    """Just enough of an RQ job for the call sites and completion stats"""
+
+    def __init__(self, job_id, job_class, func, kwargs, queue, enqueued, deadline):
+        self.id = job_id
+        self.job_class = job_class
+        self.func = func
+        self.kwargs = kwargs or {}
+        self.queue = queue
+        self.meta = {"job_class": job_class, "enqueued": enqueued, "deadline": deadline}
+        self.status = "queued"
+        self.started = None
+        self.ended = None
+        # Resolved with the job's return value once it has run
+        self.future = Future()
+
+class InProcessTransport:
+    """Runs pipeline jobs on a pool of worker tasks in this process.
+
+    Ready jobs are served earliest deadline first. Jobs for a per-device
+    queue form a lane that runs one job at a time, in order, like the RQ
+    queue it replaces. Each job class holds at most queue_size waiting
+    jobs; past that submit raises TransportFull.
+    """
+
+    def __init__(self, queue_conn, workers=INPROCESS_WORKERS, queue_size=INPROCESS_QUEUE_SIZE):
+        self.queue_conn = queue_conn
+        self.workers = workers
+        self.queue_size = queue_size
+        # Processor functions block on Redis and transcription, so they run
+        # on threads of their own rather than the loop's default executor
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="pipeline")
+        # submit is called from the loop and from to_thread helpers alike
+        self.lock = threading.Lock()
+        self.ready = []
+        self.sequence = itertools.count()
+        # Lanes with a job queued or running -> jobs waiting behind it
+        self.lanes = {}
+        # Jobs queued or running, by id
+        self.jobs = {}
+        self.waiting = {job_class: 0 for job_class in job_scheduler.JOB_CLASSES}
+        self.loop = None
+        self.available = None
+
+    def submit(self, job_class, func, kwargs, queue, job_id, enqueued, deadline):
+        job = InProcessJob(job_id, job_class, func, kwargs, queue, enqueued, deadline)
+        # Only per-device queues keep order; shared class queues run in parallel
+        lane = queue if queue != job_scheduler.JOB_CLASSES[job_class][0] else None
+        with self.lock:
+            if self.waiting[job_class] >= self.queue_size:
+                raise TransportFull(f"{self.waiting[job_class]} {job_class} jobs already waiting")
+            self.waiting[job_class] += 1
+            self.jobs[job_id] = job
+            if lane is None or lane not in self.lanes:
+                if lane is not None:
+                    self.lanes[lane] = deque()
+                heapq.heappush(self.ready, (deadline, next(self.sequence), job))
+            else:
+                self.lanes[lane].append(job)
+        self.loop.call_soon_threadsafe(self.available.set)
+        return job
+
+    def take(self):
+        """Next job to run, or None once nothing is ready"""
+        with self.lock:
+            while self.ready:
+                _, _, job = heapq.heappop(self.ready)
+                self.waiting[job.job_class] -= 1
+                if job.status == "cancelled":
+                    self.release(job)
+                    continue
+                job.status = "started"
+                return job
+            self.available.clear()
+            return None
+
+    def release(self, job):
+        """Forget a finished or cancelled job and ready the next in its lane. Holds the lock."""
+        self.jobs.pop(job.id, None)
+        behind = self.lanes.get(job.queue)
+        if behind is None:
+            return
+        if behind:
+            following = behind.popleft()
+            heapq.heappush(self.ready, (following.meta["deadline"], next(self.sequence), following))
+            self.available.set()
+        else:
+            del self.lanes[job.queue]
+
+    def call(self, job):
+        job.started = time.time()
+        try:
+            return resolve(job.func)(**job.kwargs)
+        finally:
+            job.ended = time.time()
+
+    async def work(self):
+        while True:
+            await self.available.wait()
+            job = self.take()
+            if job is None:
+                continue
+            try:
+                job.future.set_result(await self.loop.run_in_executor(self.executor, self.call, job))
+            except Exception as e:
+                logger.error(f"{job.job_class} job {job.id} ({job.func}) failed: {e}")
+                job.future.set_exception(e)
+            finally:
+                job.status = "finished"
+                with self.lock:
+                    self.release(job)
+            try:
+                # Same per-class latency and deadline stats as RQ jobs, after the answer
+                await self.loop.run_in_executor(self.executor, job_scheduler.record_completion,
+                                                self.queue_conn, job)
+            except Exception as e:
+                logger.error(f"Error recording completion of job {job.id}: {e}")
+
+    def start(self):
+        """Start the worker tasks on the running loop; call before the first submit"""
+        self.loop = asyncio.get_running_loop()
+        self.available = asyncio.Event()
+        for _ in range(self.workers):
+            asyncio.create_task(self.work())
+        logger.info(f"Running pipeline jobs in process on {self.workers} workers")
+
+    def stop(self, job_id):
+        """Cancel a queued job; same outcomes as turns.stop_job"""
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job is None:
+                return None
+            if job.status == "queued":
+                job.status = "cancelled"
+                # Jobs waiting in a lane never reach the heap
+                behind = self.lanes.get(job.queue)
+                if behind is not None and job in behind:
+                    behind.remove(job)
+                    self.waiting[job.job_class] -= 1
+                    self.jobs.pop(job_id, None)
+                return "jobs_cancelled"
+        # A running job sees the cancelled turn at its next check
+        return "jobs_interrupted"
+
+    def pending(self, queue_names):
+        """Queued plus running jobs across the given queues"""
+        with self.lock:
+            return sum(1 for job in self.jobs.values() if job.queue in queue_names)
+
+    def depth(self):
+        """Jobs waiting to run"""
+        with self.lock:
+            return sum(self.waiting.values())
+
+def create_transport(queue_conn, name=PIPELINE_TRANSPORT):
+    """The in-process transport, or None when jobs go to RQ"""
+    if name not in TRANSPORTS:
+        raise ValueError(f"Unknown pipeline transport {name!r}, expected one of {', '.join(TRANSPORTS)}")
+    return InProcessTransport(queue_conn) if name == "inprocess" else None
@@ -1,99 +1,67 @@
 # app/audio_processor.py
+import json
 import logging
 import time
-import json
-import redis
 from io import BytesIO
 import wave
+from app.config import SESSION_TTL, AUDIO_ARCHIVE, DSP_FRONTEND
+from app.redis import session_store, dsp_frontend
+from app.redis.redis_client import create_redis, create_queue_redis
+from app.redis import job_scheduler
+from app.redis import transcription, turns, profiler
+from app.redis.profiler import stage
+from app.redis.transcription import transcribe, TranscriptionUnavailable
+from app.connection_directory import send_to_session
+from app.audio_archive import get_archive
+from rq import get_current_job
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, 
                    format='%(asctime)s [%(levelname)s] %(message)s')
 logger = logging.getLogger(__name__)
 
-# Redis connection
-redis_conn = redis.Redis(host='localhost', port=6379, db=0)
+# Redis connection for session data
+redis_conn = create_redis()
+# For the chunk jobs of audio flushed through the DSP front end
+queue_conn = create_queue_redis()
 
 # Audio settings
 SAMPLE_RATE = 8000
 CHANNELS = 1
 SAMPLE_WIDTH = 2
 
-def process_user_audio_chunk(session_id, audio_key, timestamp):
+@profiler.timed
+def process_user_audio_chunk(session_id, entry_id, chunk_size, timestamp):
     """
     Process a single audio chunk for a user
     This function is called by the RQ worker when a job is processed
+    The chunk itself is already in the session stream under entry_id
     """
-    logger.info(f"Processing audio chunk {audio_key} for session {session_id}")
-    
-    # Get the audio data from Redis
-    audio_data = redis_conn.get(audio_key)
-    
-    if not audio_data:
-        logger.warning(f"Audio data not found for key: {audio_key}")
-        return {"status": "error", "message": "Audio data not found"}
-    
-    # Get user ID from session info
-    session_info_key = f"session:info:{session_id}"
-    session_info = redis_conn.get(session_info_key)
+    logger.info(f"Processing audio chunk {entry_id} for session {session_id}")
     
-    if not session_info:
+    # Update session statistics and buffered size in one round trip
+    key = session_store.session_key(session_id)
+    now = time.time()
+    pipe = redis_conn.pipeline()
+    pipe.hget(key, session_store.F_DEVICE)
+    pipe.hincrby(key, session_store.F_CHUNKS, 1)
+    pipe.hincrby(key, session_store.F_BUFFERED_BYTES, chunk_size)
+    pipe.hset(key, mapping={
+        session_store.F_LAST_ACTIVITY: round(now, 3),
+        session_store.F_LAST_CHUNK_SIZE: chunk_size
+    })
+    pipe.hsetnx(key, session_store.F_FIRST_CHUNK, round(now, 3))
+    pipe.expire(key, SESSION_TTL)
+    device_id, chunks_processed, buffer_size = pipe.execute()[:3]
+    
+    if device_id is None:
         logger.warning(f"Session info not found: {session_id}")
         return {"status": "error", "message": "Session info not found"}
-    
-    try:
-        session_data = json.loads(session_info)
-        device_id = session_data.get("device_id", "unknown")
-    except:
-        device_id = "unknown"
-    
-    # Update session statistics
-    stats_key = f"stats:{session_id}"
-    pipe = redis_conn.pipeline()
-    
-    # Increment chunk count
-    pipe.hincrby(stats_key, "chunks_processed", 1)
-    pipe.hset(stats_key, "last_activity", time.time())
-    pipe.hset(stats_key, "last_chunk_size", len(audio_data))
-    
-    # If this is the first chunk, initialize other stats
-    if not redis_conn.exists(stats_key):
-        pipe.hset(stats_key, "first_chunk_time", time.time())
-        pipe.hset(stats_key, "device_id", device_id)
-    
-    # Execute all Redis commands
-    pipe.execute()
-    
-    # Get current stats
-    stats = redis_conn.hgetall(stats_key)
-    
-    # Convert byte keys/values to strings/numbers
-    formatted_stats = {}
-    for k, v in stats.items():
-        key = k.decode('utf-8') if isinstance(k, bytes) else k
-        try:
-            # Try to convert to number if possible
-            value = float(v) if isinstance(v, bytes) else v
-            # Convert timestamps to readable format
-            if "time" in key and not isinstance(v, bytes):
-                time_str = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(value))
-                formatted_stats[f"{key}_str"] = time_str
-        except:
-            value = v.decode('utf-8') if isinstance(v, bytes) else v
-        
-        formatted_stats[key] = value
+    device_id = device_id.decode('utf-8')
     
     # Display stats
-    logger.info(f"Session {session_id} stats: Chunks processed: {formatted_stats.get('chunks_processed', 0)}, "
-               f"Last chunk size: {formatted_stats.get('last_chunk_size', 0)} bytes")
-    
-    # Add this chunk to the accumulated buffer
-    buffer_key = f"buffer:{session_id}"
-    redis_conn.append(buffer_key, audio_data)
-    redis_conn.expire(buffer_key, 3600)  # 1 hour expiration
-    
-    # Get the current buffer size
-    buffer_size = redis_conn.strlen(buffer_key)
+    logger.info(f"Session {session_id} stats: Chunks processed: {chunks_processed}, "
+               f"Last chunk size: {chunk_size} bytes")
     logger.info(f"Buffer size for session {session_id}: {buffer_size} bytes")
     
     # If buffer reaches threshold, process it
@@ -105,33 +73,36 @@ def process_user_audio_chunk(session_id, audio_key, timestamp):
         "status": "processed",
         "session_id": session_id,
         "device_id": device_id,
-        "chunk_size": len(audio_data),
+        "chunk_size": chunk_size,
         "buffer_size": buffer_size,
         "timestamp": timestamp
     }
 
+@profiler.timed
 def process_audio_buffer(session_id, device_id):
-    """Process the accumulated audio buffer when it reaches sufficient size"""
+    """Process the accumulated audio buffer when it reaches sufficient size.
+
+    Buffers are not transcribed one by one; the utterance they belong to
+    is transcribed whole by finish_utterance.
+    """
     logger.info(f"Processing complete audio buffer for session {session_id}")
     
-    # Get the buffer data
-    buffer_key = f"buffer:{session_id}"
-    buffer_data = redis_conn.get(buffer_key)
+    # Get the audio that arrived since the last processed buffer
+    with stage("process_audio_buffer.read_audio"):
+        buffer_data, last_entry_id = session_store.read_pending_audio(redis_conn, session_id)
     
     if not buffer_data or len(buffer_data) == 0:
-        logger.warning(f"Empty buffer for session {session_id}")
+        logger.info(f"Empty buffer for session {session_id}")
         return {"status": "empty_buffer"}
     
-    # For this task, we just want to display information about the buffer
-    # In a real implementation, you would use a speech-to-text service here
-    
     # Convert PCM data to WAV for analysis (not actually using the WAV, just for stats)
-    wav_buffer = BytesIO()
-    with wave.open(wav_buffer, 'wb') as wav_file:
-        wav_file.setnchannels(CHANNELS)
-        wav_file.setsampwidth(SAMPLE_WIDTH)
-        wav_file.setframerate(SAMPLE_RATE)
-        wav_file.writeframes(buffer_data)
+    with stage("process_audio_buffer.wav_encode"):
+        wav_buffer = BytesIO()
+        with wave.open(wav_buffer, 'wb') as wav_file:
+            wav_file.setnchannels(CHANNELS)
+            wav_file.setsampwidth(SAMPLE_WIDTH)
+            wav_file.setframerate(SAMPLE_RATE)
+            wav_file.writeframes(buffer_data)
     
     # Calculate audio duration in seconds
     duration = len(buffer_data) / (SAMPLE_RATE * CHANNELS * SAMPLE_WIDTH)
@@ -143,7 +114,6 @@ def process_audio_buffer(session_id, device_id):
     logger.info(f"  Sample rate: {SAMPLE_RATE} Hz, Channels: {CHANNELS}, Sample width: {SAMPLE_WIDTH} bytes")
     
     # Store processing result
-    result_key = f"result:{session_id}:{time.time()}"
     result = {
         "status": "buffer_processed",
         "session_id": session_id,
@@ -154,67 +124,146 @@ def process_audio_buffer(session_id, device_id):
         "process_time": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(time.time()))
     }
     
-    redis_conn.set(result_key, json.dumps(result), ex=3600)
-    
-    # Update session stats
-    stats_key = f"stats:{session_id}"
-    pipe = redis_conn.pipeline()
-    pipe.hincrby(stats_key, "buffers_processed", 1)
-    pipe.hset(stats_key, "last_buffer_size", len(buffer_data))
-    pipe.hset(stats_key, "last_buffer_duration", round(duration, 2))
-    pipe.hset(stats_key, "last_buffer_process_time", time.time())
-    pipe.execute()
-    
-    # Clear the buffer for the next chunk of audio
-    redis_conn.set(buffer_key, b"")
+    # Record the result, update stats and move the cursor past this audio,
+    # which clears the buffer for the next chunk of audio
+    key = session_store.session_key(session_id)
+    with stage("process_audio_buffer.store_result"):
+        pipe = redis_conn.pipeline()
+        session_store.add_result(redis_conn, session_id, result, pipe=pipe)
+        pipe.hincrby(key, session_store.F_BUFFERS, 1)
+        pipe.hincrby(key, session_store.F_BUFFERED_BYTES, -len(buffer_data))
+        pipe.hset(key, mapping={
+            session_store.F_CURSOR: last_entry_id,
+            session_store.F_LAST_BUFFER_SIZE: len(buffer_data),
+            session_store.F_LAST_BUFFER_DURATION: round(duration, 2),
+            session_store.F_LAST_BUFFER_TIME: round(time.time(), 3)
+        })
+        pipe.execute()
+    
+    # Keep the utterance on local disk rather than in Redis
+    if AUDIO_ARCHIVE:
+        with stage("process_audio_buffer.archive"):
+            try:
+                get_archive().append(session_id, device_id, buffer_data, duration)
+            except Exception as e:
+                logger.error(f"Error archiving audio for session {session_id}: {e}")
     
     return result
 
+def transcribe_utterance(session_id, pcm, turn=None):
+    """Transcript of a whole utterance, batched with other sessions' by the transcription service"""
+    request_id = transcription.new_request_id()
+    if turn is not None:
+        # Recorded so a barge-in can pull the turn's request from the batch
+        turns.track_request(redis_conn, session_id, request_id)
+    try:
+        return transcribe(redis_conn, session_id, pcm, request_id=request_id)
+    except TranscriptionUnavailable as e:
+        # The utterance still ends, so the session moves on to the next one
+        logger.error(f"Utterance of session {session_id} not transcribed: {e}")
+        return None
+    finally:
+        if turn is not None:
+            turns.release_request(redis_conn, session_id, request_id)
+
+@profiler.timed
+def finish_utterance(session_id, device_id, turn=None):
+    """Process whatever is left of the utterance that just ended and transcribe it.
+
+    The whole utterance is transcribed in one request, including the
+    buffers already processed at the size threshold. The session stays
+    open for the next utterance.
+    """
+    if turns.is_cancelled(redis_conn, session_id, turn):
+        return {"status": "cancelled", "session_id": session_id, "turn": turn}
+    
+    if DSP_FRONTEND:
+        # Frames from the last tick or two may still be raw; the utterance
+        # needs them, and left behind they would open the next one
+        dsp_frontend.flush_session(redis_conn, queue_conn, session_id)
+    
+    # Read from the stream rather than trusting the buffered count, which
+    # lags behind until the flushed audio's chunk jobs have run
+    process_audio_buffer(session_id, device_id)
+    pcm, last_entry_id = session_store.read_utterance(redis_conn, session_id)
+    if not pcm:
+        return {"status": "no_remaining_buffer"}
+    
+    with stage("finish_utterance.transcribe"):
+        transcript = transcribe_utterance(session_id, pcm, turn)
+    # The next utterance starts after this one, answered or not
+    key = session_store.session_key(session_id)
+    redis_conn.hset(key, session_store.F_UTTERANCE_START, last_entry_id)
+    
+    if turns.is_cancelled(redis_conn, session_id, turn):
+        # The child moved on; this utterance's answer is no longer wanted
+        logger.info(f"Turn {turn} of session {session_id} cancelled, discarding its utterance")
+        return {"status": "cancelled", "session_id": session_id, "turn": turn}
+    
+    duration = len(pcm) / (SAMPLE_RATE * CHANNELS * SAMPLE_WIDTH)
+    result = {
+        "status": "utterance_processed",
+        "session_id": session_id,
+        "device_id": device_id,
+        "turn": turn,
+        "utterance_size": len(pcm),
+        "duration": round(duration, 2),
+        "transcript": transcript or "",
+        "timestamp": time.time()
+    }
+    session_store.add_result(redis_conn, session_id, result)
+    return result
+
+@profiler.timed
+def answer_turn(session_id, device_id, turn):
+    """The job for one turn: finish its utterance and send the result back.
+
+    Nothing about the session itself changes; it stays active for the
+    next turn.
+    """
+    result = finish_utterance(session_id, device_id, turn)
+    if result["status"] == "cancelled":
+        # Superseded by newer speech or a disconnect
+        return result
+    
+    # Tagged with the turn so the server can drop it after a barge-in
+    send_to_session(redis_conn, session_id, json.dumps({
+        "type": "turn_result",
+        "turn": turn,
+        "transcript": result.get("transcript", "")
+    }), turn=turn)
+    return {"status": "answered", "session_id": session_id, "turn": turn, "result": result}
+
+@profiler.timed
 def end_stream_processing(session_id, device_id, reason="client_signal"):
-    """End the audio stream processing and process any remaining buffer"""
+    """End the session: process any remaining buffer, mark it inactive and release its keys.
+
+    Only for a real session end (end_session or an expired resume grace
+    period); an utterance ending is finish_utterance.
+    """
     logger.info(f"Ending stream processing for session {session_id}, device {device_id}. Reason: {reason}")
     
     # Process any remaining audio in the buffer
-    buffer_key = f"buffer:{session_id}"
-    if redis_conn.exists(buffer_key) and redis_conn.strlen(buffer_key) > 0:
-        result = process_audio_buffer(session_id, device_id)
-    else:
-        result = {"status": "no_remaining_buffer"}
+    key = session_store.session_key(session_id)
+    result = finish_utterance(session_id, device_id)
     
     # Update session state
-    session_state_key = f"session:state:{session_id}"
-    state = {
-        "active": False,
-        "end_time": time.time(),
-        "end_reason": reason,
-        "device_id": device_id
-    }
-    redis_conn.set(session_state_key, json.dumps(state), ex=3600)
-    
-    # Final session statistics
-    stats_key = f"stats:{session_id}"
-    if redis_conn.exists(stats_key):
-        stats = redis_conn.hgetall(stats_key)
-        
-        # Convert byte keys/values to strings/numbers
-        formatted_stats = {}
-        for k, v in stats.items():
-            key = k.decode('utf-8') if isinstance(k, bytes) else k
-            try:
-                # Try to convert to number
-                value = float(v) if isinstance(v, bytes) else v
-            except:
-                value = v.decode('utf-8') if isinstance(v, bytes) else v
-            
-            formatted_stats[key] = value
-        
-        chunks_processed = formatted_stats.get('chunks_processed', 0)
-        buffers_processed = formatted_stats.get('buffers_processed', 0)
-        
-        logger.info(f"Session {session_id} final stats:")
-        logger.info(f"  Total chunks processed: {chunks_processed}")
-        logger.info(f"  Total buffers processed: {buffers_processed}")
-        logger.info(f"  Session end reason: {reason}")
+    redis_conn.hset(key, mapping={
+        session_store.F_ACTIVE: 0,
+        session_store.F_END_TIME: round(time.time(), 3),
+        session_store.F_END_REASON: reason
+    })
+    
+    # Stats and cleanup can wait
+    job = get_current_job()
+    if job is not None or job_scheduler.local_transport is not None:
+        job_scheduler.enqueue(
+            job and job.connection, job_scheduler.BACKGROUND,
+            'app.redis.audio_processor.finalize_session',
+            kwargs={"session_id": session_id, "reason": reason}
+        )
+    else:
+        finalize_session(session_id, reason)
         
     return {
         "status": "session_ended",
@@ -224,27 +273,38 @@ def end_stream_processing(session_id, device_id, reason="client_signal"):
         "final_result": result
     }
 
+@profiler.timed
+def finalize_session(session_id, reason):
+    """Log final statistics for an ended session and release its keys"""
+    stats = session_store.load(redis_conn, session_id)
+    if stats:
+        chunks_processed = stats.get('chunks_processed', 0)
+        buffers_processed = stats.get('buffers_processed', 0)
+        
+        logger.info(f"Session {session_id} final stats:")
+        logger.info(f"  Total chunks processed: {chunks_processed}")
+        logger.info(f"  Total buffers processed: {buffers_processed}")
+        logger.info(f"  Session end reason: {reason}")
+    
+    # Release the session's keys
+    session_store.reclaim(redis_conn, session_id)
+    
+    return {"status": "finalized", "session_id": session_id}
+
 def start_user_session_processor(device_id, session_id, queue_name):
     """Initialize session processing for a user"""
     logger.info(f"Starting session processor for device {device_id}, session {session_id}")
     
-    # Create session state
-    session_state_key = f"session:state:{session_id}"
-    state = {
-        "active": True,
-        "start_time": time.time(),
-        "device_id": device_id,
-        "queue_name": queue_name
-    }
-    redis_conn.set(session_state_key, json.dumps(state), ex=3600)
-    
-    # Initialize statistics
-    stats_key = f"stats:{session_id}"
+    # The session hash is created on connect; fill in anything missing
+    key = session_store.session_key(session_id)
     pipe = redis_conn.pipeline()
-    pipe.hset(stats_key, "start_time", time.time())
-    pipe.hset(stats_key, "device_id", device_id)
-    pipe.hset(stats_key, "chunks_processed", 0)
-    pipe.hset(stats_key, "buffers_processed", 0)
+    pipe.hsetnx(key, session_store.F_DEVICE, device_id)
+    pipe.hsetnx(key, session_store.F_QUEUE, queue_name)
+    pipe.hsetnx(key, session_store.F_START, round(time.time(), 3))
+    pipe.hsetnx(key, session_store.F_CHUNKS, 0)
+    pipe.hsetnx(key, session_store.F_BUFFERS, 0)
+    pipe.hset(key, session_store.F_ACTIVE, 1)
+    pipe.expire(key, SESSION_TTL)
     pipe.execute()
     
     # Log the initialization
@@ -255,4 +315,4 @@ def start_user_session_processor(device_id, session_id, queue_name):
         "session_id": session_id,
         "device_id": device_id,
         "queue_name": queue_name
-    }
\ No newline at end of file
+    }
@@ -0,0 +1,325 @@
+# app/redis/dsp_frontend.py
+import time
+import struct
+import logging
+import numpy as np
+from app.config import SAMPLE_RATE, DSP_TICK, DSP_MAX_SESSIONS
+from app.redis import session_store, job_scheduler
+from app.redis.redis_client import create_redis, create_queue_redis
+from app.redis.supervisor import Heartbeat
+from app.pipeline_transport import TransportFull
+
+logging.basicConfig(level=logging.INFO,
+                   format='%(asctime)s [%(levelname)s] %(message)s')
+logger = logging.getLogger(__name__)
+
+# Name the supervisor knows the DSP process by
+DSP_WORKER = "dsp_frontend"
+STATS_KEY = "dsp:stats"
+# Seconds an ending utterance waits for a tick already processing its session
+FLUSH_TIMEOUT = 1.0
+
+# Highest device rate accepted; rates are whole multiples of SAMPLE_RATE
+MAX_INPUT_RATE = 48000
+HIGH_PASS_HZ = 100
+# Gain normalization: target level, most boost allowed, and the level
+# below which a row is treated as silence and its gain is held
+TARGET_RMS = 3000.0
+MAX_GAIN = 8.0
+NOISE_FLOOR_RMS = 100.0
+# How far each tick moves the DC estimate towards the tick's mean, and the
+# gain towards its target when it has to fall (attack) or may rise
+# (release). A slow release keeps pauses between words from pumping up.
+DC_SMOOTHING = 0.1
+GAIN_ATTACK = 0.5
+GAIN_RELEASE = 0.05
+
+# Kernels work on a whole batch at once: a float32 matrix with one row
+# per session, zero padded past each row's length. A session's audio is
+# one signal across ticks: each row's FilterState carries what the
+# kernels need from the previous tick and is updated in place.
+
+# dc, gain, history length, leftover length; both arrays follow as float32
+STATE_HEADER = struct.Struct("<ffHH")
+
+class FilterState:
+    """What one session's front end carries from a tick to the next"""
+
+    def __init__(self, dc=None, gain=1.0, history=None, leftover=None):
+        # Running mean removed as DC, None until the first tick
+        self.dc = dc
+        self.gain = gain
+        # Last input samples of the high-pass window, after DC removal
+        self.history = history if history is not None else np.zeros(0, dtype=np.float32)
+        # Filtered samples short of a whole decimation run
+        self.leftover = leftover if leftover is not None else np.zeros(0, dtype=np.float32)
+
+    def dumps(self):
+        dc = np.nan if self.dc is None else self.dc
+        return (STATE_HEADER.pack(dc, self.gain, len(self.history), len(self.leftover))
+                + self.history.astype("<f4").tobytes() + self.leftover.astype("<f4").tobytes())
+
+    @classmethod
+    def loads(cls, raw):
+        """State from its F_DSP_STATE bytes; a fresh state for a new session"""
+        if not raw:
+            return cls()
+        dc, gain, history_len, leftover_len = STATE_HEADER.unpack_from(raw)
+        arrays = np.frombuffer(raw, dtype="<f4", offset=STATE_HEADER.size).astype(np.float32)
+        return cls(None if np.isnan(dc) else dc, gain,
+                   arrays[:history_len], arrays[history_len:history_len + leftover_len])
+
+def supports_rate(rate):
+    """Whether the front end can bring a device's rate down to SAMPLE_RATE"""
+    return 0 < rate <= MAX_INPUT_RATE and rate % SAMPLE_RATE == 0
+
+def pack(rows):
+    """Stack int16 PCM byte strings into a padded float32 batch"""
+    lengths = np.array([len(row) // 2 for row in rows])
+    batch = np.zeros((len(rows), lengths.max()), dtype=np.float32)
+    for i, row in enumerate(rows):
+        batch[i, :lengths[i]] = np.frombuffer(row, dtype="<i2", count=lengths[i])
+    mask = np.arange(batch.shape[1]) < lengths[:, None]
+    return batch, lengths, mask
+
+def remove_dc(batch, lengths, mask, states):
+    """Subtract a running mean, smoothed across ticks so it does not step"""
+    means = batch.sum(axis=1) / np.maximum(lengths, 1)
+    dc = np.array([mean if state.dc is None else state.dc + DC_SMOOTHING * (mean - state.dc)
+                   for state, mean in zip(states, means)], dtype=np.float32)
+    batch -= dc[:, None]
+    batch *= mask
+    for state, value in zip(states, dc):
+        state.dc = float(value)
+
+def high_pass(batch, lengths, rate, states):
+    """Subtract a trailing moving average, a cheap high-pass at about HIGH_PASS_HZ.
+
+    The window reaches back into the previous tick through each row's history.
+    """
+    window = max(1, rate // HIGH_PASS_HZ)
+    extended = np.zeros((len(batch), window + batch.shape[1]), dtype=np.float32)
+    for i, state in enumerate(states):
+        if len(state.history) == window:
+            extended[i, :window] = state.history
+    extended[:, window:] = batch
+    for i, state in enumerate(states):
+        state.history = extended[i, lengths[i]:lengths[i] + window].copy()
+    sums = np.pad(np.cumsum(extended, axis=1, dtype=np.float64), ((0, 0), (1, 0)))
+    batch -= ((sums[:, window + 1:] - sums[:, 1:-window]) / window).astype(np.float32)
+
+def downsample(batch, lengths, factor, states):
+    """Average each run of `factor` samples: anti-alias and decimate in one step.
+
+    Samples short of a whole run wait in the row's leftover for the next tick.
+    """
+    if factor == 1:
+        return batch, lengths
+    rows = [np.concatenate([state.leftover, batch[i, :lengths[i]]]) for i, state in enumerate(states)]
+    out_lengths = np.array([len(row) // factor for row in rows])
+    out = np.zeros((len(rows), max(out_lengths.max(), 1)), dtype=np.float32)
+    for i, (row, state) in enumerate(zip(rows, states)):
+        usable = out_lengths[i] * factor
+        out[i, :out_lengths[i]] = row[:usable].reshape(-1, factor).mean(axis=1)
+        state.leftover = row[usable:]
+    return out, out_lengths
+
+def normalize_gain(batch, lengths, states):
+    """Ease each row's gain towards TARGET_RMS, ramping across the tick.
+
+    Rows under NOISE_FLOOR_RMS hold their gain instead of boosting the noise.
+    """
+    rms = np.sqrt((batch * batch).sum(axis=1) / np.maximum(lengths, 1))
+    previous = np.array([state.gain for state in states], dtype=np.float32)
+    target = np.where(rms > NOISE_FLOOR_RMS, np.minimum(TARGET_RMS / np.maximum(rms, 1.0), MAX_GAIN), previous)
+    gain = previous + (target - previous) * np.where(target < previous, GAIN_ATTACK, GAIN_RELEASE)
+    ramp = np.minimum(np.arange(1, batch.shape[1] + 1) / np.maximum(lengths, 1)[:, None], 1.0)
+    batch *= (previous[:, None] + (gain - previous)[:, None] * ramp).astype(np.float32)
+    for state, value in zip(states, gain):
+        state.gain = float(value)
+
+def process_batch(rows, input_rate, states=None):
+    """Run the front end over raw PCM rows sharing an input rate.
+
+    states holds each row's FilterState and is updated for the next tick;
+    without it every row starts fresh. Returns the processed rows as int16
+    PCM at SAMPLE_RATE.
+    """
+    if states is None:
+        states = [FilterState() for _ in rows]
+    batch, lengths, mask = pack(rows)
+    remove_dc(batch, lengths, mask, states)
+    high_pass(batch, lengths, input_rate, states)
+    batch *= mask
+    batch, lengths = downsample(batch, lengths, input_rate // SAMPLE_RATE, states)
+    normalize_gain(batch, lengths, states)
+    out = np.clip(batch, -32768, 32767).astype("<i2")
+    return [out[i, :lengths[i]].tobytes() for i in range(len(rows))]
+
+def gather(redis_conn, session_ids):
+    """Read each session's unprocessed raw audio.
+
+    Returns {session_id: (device_id, rate, pcm, last_entry_id, state)}.
+    """
+    pipe = redis_conn.pipeline()
+    for session_id in session_ids:
+        pipe.hmget(session_store.session_key(session_id), session_store.F_DSP_CURSOR,
+                   session_store.F_INPUT_RATE, session_store.F_DEVICE, session_store.F_DSP_STATE)
+    meta = pipe.execute()
+
+    pipe = redis_conn.pipeline()
+    for session_id, (cursor, _, _, _) in zip(session_ids, meta):
+        start = f"({cursor.decode('utf-8')}" if cursor else "-"
+        pipe.xrange(session_store.stream_key(session_id), min=start, max="+")
+    entries = pipe.execute()
+
+    pending = {}
+    for session_id, (_, rate, device_id, state), session_entries in zip(session_ids, meta, entries):
+        chunks = [fields[b"d"] for _, fields in session_entries if fields.get(b"t") == session_store.ENTRY_RAW]
+        # Sessions that already ended have no hash left to update
+        if not chunks or device_id is None:
+            continue
+        pending[session_id] = (device_id.decode('utf-8'), int(rate or SAMPLE_RATE),
+                               b"".join(chunks), session_entries[-1][0], FilterState.loads(state))
+    return pending
+
+def tick(redis_conn, queue_conn):
+    """Process every session with raw audio in one batch per input rate"""
+    session_ids = [s.decode('utf-8') for s in redis_conn.spop(session_store.DSP_PENDING_KEY, DSP_MAX_SESSIONS) or []]
+    if not session_ids:
+        return 0
+    try:
+        return process_sessions(redis_conn, queue_conn, session_ids)
+    except Exception:
+        # Leave the sessions flagged for the next tick
+        redis_conn.sadd(session_store.DSP_PENDING_KEY, *session_ids)
+        raise
+
+def claim(redis_conn, session_ids):
+    """Unflag the given sessions, returning those this caller took.
+
+    One SREM per session: only one caller, here or a tick()'s SPOP, sees
+    a session leave the set, so no two read from the same DSP cursor.
+    """
+    pipe = redis_conn.pipeline()
+    for session_id in session_ids:
+        pipe.srem(session_store.DSP_PENDING_KEY, session_id)
+    return [session_id for session_id, removed in zip(session_ids, pipe.execute()) if removed]
+
+def tick_sessions(redis_conn, queue_conn, session_ids, refused=None):
+    """tick() over just the given sessions, for a server running its own pipeline.
+
+    Each server process then only handles the sessions it holds, so one
+    device's chunk jobs always land on the same process's pool, in order.
+    Sessions whose chunk job the pool refused are added to refused.
+    """
+    session_ids = claim(redis_conn, session_ids)
+    if not session_ids:
+        return 0
+    try:
+        return process_sessions(redis_conn, queue_conn, session_ids, refused)
+    except Exception:
+        redis_conn.sadd(session_store.DSP_PENDING_KEY, *session_ids)
+        raise
+
+def flush_session(redis_conn, queue_conn, session_id, timeout=FLUSH_TIMEOUT):
+    """Get a session's raw audio through the front end before its utterance is read.
+
+    Runs the session through a tick now if it is still flagged, otherwise
+    waits for the tick that took it to move the DSP cursor past the last
+    raw entry. Returns False if that did not happen within timeout.
+    """
+    cursor = redis_conn.hget(session_store.session_key(session_id), session_store.F_DSP_CURSOR)
+    start = f"({cursor.decode('utf-8')}" if cursor else "-"
+    raw = [entry_id for entry_id, fields in redis_conn.xrange(session_store.stream_key(session_id), min=start, max="+")
+           if fields.get(b"t") == session_store.ENTRY_RAW]
+    if not raw:
+        return True
+    last_raw = session_store.entry_order(raw[-1])
+
+    tick_sessions(redis_conn, queue_conn, [session_id])
+    deadline = time.time() + timeout
+    while True:
+        cursor = redis_conn.hget(session_store.session_key(session_id), session_store.F_DSP_CURSOR)
+        if cursor and session_store.entry_order(cursor) >= last_raw:
+            return True
+        if time.time() >= deadline:
+            logger.warning(f"Raw audio of session {session_id} still unprocessed after {timeout}s")
+            return False
+        time.sleep(0.005)
+
+def process_sessions(redis_conn, queue_conn, session_ids, refused=None):
+    """Gather, process and scatter the audio for the given sessions.
+
+    A chunk job the in-process pool has no room for is skipped: its audio
+    is already in the stream and is read with the session's next buffer.
+    Those sessions are added to refused, so their devices can be slowed.
+    """
+    pending = gather(redis_conn, session_ids)
+
+    by_rate = {}
+    for session_id, (_, rate, pcm, _, state) in pending.items():
+        by_rate.setdefault(rate, []).append((session_id, pcm, state))
+
+    processed = {}
+    for rate, group in by_rate.items():
+        outputs = process_batch([pcm for _, pcm, _ in group], rate, [state for _, _, state in group])
+        processed.update((session_id, out) for (session_id, _, _), out in zip(group, outputs))
+
+    # Scatter the results back to each session's stream
+    pipe = redis_conn.pipeline()
+    for session_id, out in processed.items():
+        session_store.append_audio(redis_conn, session_id, out, pipe=pipe)
+        # The cursor and the filter state move together
+        pipe.hset(session_store.session_key(session_id), mapping={
+            session_store.F_DSP_CURSOR: pending[session_id][3],
+            session_store.F_DSP_STATE: pending[session_id][4].dumps(),
+        })
+    results = pipe.execute()
+    # append_audio queues XADD then EXPIRE, followed by our HSET
+    entry_ids = [entry_id.decode('utf-8') for entry_id in results[0::3]]
+
+    # One chunk job per session per tick instead of one per frame
+    now = time.time()
+    for (session_id, out), entry_id in zip(processed.items(), entry_ids):
+        device_id = pending[session_id][0]
+        try:
+            job_scheduler.enqueue(
+                queue_conn, job_scheduler.INGEST,
+                'app.redis.audio_processor.process_user_audio_chunk',
+                kwargs={"session_id": session_id, "entry_id": entry_id,
+                        "chunk_size": len(out), "timestamp": now},
+                queue=f"user_{device_id}"
+            )
+        except TransportFull as e:
+            logger.warning(f"No chunk job for session {session_id}: {e}")
+            if refused is not None:
+                refused.append(session_id)
+    return len(processed)
+
+def run():
+    """Tick forever, recording batch sizes and tick times"""
+    redis_conn = create_redis()
+    queue_conn = create_queue_redis()
+    Heartbeat(create_queue_redis(), DSP_WORKER).start()
+    logger.info(f"DSP front end running every {DSP_TICK * 1000:.0f} ms")
+
+    while True:
+        start = time.perf_counter()
+        try:
+            sessions = tick(redis_conn, queue_conn)
+        except Exception as e:
+            logger.error(f"DSP tick failed: {e}")
+            sessions = 0
+        elapsed = time.perf_counter() - start
+
+        if sessions:
+            pipe = queue_conn.pipeline()
+            pipe.hincrby(STATS_KEY, "ticks", 1)
+            pipe.hincrby(STATS_KEY, "sessions", sessions)
+            pipe.hincrbyfloat(STATS_KEY, "tick_ms", elapsed * 1000)
+            pipe.execute()
+        time.sleep(max(0.0, DSP_TICK - elapsed))
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,151 @@
+# app/redis/job_scheduler.py
+import math
+import time
+import uuid
+import logging
+from rq import Queue
+from app.config import INTERACTIVE_DEADLINE, INGEST_DEADLINE, BACKGROUND_DEADLINE, FAIRNESS_BURST
+
+logger = logging.getLogger(__name__)
+
+# Job classes
+INTERACTIVE = "interactive"  # the turn a child is waiting on
+INGEST = "ingest"            # audio chunks and session setup
+BACKGROUND = "background"    # stats, sync and analytics
+
+# Class -> (shared queue, seconds from enqueue to deadline)
+JOB_CLASSES = {
+    INTERACTIVE: ("interactive", INTERACTIVE_DEADLINE),
+    INGEST: ("session_management", INGEST_DEADLINE),
+    BACKGROUND: ("background", BACKGROUND_DEADLINE),
+}
+
+# Served together by the shared worker, most urgent first
+SHARED_QUEUES = [queue_name for queue_name, _ in JOB_CLASSES.values()]
+SHARED_WORKER = "session_management"
+
+# Recent latencies kept per class for percentiles
+LATENCY_SAMPLES = 200
+
+def stats_key(job_class):
+    return f"sched:stats:{job_class}"
+
+def latency_key(job_class):
+    """Most recent job latencies in ms, newest first"""
+    return f"sched:latency:{job_class}"
+
+def worker_queues(queue_name):
+    """Queues served by the worker supervised under queue_name"""
+    return SHARED_QUEUES if queue_name == SHARED_WORKER else [queue_name]
+
+# Set in a server process that runs the pipeline itself; enqueue then
+# hands jobs to it instead of RQ (see app.pipeline_transport)
+local_transport = None
+
+def use_local_transport(transport):
+    global local_transport
+    local_transport = transport
+
+def enqueue(connection, job_class, func, kwargs=None, queue=None, job_id=None, deadline=None):
+    """Enqueue a job tagged with its class and deadline.
+
+    queue overrides the class's shared queue, e.g. for per-device chunk
+    queues that must stay in order.
+    """
+    default_queue, budget = JOB_CLASSES[job_class]
+    now = time.time()
+    deadline = deadline or now + budget
+    job_id = job_id or uuid.uuid4().hex
+
+    if local_transport is not None:
+        return local_transport.submit(job_class, func, kwargs, queue or default_queue, job_id, now, deadline)
+
+    # Workers ordering their queues read the deadline back from the meta
+    return Queue(queue or default_queue, connection=connection).enqueue_call(
+        func,
+        kwargs=kwargs,
+        job_id=job_id,
+        meta={"job_class": job_class, "enqueued": now, "deadline": deadline}
+    )
+
+def record_completion(connection, job):
+    """Count the job against its class and note whether it missed its deadline"""
+    job_class = job.meta.get("job_class")
+    if not job_class:
+        return
+    now = time.time()
+    late_ms = (now - job.meta["deadline"]) * 1000
+    latency_ms = (now - job.meta["enqueued"]) * 1000
+
+    key = stats_key(job_class)
+    pipe = connection.pipeline()
+    pipe.hincrby(key, "jobs", 1)
+    pipe.hincrbyfloat(key, "latency_ms", latency_ms)
+    pipe.lpush(latency_key(job_class), round(latency_ms, 1))
+    pipe.ltrim(latency_key(job_class), 0, LATENCY_SAMPLES - 1)
+    if late_ms > 0:
+        pipe.hincrby(key, "misses", 1)
+        pipe.hincrbyfloat(key, "late_ms", late_ms)
+    pipe.execute()
+    if late_ms > 0:
+        logger.warning(f"{job_class} job {job.id} missed its deadline by {late_ms:.0f} ms")
+
+class EarliestDeadlineMixin:
+    """Take the next job from the queue whose head job is due first.
+
+    A queue served FAIRNESS_BURST times in a row yields one turn to any
+    other queue with work, so a flood of urgent jobs cannot starve the rest.
+    Hooks into Worker internals (_ordered_queues, dequeue_job_and_maintain_ttl,
+    reorder_queues), which is why rq is pinned in requirements.txt.
+    """
+
+    _streak_queue = None
+    _streak = 0
+
+    def order_by_deadline(self):
+        queues = list(self.queues)
+        if len(queues) < 2:
+            return queues
+
+        pipe = self.connection.pipeline()
+        for queue in queues:
+            pipe.lindex(queue.key, 0)
+        heads = pipe.execute()
+
+        job_ids = [head.decode('utf-8') for head in heads if head]
+        if not job_ids:
+            return queues
+        # Just the meta field of each head job, not the whole job hash
+        pipe = self.connection.pipeline()
+        for job_id in job_ids:
+            pipe.hget(self.job_class.key_for(job_id), "meta")
+        metas = [self.serializer.loads(meta) if meta else {} for meta in pipe.execute()]
+        deadlines = {job_id: meta.get("deadline") for job_id, meta in zip(job_ids, metas)}
+
+        now = time.time()
+        def due(index):
+            head = heads[index]
+            if head is None:
+                return math.inf
+            # Jobs enqueued without a class are treated as due now
+            deadline = deadlines.get(head.decode('utf-8'))
+            return deadline if deadline is not None else now
+
+        order = sorted(range(len(queues)), key=lambda i: (due(i), i))
+        first = queues[order[0]]
+        if (self._streak >= FAIRNESS_BURST and first.name == self._streak_queue
+                and len(order) > 1 and heads[order[1]] is not None):
+            order[0], order[1] = order[1], order[0]
+        return [queues[i] for i in order]
+
+    def dequeue_job_and_maintain_ttl(self, *args, **kwargs):
+        self._ordered_queues = self.order_by_deadline()
+        return super().dequeue_job_and_maintain_ttl(*args, **kwargs)
+
+    def reorder_queues(self, reference_queue):
+        # Called with the queue each job was taken from
+        if reference_queue.name == self._streak_queue:
+            self._streak += 1
+        else:
+            self._streak_queue = reference_queue.name
+            self._streak = 1
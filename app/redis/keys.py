@@ -0,0 +1,62 @@
+# app/redis/keys.py
+"""Key schema for per-device and per-session data.
+
+Every key that belongs to a device, or to one of its sessions, carries
+the device's hash tag. In Redis Cluster they all map to the same slot,
+so pipelines and Lua scripts that touch several of them stay on one
+node. Session ids embed the tag themselves, so keys built from a session
+id alone need no lookup.
+"""
+
+def device_tag(device_id):
+    """Hash tag shared by all of a device's keys"""
+    return "{" + device_id + "}"
+
+def new_session_id(device_id, unique):
+    return f"session_{device_tag(device_id)}_{unique}"
+
+def untagged(session_id):
+    """Session id without the tag braces, for names outside Redis keys (RQ job ids)"""
+    return session_id.replace("{", "").replace("}", "")
+
+# Per-session keys
+
+def session(session_id):
+    """Hash holding a session's info, state and stats"""
+    return f"sess:{session_id}"
+
+def session_stream(session_id):
+    """Capped stream of a session's audio chunks and results"""
+    return f"sess:{session_id}:x"
+
+def session_detached(session_id):
+    return f"session:detached:{session_id}"
+
+def session_resume(device_id, token):
+    return f"session:resume:{device_tag(device_id)}:{token}"
+
+def conn_session(session_id):
+    return f"conn:session:{session_id}"
+
+# Per-device keys
+
+def conn_device(device_id):
+    return f"conn:device:{device_tag(device_id)}"
+
+def engine_state(user_id):
+    return f"engine:state:{device_tag(user_id)}"
+
+def review_due(user_id):
+    return f"review:due:{device_tag(user_id)}"
+
+def review_card(user_id):
+    return f"review:card:{device_tag(user_id)}"
+
+def conversation(user_id):
+    return f"conversation:{device_tag(user_id)}"
+
+def vocabulary(user_id):
+    return f"vocabulary:{device_tag(user_id)}"
+
+def user_modified(user_id):
+    return f"user:{device_tag(user_id)}:modified"
@@ -0,0 +1,197 @@
+# app/redis/profiler.py
+import os
+import sys
+import time
+import logging
+import argparse
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from functools import wraps
+from app.config import PROFILE_SAMPLE_INTERVAL_MS
+from app.redis.redis_client import create_queue_redis
+
+logger = logging.getLogger(__name__)
+
+# Hash of target -> unix time profiling stays on until. A target is a
+# supervised worker name, a queue name or "*" for every worker.
+CONTROL_KEY = "profile:control"
+# Seconds a worker reuses its last read of the control hash
+CONTROL_REFRESH = 2.0
+# Profiles are dropped a day after the last profiled job
+PROFILE_TTL = 86400
+
+def stacks_key(target):
+    """Collapsed stack -> sample count, flamegraph.pl input"""
+    return f"profile:stacks:{target}"
+
+def functions_key(target):
+    """Cumulative calls and time per timed function or stage"""
+    return f"profile:functions:{target}"
+
+def frame_label(frame):
+    return f"{os.path.basename(frame.f_code.co_filename)}:{frame.f_code.co_name}"
+
+class StackSampler:
+    """Samples one thread's stack from a timer thread.
+
+    One sampler thread per process, idle unless a job is being profiled.
+    Stacks are folded into "outer;...;inner" strings as they are taken.
+    """
+
+    def __init__(self, interval_ms=PROFILE_SAMPLE_INTERVAL_MS):
+        self.interval = interval_ms / 1000
+        self.thread_id = None
+        self.samples = Counter()
+        self.wake = threading.Event()
+        self.lock = threading.Lock()
+        self.pid = None
+
+    def ensure_thread(self):
+        # A forked work-horse does not inherit the parent's sampler thread
+        if self.pid != os.getpid():
+            self.pid = os.getpid()
+            threading.Thread(target=self.loop, name="stack-sampler", daemon=True).start()
+
+    def start(self, thread_id):
+        self.ensure_thread()
+        self.samples = Counter()
+        self.thread_id = thread_id
+        self.wake.set()
+
+    def stop(self):
+        with self.lock:
+            self.thread_id = None
+            self.wake.clear()
+            return self.samples
+
+    def loop(self):
+        while True:
+            self.wake.wait()
+            time.sleep(self.interval)
+            with self.lock:
+                thread_id = self.thread_id
+                frame = sys._current_frames().get(thread_id) if thread_id else None
+                labels = []
+                while frame is not None:
+                    labels.append(frame_label(frame))
+                    frame = frame.f_back
+                if labels:
+                    self.samples[";".join(reversed(labels))] += 1
+
+sampler = StackSampler()
+
+# {name: [calls, ms]} while a profiled job runs in this process, else None
+_timings = None
+
+@contextmanager
+def stage(name):
+    """Time a block towards the current job's profile, if it is profiled"""
+    if _timings is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        entry = _timings.setdefault(name, [0, 0.0])
+        entry[0] += 1
+        entry[1] += (time.perf_counter() - start) * 1000
+
+def timed(func):
+    """Time every call of a job function while its job is profiled"""
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        with stage(func.__name__):
+            return func(*args, **kwargs)
+    return wrapper
+
+_control = {}
+_control_read = 0.0
+
+def enabled(connection, *targets):
+    """True if profiling is on for any of the targets"""
+    global _control, _control_read
+    now = time.time()
+    if now - _control_read > CONTROL_REFRESH:
+        try:
+            _control = {k.decode('utf-8'): float(v) for k, v in connection.hgetall(CONTROL_KEY).items()}
+        except Exception as e:
+            logger.error(f"Error reading profiling control: {e}")
+        _control_read = now
+    return any(_control.get(target, 0) > now for target in (*targets, "*"))
+
+@contextmanager
+def profile_job(connection, target, *targets):
+    """Sample and time the enclosed job if profiling is on for it.
+
+    Results are added to the profile for target.
+    """
+    global _timings
+    if not enabled(connection, target, *targets):
+        yield
+        return
+
+    _timings = {}
+    sampler.start(threading.get_ident())
+    try:
+        yield
+    finally:
+        samples = sampler.stop()
+        timings, _timings = _timings, None
+        try:
+            flush(connection, target, samples, timings)
+        except Exception as e:
+            logger.error(f"Error saving profile for {target}: {e}")
+
+def flush(connection, target, samples, timings):
+    pipe = connection.pipeline()
+    for stack, count in samples.items():
+        pipe.hincrby(stacks_key(target), stack, count)
+    pipe.hincrby(functions_key(target), "jobs", 1)
+    for name, (calls, ms) in timings.items():
+        pipe.hincrby(functions_key(target), f"{name}:calls", calls)
+        pipe.hincrbyfloat(functions_key(target), f"{name}:ms", ms)
+    pipe.expire(stacks_key(target), PROFILE_TTL)
+    pipe.expire(functions_key(target), PROFILE_TTL)
+    pipe.execute()
+
+def function_table(connection, target):
+    """[(name, calls, total_ms)] for a target, slowest first"""
+    raw = {k.decode('utf-8'): float(v) for k, v in connection.hgetall(functions_key(target)).items()}
+    names = {key.rsplit(":", 1)[0] for key in raw if key.endswith(":ms")}
+    rows = [(name, int(raw.get(f"{name}:calls", 0)), raw[f"{name}:ms"]) for name in names]
+    return sorted(rows, key=lambda row: row[2], reverse=True), int(raw.get("jobs", 0))
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO,
+                       format='%(asctime)s [%(levelname)s] %(message)s')
+    parser = argparse.ArgumentParser(description='Profile RQ workers without restarting them')
+    parser.add_argument('command', choices=['enable', 'disable', 'dump', 'functions', 'reset'])
+    parser.add_argument('target', help='Worker or queue name, or "*" (enable/disable only)')
+    parser.add_argument('--seconds', type=float, default=60, help='How long to profile for')
+    parser.add_argument('--output', help='File for the collapsed stacks (dump)')
+    args = parser.parse_args()
+
+    conn = create_queue_redis()
+    if args.command == 'enable':
+        conn.hset(CONTROL_KEY, args.target, time.time() + args.seconds)
+        logger.info(f"Profiling {args.target} for {args.seconds:.0f}s")
+    elif args.command == 'disable':
+        conn.hdel(CONTROL_KEY, args.target)
+    elif args.command == 'reset':
+        conn.delete(stacks_key(args.target), functions_key(args.target))
+    elif args.command == 'dump':
+        # One "stack count" line per stack, as flamegraph.pl expects
+        lines = [f"{stack.decode('utf-8')} {int(count)}"
+                 for stack, count in conn.hgetall(stacks_key(args.target)).items()]
+        out = open(args.output, 'w') if args.output else sys.stdout
+        out.write("\n".join(sorted(lines)) + "\n")
+        if args.output:
+            out.close()
+    else:
+        rows, jobs = function_table(conn, args.target)
+        print(f"{jobs} profiled jobs on {args.target}")
+        print(f"{'function':<50} {'calls':>8} {'total ms':>12} {'avg ms':>10}")
+        for name, calls, ms in rows:
+            print(f"{name:<50} {calls:>8} {ms:>12.1f} {ms / max(calls, 1):>10.2f}")
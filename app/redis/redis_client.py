@@ -1,31 +1,66 @@
 # app/redis_client.py
-import redis.asyncio as redis
-from app.config import REDIS_HOST, REDIS_PORT, REDIS_DB
+import logging
+import redis
+import redis.asyncio as aioredis
+from redis.cluster import RedisCluster
+from redis.asyncio.cluster import RedisCluster as AsyncRedisCluster
+from app.config import (REDIS_HOST, REDIS_PORT, REDIS_DB, REDIS_CLUSTER,
+                        QUEUE_REDIS_HOST, QUEUE_REDIS_PORT)
+
+logger = logging.getLogger(__name__)
 
 # Global redis client instance
 _redis_client = None
 
+def create_redis():
+    """New sync client for session and user data, cluster-aware"""
+    if REDIS_CLUSTER:
+        return RedisCluster(host=REDIS_HOST, port=REDIS_PORT)
+    return redis.Redis(host=REDIS_HOST, port=REDIS_PORT, db=REDIS_DB)
+
+def create_queue_redis():
+    """New sync client for RQ queues, worker bookkeeping and activation events.
+
+    Always a standalone connection: RQ wraps its own keys in MULTI/EXEC
+    and cannot run against a cluster.
+    """
+    if REDIS_CLUSTER and (QUEUE_REDIS_HOST, QUEUE_REDIS_PORT) == (REDIS_HOST, REDIS_PORT):
+        logger.warning("REDIS_CLUSTER is set but QUEUE_REDIS_HOST/PORT point at the cluster; "
+                       "RQ needs a standalone Redis")
+    return redis.Redis(host=QUEUE_REDIS_HOST, port=QUEUE_REDIS_PORT, db=REDIS_DB)
+
 async def get_redis_client():
     """Get or create Redis client instance"""
     global _redis_client
     if _redis_client is None:
-        _redis_client = redis.Redis(
-            host=REDIS_HOST,
-            port=REDIS_PORT,
-            db=REDIS_DB,
-            decode_responses=False
-        )
-        
+        if REDIS_CLUSTER:
+            _redis_client = AsyncRedisCluster(
+                host=REDIS_HOST,
+                port=REDIS_PORT,
+                decode_responses=False
+            )
+        else:
+            _redis_client = aioredis.Redis(
+                host=REDIS_HOST,
+                port=REDIS_PORT,
+                db=REDIS_DB,
+                decode_responses=False
+            )
+
         # Test connection
         try:
             await _redis_client.ping()
-        except redis.ConnectionError:
+        except aioredis.ConnectionError:
             # Handle connection error
             raise Exception(f"Could not connect to Redis at {REDIS_HOST}:{REDIS_PORT}")
-            
+
     return _redis_client
 
 async def get_redis_pubsub():
     """Get a new Redis PubSub instance"""
+    if REDIS_CLUSTER:
+        # The async cluster client has no PubSub; a cluster broadcasts
+        # PUBLISH to every node, so subscribing on the startup node is enough
+        return aioredis.Redis(host=REDIS_HOST, port=REDIS_PORT).pubsub()
     client = await get_redis_client()
-    return client.pubsub()
\ No newline at end of file
+    return client.pubsub()
@@ -0,0 +1,109 @@
+# app/redis/review_scheduler.py
+import time
+import struct
+import logging
+from app.redis.redis_client import get_redis_client
+from app.redis import keys
+
+logger = logging.getLogger(__name__)
+
+# First review shortly after a word is introduced
+INITIAL_INTERVAL = 10 * 60
+# Retry a missed word soon
+LAPSE_INTERVAL = 5 * 60
+MAX_INTERVAL = 180 * 24 * 3600
+
+DEFAULT_EASE = 2.5
+MIN_EASE = 1.3
+MAX_EASE = 3.5
+
+# interval seconds, ease * 1000, repetitions, lapses
+_CARD = struct.Struct(">IHHH")
+
+# Attempts on one word racing each other retry rather than lose an update
+MAX_ATTEMPT_RETRIES = 5
+
+# Store a word's next card only if the card it was computed from is still
+# current ("" for none); returns 1 if stored
+_STORE_CARD = """
+local current = redis.call('HGET', KEYS[1], ARGV[1]) or ''
+if current ~= ARGV[2] then
+    return 0
+end
+redis.call('HSET', KEYS[1], ARGV[1], ARGV[3])
+redis.call('ZADD', KEYS[2], ARGV[4], ARGV[1])
+return 1
+"""
+
+def due_key(user_id):
+    """Sorted set of words scored by next-due wall-clock time"""
+    return keys.review_due(user_id)
+
+def card_key(user_id):
+    """Hash of word -> packed scheduling card"""
+    return keys.review_card(user_id)
+
+def pack_card(interval, ease, reps, lapses):
+    return _CARD.pack(int(interval), int(round(ease * 1000)), min(reps, 0xFFFF), min(lapses, 0xFFFF))
+
+def unpack_card(raw):
+    interval, ease, reps, lapses = _CARD.unpack(raw)
+    return interval, ease / 1000.0, reps, lapses
+
+def next_schedule(card, correct):
+    """Apply one attempt to (interval, ease, reps, lapses), SM-2 style"""
+    interval, ease, reps, lapses = card
+    if correct:
+        reps += 1
+        if reps == 1:
+            interval = INITIAL_INTERVAL
+        elif reps == 2:
+            interval = 24 * 3600
+        else:
+            interval = interval * ease
+        ease = min(MAX_EASE, ease + 0.1)
+    else:
+        reps = 0
+        lapses += 1
+        interval = LAPSE_INTERVAL
+        ease = max(MIN_EASE, ease - 0.2)
+    return min(interval, MAX_INTERVAL), ease, reps, lapses
+
+async def schedule_word(user_id, word, now=None):
+    """Add a newly taught word to the review queue if it is not there yet"""
+    redis = await get_redis_client()
+    now = now or time.time()
+    pipe = redis.pipeline()
+    pipe.hsetnx(card_key(user_id), word, pack_card(INITIAL_INTERVAL, DEFAULT_EASE, 0, 0))
+    pipe.zadd(due_key(user_id), {word: now + INITIAL_INTERVAL}, nx=True)
+    await pipe.execute()
+
+async def record_attempt(user_id, word, correct, now=None):
+    """Update a word's interval and ease after the child tries it.
+
+    The card is read, rescheduled and written back as a compare-and-set,
+    so concurrent attempts on the same word each count.
+    """
+    redis = await get_redis_client()
+    now = now or time.time()
+    store = redis.register_script(_STORE_CARD)
+    for _ in range(MAX_ATTEMPT_RETRIES):
+        raw = await redis.hget(card_key(user_id), word)
+        card = unpack_card(raw) if raw else (INITIAL_INTERVAL, DEFAULT_EASE, 0, 0)
+        interval, ease, reps, lapses = next_schedule(card, correct)
+        if await store(keys=[card_key(user_id), due_key(user_id)],
+                       args=[word, raw or b"", pack_card(interval, ease, reps, lapses), now + interval]):
+            break
+    else:
+        logger.warning(f"Review {word} for {user_id}: card kept changing, attempt not recorded")
+        return None
+
+    logger.info(f"Review {word} for {user_id}: correct={correct}, next in {int(interval)}s")
+    return now + interval
+
+async def due_words(user_id, count=1, now=None):
+    """Return up to count words whose review is due, most overdue first"""
+    redis = await get_redis_client()
+    now = now or time.time()
+    words = await redis.zrangebyscore(due_key(user_id), "-inf", now, start=0, num=count)
+    return [word.decode("utf-8") if isinstance(word, bytes) else word for word in words]
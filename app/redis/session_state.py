@@ -0,0 +1,161 @@
+# app/redis/session_state.py
+import struct
+import logging
+from app.redis.redis_client import get_redis_client
+from app.redis import keys
+
+logger = logging.getLogger(__name__)
+
+# Bump when the packed header layout changes
+STATE_FORMAT_VERSION = 1
+
+# Keep dormant engine state for 30 days
+STATE_TTL = 30 * 24 * 3600
+
+# Hash fields: "h" holds the packed header, "w:<word>" one learned word each
+HEADER_FIELD = b"h"
+WORD_PREFIX = b"w:"
+
+# version, flags, age, lesson cursor
+_HEADER = struct.Struct(">BBHI")
+_STR_LEN = struct.Struct(">H")
+
+_FLAG_NAME = 0x01
+_FLAG_GAME = 0x02
+_NO_AGE = 0xFFFF
+_MAX_STR = 0xFFFF
+
+def state_key(user_id):
+    """Redis hash holding a user's engine state"""
+    return keys.engine_state(user_id)
+
+def _pack_str(value):
+    raw = value.encode("utf-8")
+    if len(raw) > _MAX_STR:
+        # Cut on a character boundary rather than lose the whole header
+        raw = raw[:_MAX_STR].decode("utf-8", "ignore").encode("utf-8")
+    return _STR_LEN.pack(len(raw)) + raw
+
+def _unpack_str(data, offset):
+    (length,) = _STR_LEN.unpack_from(data, offset)
+    offset += _STR_LEN.size
+    return data[offset:offset + length].decode("utf-8"), offset + length
+
+def parse_age(value):
+    """An age the header can hold, or None for a missing or unusable one"""
+    try:
+        age = int(value)
+    except (TypeError, ValueError):
+        return None
+    return age if 0 <= age < _NO_AGE else None
+
+class EngineState:
+    """Compact per-user workflow state that tracks what needs persisting"""
+
+    __slots__ = ("child_name", "child_age", "current_game", "lesson_cursor",
+                 "learned_words", "_header_dirty", "_new_words")
+
+    def __init__(self, child_name=None, child_age=None):
+        self.child_name = child_name
+        self.child_age = child_age
+        self.current_game = None
+        self.lesson_cursor = 0
+        self.learned_words = {}
+        self._header_dirty = False
+        self._new_words = []
+
+    def set(self, field, value):
+        """Update a header field, marking it for the next save"""
+        if getattr(self, field) != value:
+            setattr(self, field, value)
+            self._header_dirty = True
+
+    def learn_word(self, word, translation):
+        """Record a learned word, marking it for the next save"""
+        if self.learned_words.get(word) != translation:
+            self.learned_words[word] = translation
+            self._new_words.append(word)
+
+    @property
+    def dirty(self):
+        return self._header_dirty or bool(self._new_words)
+
+    def pack_header(self):
+        """Pack the scalar fields into the versioned binary header"""
+        flags = 0
+        tail = b""
+        if self.child_name is not None:
+            flags |= _FLAG_NAME
+            tail += _pack_str(self.child_name)
+        if self.current_game is not None:
+            flags |= _FLAG_GAME
+            tail += _pack_str(self.current_game)
+        age = parse_age(self.child_age)
+        if age is None:
+            age = _NO_AGE
+        return _HEADER.pack(STATE_FORMAT_VERSION, flags, age, self.lesson_cursor) + tail
+
+    @classmethod
+    def unpack(cls, fields):
+        """Rebuild state from the raw hash returned by HGETALL"""
+        state = cls()
+        header = fields.get(HEADER_FIELD)
+        if header:
+            version, flags, age, cursor = _HEADER.unpack_from(header, 0)
+            if version != STATE_FORMAT_VERSION:
+                raise ValueError(f"Unsupported engine state format: {version}")
+            offset = _HEADER.size
+            if flags & _FLAG_NAME:
+                state.child_name, offset = _unpack_str(header, offset)
+            if flags & _FLAG_GAME:
+                state.current_game, offset = _unpack_str(header, offset)
+            state.child_age = None if age == _NO_AGE else age
+            state.lesson_cursor = cursor
+
+        for field, value in fields.items():
+            if field.startswith(WORD_PREFIX):
+                state.learned_words[field[len(WORD_PREFIX):].decode("utf-8")] = value.decode("utf-8")
+        return state
+
+    def changes(self):
+        """Return only the hash fields that changed since the last save"""
+        mapping = {}
+        if self._header_dirty:
+            mapping[HEADER_FIELD] = self.pack_header()
+        for word in self._new_words:
+            mapping[WORD_PREFIX + word.encode("utf-8")] = self.learned_words[word].encode("utf-8")
+        return mapping
+
+    def mark_clean(self):
+        self._header_dirty = False
+        self._new_words = []
+
+async def load_engine_state(user_id):
+    """Hydrate a user's state with a single HGETALL"""
+    redis = await get_redis_client()
+    fields = await redis.hgetall(state_key(user_id))
+    if not fields:
+        return None
+    try:
+        return EngineState.unpack(fields)
+    except (ValueError, struct.error) as e:
+        logger.error(f"Discarding unreadable engine state for {user_id}: {e}")
+        return None
+
+async def save_engine_state(user_id, state):
+    """Persist only the changed fields of a user's state"""
+    if not state.dirty:
+        return False
+    try:
+        changes = state.changes()
+    except (ValueError, struct.error) as e:
+        logger.error(f"Not saving unpackable engine state for {user_id}: {e}")
+        return False
+    redis = await get_redis_client()
+    key = state_key(user_id)
+    pipe = redis.pipeline()
+    pipe.hset(key, mapping=changes)
+    pipe.expire(key, STATE_TTL)
+    await pipe.execute()
+    state.mark_clean()
+    return True
@@ -0,0 +1,262 @@
+# app/redis/session_store.py
+import sys
+import time
+import logging
+from app.config import SESSION_TTL, SAMPLE_RATE
+from app.redis import keys
+from app.redis.redis_client import create_redis
+
+logger = logging.getLogger(__name__)
+
+# Keep an ended session briefly so monitors can still show it
+ENDED_SESSION_TTL = 60
+
+# Stream entries kept per session: inbound audio chunks and results.
+# Unconsumed audio is bounded by the buffer threshold, far below this.
+STREAM_MAXLEN = 1024
+
+# Compact hash field names
+F_DEVICE = "d"
+F_QUEUE = "q"
+F_START = "st"
+F_ACTIVE = "a"
+F_RESUME_TOKEN = "rt"
+F_LAST_ACTIVITY = "la"
+F_FIRST_CHUNK = "fc"
+F_CHUNKS = "c"
+F_BUFFERS = "b"
+F_BUFFERED_BYTES = "bl"
+F_CURSOR = "cur"
+# Last audio entry of the previous utterance; the current one is
+# transcribed as a whole from here up to F_CURSOR when it ends
+F_UTTERANCE_START = "us"
+F_LAST_CHUNK_SIZE = "lcs"
+F_LAST_BUFFER_SIZE = "lbs"
+F_LAST_BUFFER_DURATION = "lbd"
+F_LAST_BUFFER_TIME = "lbt"
+F_LAST_JOB = "lj"
+F_END_TIME = "et"
+F_END_REASON = "er"
+F_INPUT_RATE = "ir"
+F_DSP_CURSOR = "dc"
+# Filter, gain and leftover samples the DSP front end carries between
+# ticks, packed binary by dsp_frontend
+F_DSP_STATE = "ds"
+# Turn bookkeeping for barge-in: latest turn, last cancelled turn, the
+# turn's end_stream job and the transcription request in flight
+F_TURN = "tn"
+F_CANCELLED_TURN = "ct"
+F_TURN_JOB = "tj"
+F_STT_REQUEST = "sr"
+
+# Readable names for monitors and logs
+FIELD_NAMES = {
+    F_DEVICE: "device_id",
+    F_QUEUE: "queue",
+    F_START: "start_time",
+    F_ACTIVE: "active",
+    F_RESUME_TOKEN: "resume_token",
+    F_LAST_ACTIVITY: "last_activity",
+    F_FIRST_CHUNK: "first_chunk_time",
+    F_CHUNKS: "chunks_processed",
+    F_BUFFERS: "buffers_processed",
+    F_BUFFERED_BYTES: "buffer_size",
+    F_CURSOR: "cursor",
+    F_UTTERANCE_START: "utterance_start",
+    F_LAST_CHUNK_SIZE: "last_chunk_size",
+    F_LAST_BUFFER_SIZE: "last_buffer_size",
+    F_LAST_BUFFER_DURATION: "last_buffer_duration",
+    F_LAST_BUFFER_TIME: "last_buffer_process_time",
+    F_LAST_JOB: "last_job",
+    F_END_TIME: "end_time",
+    F_END_REASON: "end_reason",
+    F_INPUT_RATE: "input_rate",
+    F_DSP_CURSOR: "dsp_cursor",
+    F_DSP_STATE: "dsp_state",
+    F_TURN: "turn",
+    F_CANCELLED_TURN: "cancelled_turn",
+    F_TURN_JOB: "turn_job",
+    F_STT_REQUEST: "stt_request",
+}
+
+# Stream entry types
+ENTRY_AUDIO = b"a"
+ENTRY_RESULT = b"r"
+# Inbound audio still waiting for the DSP front end
+ENTRY_RAW = b"i"
+
+# Sessions with raw audio the DSP front end has not processed yet
+DSP_PENDING_KEY = "dsp:pending"
+
+# Per-session keys from before consolidation, reported by the collector
+LEGACY_PATTERNS = (
+    "session:info:*", "session:state:*", "stats:*", "metadata:*",
+    "buffer:*", "last_job:*", "audio:*", "result:*",
+)
+
+session_key = keys.session
+stream_key = keys.session_stream
+
+def create(redis_conn, session_id, device_id, queue_name, resume_token, input_rate=SAMPLE_RATE):
+    """Write the initial session hash"""
+    key = session_key(session_id)
+    pipe = redis_conn.pipeline()
+    pipe.hset(key, mapping={
+        F_DEVICE: device_id,
+        F_QUEUE: queue_name,
+        F_START: round(time.time(), 3),
+        F_ACTIVE: 1,
+        F_RESUME_TOKEN: resume_token,
+        F_CHUNKS: 0,
+        F_BUFFERS: 0,
+        F_BUFFERED_BYTES: 0,
+        F_INPUT_RATE: input_rate,
+    })
+    pipe.expire(key, SESSION_TTL)
+    pipe.execute()
+
+def load(redis_conn, session_id):
+    """Return the session hash decoded to readable names, or None"""
+    raw = redis_conn.hgetall(session_key(session_id))
+    if not raw:
+        return None
+    return decode(raw)
+
+def decode(raw):
+    """Decode a raw session hash, converting numeric fields"""
+    data = {}
+    for k, v in raw.items():
+        field = k.decode('utf-8') if isinstance(k, bytes) else k
+        if field == F_DSP_STATE:
+            # Binary, and of no use to monitors
+            continue
+        value = v.decode('utf-8') if isinstance(v, bytes) else v
+        if field not in (F_DEVICE, F_QUEUE, F_RESUME_TOKEN, F_CURSOR, F_UTTERANCE_START, F_DSP_CURSOR, F_LAST_JOB,
+                         F_END_REASON, F_TURN_JOB, F_STT_REQUEST):
+            try:
+                value = float(value)
+            except ValueError:
+                pass
+        data[FIELD_NAMES.get(field, field)] = value
+    return data
+
+def append_audio(redis_conn, session_id, audio_bytes, pipe=None):
+    """Add an inbound chunk to the session stream; returns the pipeline if given one"""
+    own = pipe is None
+    pipe = pipe or redis_conn.pipeline()
+    pipe.xadd(stream_key(session_id), {"t": ENTRY_AUDIO, "d": audio_bytes},
+              maxlen=STREAM_MAXLEN, approximate=True)
+    pipe.expire(stream_key(session_id), SESSION_TTL)
+    if own:
+        return pipe.execute()[0].decode('utf-8')
+    return pipe
+
+def append_raw(redis_conn, session_id, audio_bytes):
+    """Add an inbound chunk for the DSP front end and flag the session for its next tick"""
+    pipe = redis_conn.pipeline()
+    pipe.xadd(stream_key(session_id), {"t": ENTRY_RAW, "d": audio_bytes},
+              maxlen=STREAM_MAXLEN, approximate=True)
+    pipe.expire(stream_key(session_id), SESSION_TTL)
+    pipe.sadd(DSP_PENDING_KEY, session_id)
+    pipe.execute()
+
+def read_pending_audio(redis_conn, session_id):
+    """Return (pcm_bytes, last_entry_id) for audio not yet consumed.
+
+    last_entry_id is the last audio entry read, so moving the cursor to
+    it never skips entries this read did not consume.
+    """
+    cursor = redis_conn.hget(session_key(session_id), F_CURSOR)
+    start = f"({cursor.decode('utf-8')}" if cursor else "-"
+    chunks = []
+    last_id = None
+    for entry_id, fields in redis_conn.xrange(stream_key(session_id), min=start, max="+"):
+        if fields.get(b"t") == ENTRY_AUDIO:
+            chunks.append(fields[b"d"])
+            last_id = entry_id
+    return b"".join(chunks), last_id
+
+def read_utterance(redis_conn, session_id):
+    """Return (pcm_bytes, last_entry_id) for the current utterance's consumed audio.
+
+    That is the audio after F_UTTERANCE_START up to F_CURSOR, i.e. every
+    buffer processed since the previous utterance ended.
+    """
+    start, cursor = redis_conn.hmget(session_key(session_id), F_UTTERANCE_START, F_CURSOR)
+    if cursor is None or start == cursor:
+        return b"", None
+    start = f"({start.decode('utf-8')}" if start else "-"
+    chunks = [fields[b"d"] for _, fields in redis_conn.xrange(stream_key(session_id), min=start, max=cursor)
+              if fields.get(b"t") == ENTRY_AUDIO]
+    return b"".join(chunks), cursor
+
+def entry_order(entry_id):
+    """Sortable form of a stream entry id"""
+    if isinstance(entry_id, bytes):
+        entry_id = entry_id.decode('utf-8')
+    ms, seq = entry_id.split("-")
+    return int(ms), int(seq)
+
+def add_result(redis_conn, session_id, result, pipe=None):
+    """Record a processing result in the session stream"""
+    own = pipe is None
+    pipe = pipe or redis_conn.pipeline()
+    fields = {"t": ENTRY_RESULT}
+    fields.update({k: str(v) for k, v in result.items() if k not in ("session_id", "device_id")})
+    pipe.xadd(stream_key(session_id), fields, maxlen=STREAM_MAXLEN, approximate=True)
+    if own:
+        pipe.execute()
+    return pipe
+
+def reclaim(redis_conn, session_id, linger=ENDED_SESSION_TTL):
+    """Release everything an ended session holds.
+
+    The hash and stream linger briefly for monitors; resume, detach and
+    directory keys go immediately.
+    """
+    device_id, token = redis_conn.hmget(session_key(session_id), F_DEVICE, F_RESUME_TOKEN)
+    pipe = redis_conn.pipeline()
+    pipe.expire(session_key(session_id), linger)
+    pipe.expire(stream_key(session_id), linger)
+    pipe.delete(keys.session_detached(session_id), keys.conn_session(session_id))
+    if device_id and token:
+        pipe.delete(keys.session_resume(device_id.decode('utf-8'), token.decode('utf-8')))
+    pipe.execute()
+
+def collect_leaked_keys(redis_conn, delete=False):
+    """Find per-session keys with no live session behind them.
+
+    Returns {pattern: count}. Streams without a hash, legacy per-session
+    keys and keys with no TTL are all counted as leaks.
+    """
+    leaked = {}
+
+    for key in redis_conn.scan_iter(match="sess:*:x", count=500):
+        session_id = key.decode('utf-8')[len("sess:"):-len(":x")]
+        if not redis_conn.exists(session_key(session_id)):
+            leaked["sess:*:x"] = leaked.get("sess:*:x", 0) + 1
+            if delete:
+                redis_conn.delete(key)
+
+    for key in redis_conn.scan_iter(match="sess:*", count=500, _type="hash"):
+        if redis_conn.ttl(key) == -1:
+            leaked["sess:* (no ttl)"] = leaked.get("sess:* (no ttl)", 0) + 1
+            if delete:
+                redis_conn.expire(key, SESSION_TTL)
+
+    for pattern in LEGACY_PATTERNS:
+        for key in redis_conn.scan_iter(match=pattern, count=500):
+            leaked[pattern] = leaked.get(pattern, 0) + 1
+            if delete:
+                redis_conn.delete(key)
+
+    for pattern, count in leaked.items():
+        logger.warning(f"Leaked session keys: {pattern} x{count}")
+    return leaked
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO,
+                       format='%(asctime)s [%(levelname)s] %(message)s')
+    leaked = collect_leaked_keys(create_redis(), delete="--delete" in sys.argv)
+    if not leaked:
+        logger.info("No leaked session keys found")
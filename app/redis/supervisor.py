@@ -0,0 +1,182 @@
+# app/redis/supervisor.py
+import os
+import time
+import logging
+import threading
+from app.config import HEARTBEAT_INTERVAL, STALL_TIMEOUT, RESTART_BACKOFF_MAX
+
+logger = logging.getLogger(__name__)
+
+# A worker missing this many heartbeats counts as hung
+MISSED_HEARTBEATS = 3
+HEARTBEAT_TTL = int(HEARTBEAT_INTERVAL * MISSED_HEARTBEATS) + 1
+
+RESTART_BACKOFF_BASE = 1.0
+# Healthy this long and a worker's backoff starts over
+STABLE_AFTER = 60
+
+STATS_KEY = "supervisor:stats"
+
+def heartbeat_key(queue_name):
+    return f"worker:heartbeat:{queue_name}"
+
+def marker_key(queue_name):
+    """Claims a queue for one worker; expires soon after heartbeats stop"""
+    return f"worker:{queue_name}"
+
+class Heartbeat(threading.Thread):
+    """Background thread that reports a worker process is alive"""
+
+    def __init__(self, redis_conn, queue_name):
+        super().__init__(name=f"heartbeat-{queue_name}", daemon=True)
+        self.redis_conn = redis_conn
+        self.queue_name = queue_name
+
+    def run(self):
+        key = heartbeat_key(self.queue_name)
+        while True:
+            try:
+                pipe = self.redis_conn.pipeline()
+                pipe.hset(key, mapping={"pid": os.getpid(), "ts": time.time()})
+                pipe.expire(key, HEARTBEAT_TTL)
+                pipe.set(marker_key(self.queue_name), os.getpid(), ex=HEARTBEAT_TTL)
+                pipe.execute()
+            except Exception as e:
+                logger.error(f"Heartbeat for {self.queue_name} failed: {e}")
+            time.sleep(HEARTBEAT_INTERVAL)
+
+def job_started(redis_conn, queue_name, job_id):
+    """Record the running job so the supervisor can spot stalls"""
+    redis_conn.hset(heartbeat_key(queue_name), mapping={"job_id": job_id, "job_started": time.time()})
+
+def job_finished(redis_conn, queue_name):
+    redis_conn.hset(heartbeat_key(queue_name), mapping={"job_id": "", "job_started": 0})
+
+class WorkerRecord:
+    """Supervisor bookkeeping for one queue's worker"""
+
+    __slots__ = ("process", "started", "failures", "restarts", "restart_at", "down_since")
+
+    def __init__(self, process):
+        self.process = process
+        self.started = time.time()
+        self.failures = 0
+        self.restarts = 0
+        self.restart_at = None
+        self.down_since = None
+
+class Supervisor:
+    """Restarts individual workers that die, hang or stall, with exponential backoff"""
+
+    def __init__(self, redis_conn, launch):
+        self.redis_conn = redis_conn
+        # launch(queue_name) starts a worker process and returns it
+        self.launch = launch
+        self.records = {}
+
+    def __contains__(self, queue_name):
+        return queue_name in self.records
+
+    def watch(self, queue_name, process):
+        self.records[queue_name] = WorkerRecord(process)
+
+    def read_heartbeats(self, queue_names):
+        """Fetch heartbeats for many workers in one round trip"""
+        pipe = self.redis_conn.pipeline()
+        for queue_name in queue_names:
+            pipe.hgetall(heartbeat_key(queue_name))
+        return {
+            queue_name: {k.decode('utf-8'): v.decode('utf-8') for k, v in raw.items()}
+            for queue_name, raw in zip(queue_names, pipe.execute())
+        }
+
+    def diagnose(self, queue_name, record, heartbeat, now):
+        """Return why a worker needs restarting, or None if it is healthy"""
+        if not record.process.is_alive():
+            return "died"
+
+        # Give a fresh process time to send its first heartbeat
+        if now - record.started < HEARTBEAT_TTL:
+            return None
+
+        if not heartbeat or heartbeat.get("pid") != str(record.process.pid):
+            return "no heartbeat"
+        if now - float(heartbeat.get("ts", 0)) > HEARTBEAT_TTL:
+            return "hung"
+
+        job_started = float(heartbeat.get("job_started") or 0)
+        if job_started and now - job_started > STALL_TIMEOUT:
+            return f"job {heartbeat.get('job_id')} stalled for {int(now - job_started)}s"
+        return None
+
+    def check(self):
+        """Inspect every worker once; call this from the manager loop"""
+        now = time.time()
+        heartbeats = self.read_heartbeats(list(self.records))
+        for queue_name, record in list(self.records.items()):
+            if record.restart_at is not None:
+                if now >= record.restart_at:
+                    self.restart(queue_name, record)
+                continue
+
+            heartbeat = heartbeats.get(queue_name, {})
+            reason = self.diagnose(queue_name, record, heartbeat, now)
+            if reason:
+                self.fail(queue_name, record, reason, now)
+                continue
+
+            if record.down_since is not None and heartbeat.get("pid") == str(record.process.pid):
+                self.recovered(queue_name, record, now)
+
+            if record.failures and now - record.started > STABLE_AFTER:
+                record.failures = 0
+
+    def fail(self, queue_name, record, reason, now):
+        """Stop a broken worker and schedule its restart"""
+        process = record.process
+        logger.warning(f"Worker for {queue_name} (PID: {process.pid}) {reason}, restarting")
+        if process.is_alive():
+            process.terminate()
+            process.join(2)
+            if process.is_alive():
+                process.kill()
+                process.join(1)
+
+        backoff = min(RESTART_BACKOFF_MAX, RESTART_BACKOFF_BASE * (2 ** record.failures))
+        record.failures += 1
+        record.restart_at = now + backoff
+        if record.down_since is None:
+            record.down_since = now
+
+        pipe = self.redis_conn.pipeline()
+        pipe.hincrby(STATS_KEY, "restarts", 1)
+        pipe.hincrby(STATS_KEY, f"restarts:{queue_name}", 1)
+        pipe.hset(STATS_KEY, f"last_failure:{queue_name}", reason)
+        pipe.execute()
+        logger.info(f"Restarting worker for {queue_name} in {backoff:.1f}s")
+
+    def restart(self, queue_name, record):
+        # Reclaim the queue for the new process
+        self.redis_conn.set(marker_key(queue_name), "starting", ex=HEARTBEAT_TTL)
+        record.process = self.launch(queue_name)
+        record.started = time.time()
+        record.restart_at = None
+        record.restarts += 1
+        logger.info(f"Restarted worker for {queue_name} with PID: {record.process.pid}")
+
+    def recovered(self, queue_name, record, now):
+        """First heartbeat from a restarted worker"""
+        recover_ms = (now - record.down_since) * 1000
+        record.down_since = None
+
+        pipe = self.redis_conn.pipeline()
+        pipe.hincrby(STATS_KEY, "recoveries", 1)
+        pipe.hincrbyfloat(STATS_KEY, "recover_ms_total", recover_ms)
+        pipe.hset(STATS_KEY, f"recover_ms:{queue_name}", round(recover_ms, 1))
+        pipe.execute()
+        logger.info(f"Worker for {queue_name} recovered in {recover_ms:.0f} ms")
+
+    def stop_all(self):
+        for record in self.records.values():
+            if record.process.is_alive():
+                record.process.terminate()
@@ -0,0 +1,260 @@
+# app/redis/transcription.py
+import json
+import time
+import uuid
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from app.config import (TRANSCRIPTION_BACKEND, STT_LOCAL_MODEL, STT_MAX_BATCH, STT_MAX_WAIT_MS,
+                        STT_TIMEOUT, OPENAI_API_KEY, SAMPLE_RATE, HEARTBEAT_INTERVAL)
+from app.redis.redis_client import create_redis, create_queue_redis
+from app.redis.supervisor import Heartbeat, heartbeat_key
+from app.utterance_buffer import WavFile
+
+logging.basicConfig(level=logging.INFO,
+                   format='%(asctime)s [%(levelname)s] %(message)s')
+logger = logging.getLogger(__name__)
+
+# Name the supervisor knows the batcher process by
+STT_WORKER = "transcription"
+
+QUEUE_KEY = "stt:queue"
+STATS_KEY = "stt:stats"
+# Requests and results are dropped if nobody picks them up in time
+REQUEST_TTL = 60
+
+class TranscriptionUnavailable(Exception):
+    """No batcher is running to take transcription requests"""
+
+def request_key(request_id):
+    return f"stt:req:{request_id}"
+
+def result_key(request_id):
+    return f"stt:result:{request_id}"
+
+# Backends take a batch of PCM utterances and return one transcript each
+
+class StubBackend:
+    """No model: empty transcripts after a simulated per batch and per item cost"""
+
+    BATCH_MS = 40
+    ITEM_MS = 2
+
+    def transcribe_batch(self, utterances):
+        time.sleep((self.BATCH_MS + self.ITEM_MS * len(utterances)) / 1000)
+        return ["" for _ in utterances]
+
+class OpenAIBackend:
+    """Whisper API; it takes one file per call, so a batch is sent concurrently"""
+
+    def __init__(self):
+        from openai import OpenAI
+        self.client = OpenAI(api_key=OPENAI_API_KEY or None)
+        self.executor = ThreadPoolExecutor(max_workers=STT_MAX_BATCH)
+
+    def transcribe_one(self, pcm):
+        # Header and PCM are streamed to the upload in turn, without a joined copy
+        response = self.client.audio.transcriptions.create(
+            model="whisper-1",
+            file=WavFile(pcm),
+            response_format="text",
+            language="en"
+        )
+        return response.strip()
+
+    def transcribe_batch(self, utterances):
+        return list(self.executor.map(self.transcribe_one, utterances))
+
+class LocalBackend:
+    """Whisper on the CPU through transformers, one forward pass per batch"""
+
+    MODEL_RATE = 16000
+
+    def __init__(self):
+        # Optional dependencies, only needed for this backend
+        import numpy as np
+        from transformers import pipeline
+        self.np = np
+        self.pipe = pipeline("automatic-speech-recognition", model=STT_LOCAL_MODEL, device="cpu")
+
+    def to_model_rate(self, pcm):
+        np = self.np
+        samples = np.frombuffer(pcm, dtype="<i2").astype(np.float32) / 32768.0
+        factor = self.MODEL_RATE / SAMPLE_RATE
+        positions = np.arange(int(len(samples) * factor)) / factor
+        return np.interp(positions, np.arange(len(samples)), samples).astype(np.float32)
+
+    def transcribe_batch(self, utterances):
+        inputs = [{"raw": self.to_model_rate(pcm), "sampling_rate": self.MODEL_RATE} for pcm in utterances]
+        outputs = self.pipe(inputs, batch_size=len(inputs))
+        return [output["text"].strip() for output in outputs]
+
+BACKENDS = {
+    "stub": StubBackend,
+    "openai": OpenAIBackend,
+    "local": LocalBackend,
+}
+
+def create_backend(name=TRANSCRIPTION_BACKEND):
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown transcription backend {name!r}, expected one of {', '.join(BACKENDS)}")
+    return BACKENDS[name]()
+
+_queue_conn = None
+# When the batcher's heartbeat was last seen
+_batcher_seen = 0.0
+
+def require_batcher():
+    """Raise TranscriptionUnavailable unless the batcher is heartbeating.
+
+    A request nobody serves would otherwise wait out STT_TIMEOUT. The
+    heartbeat is checked at most once per HEARTBEAT_INTERVAL.
+    """
+    global _queue_conn, _batcher_seen
+    if time.time() - _batcher_seen < HEARTBEAT_INTERVAL:
+        return
+    if _queue_conn is None:
+        _queue_conn = create_queue_redis()
+    if not _queue_conn.exists(heartbeat_key(STT_WORKER)):
+        raise TranscriptionUnavailable(
+            "No transcription batcher is running, start it with python -m app.redis.transcription")
+    _batcher_seen = time.time()
+
+def transcribe(redis_conn, session_id, pcm, timeout=STT_TIMEOUT, request_id=None):
+    """Submit an utterance to the batcher and wait for its transcript.
+
+    Returns None if transcription is off, failed, timed out or was
+    cancelled through request_id. Raises TranscriptionUnavailable if no
+    batcher is running.
+    """
+    if TRANSCRIPTION_BACKEND == "off" or not pcm:
+        return None
+    require_batcher()
+
+    request_id = request_id or new_request_id()
+    pipe = redis_conn.pipeline()
+    pipe.hset(request_key(request_id), mapping={"s": session_id, "p": pcm, "t": time.time()})
+    pipe.expire(request_key(request_id), REQUEST_TTL)
+    pipe.rpush(QUEUE_KEY, request_id)
+    pipe.execute()
+
+    reply = redis_conn.blpop(result_key(request_id), timeout=timeout)
+    if reply is None:
+        logger.warning(f"Transcription timed out for session {session_id}")
+        return None
+    result = json.loads(reply[1])
+    if result.get("cancelled"):
+        logger.info(f"Transcription cancelled for session {session_id}")
+        return None
+    if "error" in result:
+        logger.error(f"Transcription failed for session {session_id}: {result['error']}")
+        return None
+    return result["text"]
+
+def new_request_id():
+    return uuid.uuid4().hex
+
+def cancel(redis_conn, request_id):
+    """Abandon a transcription request and wake its caller.
+
+    Returns True if the batcher had not picked the request up yet, so
+    its transcription was skipped.
+    """
+    pipe = redis_conn.pipeline()
+    pipe.delete(request_key(request_id))
+    pipe.rpush(result_key(request_id), json.dumps({"cancelled": True}))
+    pipe.expire(result_key(request_id), REQUEST_TTL)
+    return pipe.execute()[0] > 0
+
+class DynamicBatcher:
+    """Collects utterances across sessions and transcribes them together.
+
+    A batch goes out once it holds max_batch requests or its first request
+    has waited max_wait_ms, whichever comes first.
+    """
+
+    def __init__(self, redis_conn, backend, max_batch=STT_MAX_BATCH, max_wait_ms=STT_MAX_WAIT_MS):
+        self.redis_conn = redis_conn
+        self.backend = backend
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+
+    def collect(self):
+        """Block for the first request, then gather more until the batch closes"""
+        first = self.redis_conn.blpop(QUEUE_KEY, timeout=1)
+        if first is None:
+            return []
+        request_ids = [first[1]]
+        closes = time.time() + self.max_wait
+
+        while len(request_ids) < self.max_batch:
+            more = self.redis_conn.lpop(QUEUE_KEY, self.max_batch - len(request_ids))
+            if more:
+                request_ids.extend(more)
+                continue
+            remaining = closes - time.time()
+            if remaining <= 0:
+                break
+            time.sleep(min(remaining, 0.005))
+        return [request_id.decode('utf-8') for request_id in request_ids]
+
+    def dispatch(self, request_ids):
+        """Transcribe one batch and hand each result back to its caller"""
+        pipe = self.redis_conn.pipeline()
+        for request_id in request_ids:
+            pipe.hgetall(request_key(request_id))
+            pipe.delete(request_key(request_id))
+        requests = pipe.execute()[0::2]
+
+        # Requests whose caller already gave up have expired
+        batch = [(request_id, request) for request_id, request in zip(request_ids, requests) if request]
+        if not batch:
+            return
+        dispatched = time.time()
+        oldest = min(float(request[b"t"]) for _, request in batch)
+
+        try:
+            texts = self.backend.transcribe_batch([request[b"p"] for _, request in batch])
+            replies = [json.dumps({"text": text, "batch": len(batch)}) for text in texts]
+        except Exception as e:
+            logger.error(f"Transcription batch of {len(batch)} failed: {e}")
+            replies = [json.dumps({"error": str(e)})] * len(batch)
+        backend_ms = (time.time() - dispatched) * 1000
+
+        pipe = self.redis_conn.pipeline()
+        for (request_id, _), reply in zip(batch, replies):
+            pipe.rpush(result_key(request_id), reply)
+            pipe.expire(result_key(request_id), REQUEST_TTL)
+        pipe.execute()
+        return len(batch), (dispatched - oldest) * 1000, backend_ms
+
+    def record(self, size, wait_ms, backend_ms):
+        pipe = self.redis_conn.pipeline()
+        pipe.hincrby(STATS_KEY, "batches", 1)
+        pipe.hincrby(STATS_KEY, "items", size)
+        pipe.hincrbyfloat(STATS_KEY, "occupancy", size / self.max_batch)
+        pipe.hincrbyfloat(STATS_KEY, "wait_ms", wait_ms)
+        pipe.hincrbyfloat(STATS_KEY, "backend_ms", backend_ms)
+        pipe.hset(STATS_KEY, mapping={"max_batch": self.max_batch, "max_wait_ms": self.max_wait * 1000})
+        pipe.execute()
+
+def run():
+    """Serve transcription requests until stopped"""
+    batcher = DynamicBatcher(create_redis(), create_backend())
+    Heartbeat(create_queue_redis(), STT_WORKER).start()
+    logger.info(f"Transcription batcher running ({TRANSCRIPTION_BACKEND} backend, "
+                f"batch {STT_MAX_BATCH}, wait {STT_MAX_WAIT_MS:.0f} ms)")
+
+    while True:
+        try:
+            request_ids = batcher.collect()
+            if not request_ids:
+                continue
+            dispatched = batcher.dispatch(request_ids)
+            if dispatched:
+                batcher.record(*dispatched)
+        except Exception as e:
+            logger.error(f"Transcription batcher error: {e}")
+            time.sleep(1)
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,111 @@
+# app/redis/turns.py
+import logging
+from rq.job import Job, JobStatus
+from rq.command import send_stop_job_command
+from rq.exceptions import NoSuchJobError, InvalidJobOperation
+from app.config import WORKER_EXECUTION_MODE
+from app.redis import session_store, transcription, job_scheduler
+
+logger = logging.getLogger(__name__)
+
+# Counts of cancelled turns and of the work their cancellation avoided
+STATS_KEY = "turn:stats"
+
+# A turn is the work answering one end_stream: its processing job, the
+# transcription request and any output routed back to the device. New
+# speech, a newer end_stream or a disconnect cancels the turn in flight.
+
+# Forget a turn's transcription request unless a newer one replaced it
+_RELEASE_REQUEST = """
+if redis.call('HGET', KEYS[1], ARGV[1]) == ARGV[2] then
+    return redis.call('HDEL', KEYS[1], ARGV[1])
+end
+return 0
+"""
+
+def begin_turn(redis_conn, session_id):
+    """Open the next turn for a session; returns its number"""
+    return redis_conn.hincrby(session_store.session_key(session_id), session_store.F_TURN, 1)
+
+def track_job(redis_conn, session_id, job_id):
+    """Remember the job answering the current turn, so it can be stopped"""
+    redis_conn.hset(session_store.session_key(session_id), session_store.F_TURN_JOB, job_id)
+
+def track_request(redis_conn, session_id, request_id):
+    """Remember the turn's transcription request, so a barge-in can drop it"""
+    redis_conn.hset(session_store.session_key(session_id), session_store.F_STT_REQUEST, request_id)
+
+def release_request(redis_conn, session_id, request_id):
+    """The turn's transcription returned; there is nothing left to drop"""
+    release = redis_conn.register_script(_RELEASE_REQUEST)
+    release(keys=[session_store.session_key(session_id)], args=[session_store.F_STT_REQUEST, request_id])
+
+def is_cancelled(redis_conn, session_id, turn):
+    """True once the given turn, or a later one, has been cancelled"""
+    if turn is None:
+        return False
+    cancelled = redis_conn.hget(session_store.session_key(session_id), session_store.F_CANCELLED_TURN)
+    return int(cancelled or 0) >= turn
+
+def cancel_turn(redis_conn, queue_conn, session_id, reason):
+    """Abort the session's turn in flight, if any.
+
+    Queued jobs are cancelled, a running job's work-horse is killed in
+    fork mode (in-process jobs stop at their next check) and a pending
+    transcription is dropped from the batch. Returns the cancelled turn
+    number, or None if nothing was in flight.
+    """
+    key = session_store.session_key(session_id)
+    turn, cancelled, job_id, stt_request = redis_conn.hmget(
+        key, session_store.F_TURN, session_store.F_CANCELLED_TURN,
+        session_store.F_TURN_JOB, session_store.F_STT_REQUEST
+    )
+    if turn is None or int(cancelled or 0) >= int(turn):
+        return None
+    turn = int(turn)
+    redis_conn.hset(key, session_store.F_CANCELLED_TURN, turn)
+
+    avoided = {}
+    if job_id:
+        outcome = stop_job(queue_conn, job_id.decode('utf-8'))
+        if outcome:
+            avoided[outcome] = 1
+    if stt_request and transcription.cancel(redis_conn, stt_request.decode('utf-8')):
+        avoided["stt_skipped"] = 1
+
+    # Nothing left to stop means the answer was already delivered
+    if not avoided:
+        return None
+    logger.info(f"Cancelled turn {turn} of session {session_id} ({reason}): {', '.join(avoided)}")
+    record(redis_conn, reason, avoided)
+    return turn
+
+def stop_job(queue_conn, job_id):
+    """Cancel or stop a job; returns what was done, or None if it had finished"""
+    if job_scheduler.local_transport is not None:
+        return job_scheduler.local_transport.stop(job_id)
+    try:
+        job = Job.fetch(job_id, connection=queue_conn)
+        status = job.get_status()
+        if status in (JobStatus.QUEUED, JobStatus.DEFERRED, JobStatus.SCHEDULED):
+            job.cancel()
+            return "jobs_cancelled"
+        if status == JobStatus.STARTED:
+            if WORKER_EXECUTION_MODE != "fork":
+                # No work-horse to kill; the job sees the cancelled turn
+                return "jobs_interrupted"
+            send_stop_job_command(queue_conn, job_id)
+            return "jobs_stopped"
+    except (NoSuchJobError, InvalidJobOperation):
+        pass
+    except Exception as e:
+        logger.error(f"Error stopping job {job_id}: {e}")
+    return None
+
+def record(redis_conn, reason, avoided):
+    pipe = redis_conn.pipeline()
+    pipe.hincrby(STATS_KEY, "cancelled", 1)
+    pipe.hincrby(STATS_KEY, f"cancelled:{reason}", 1)
+    for outcome, count in avoided.items():
+        pipe.hincrby(STATS_KEY, outcome, count)
+    pipe.execute()
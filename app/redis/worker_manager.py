@@ -1,24 +1,75 @@
 # worker_manager.py
 import os
 import time
-import redis
 import json
 import logging
 import signal
 import sys
-from rq import Worker, Queue
-from multiprocessing import Process
+from rq import Worker, SimpleWorker, Queue
+from multiprocessing import Process, Pipe
+from app.config import (WORKER_ACTIVATION_CHANNEL, WARM_POOL_SIZE, QUEUE_POLL_INTERVAL,
+                        WORKER_EXECUTION_MODE, DSP_FRONTEND, TRANSCRIPTION_BACKEND, PIPELINE_TRANSPORT)
+from app.redis.redis_client import create_queue_redis
+from app.redis.job_scheduler import (EarliestDeadlineMixin, record_completion, worker_queues,
+                                     SHARED_WORKER)
+from app.redis import profiler
+from app.redis.dsp_frontend import DSP_WORKER, run as run_dsp_frontend
+from app.redis.transcription import STT_WORKER, run as run_transcription
+from app.redis.supervisor import (Supervisor, Heartbeat, HEARTBEAT_TTL, marker_key,
+                                  job_started, job_finished)
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, 
                    format='%(asctime)s [%(levelname)s] %(message)s')
 logger = logging.getLogger(__name__)
 
-# Redis connection
-redis_conn = redis.Redis(host='localhost', port=6379, db=0)
+# Redis connection for queues, worker bookkeeping and activation events
+redis_conn = create_queue_redis()
 
-# Process tracking
-worker_processes = {}
+
+# Idle pre-forked workers waiting for a queue assignment
+warm_pool = []
+
+def overhead_key(queue_name):
+    """Hash of cumulative job timings for a queue"""
+    return f"worker:overhead:{queue_name}"
+
+class TimedWorkerMixin:
+    """Records how much of each job's wall time is worker overhead"""
+    
+    # Name the supervisor knows this worker by, when it serves several queues
+    supervised_name = None
+    
+    def execute_job(self, job, queue):
+        start = time.perf_counter()
+        job_started(self.connection, self.supervised_name or queue.name, job.id)
+        try:
+            return super().execute_job(job, queue)
+        finally:
+            job_finished(self.connection, self.supervised_name or queue.name)
+            record_completion(self.connection, job)
+            pipe = self.connection.pipeline()
+            pipe.hincrby(overhead_key(queue.name), "jobs", 1)
+            pipe.hincrbyfloat(overhead_key(queue.name), "total_ms", (time.perf_counter() - start) * 1000)
+            pipe.hset(overhead_key(queue.name), "mode", WORKER_EXECUTION_MODE)
+            pipe.execute()
+    
+    def perform_job(self, job, queue):
+        # Runs in the work-horse in fork mode, in this process otherwise
+        start = time.perf_counter()
+        try:
+            # Sampled and timed while profiling is switched on for this queue or worker
+            with profiler.profile_job(self.connection, queue.name, self.supervised_name or queue.name):
+                return super().perform_job(job, queue)
+        finally:
+            self.connection.hincrbyfloat(overhead_key(queue.name), "perform_ms",
+                                         (time.perf_counter() - start) * 1000)
+
+class TimedForkWorker(EarliestDeadlineMixin, TimedWorkerMixin, Worker):
+    """Forks a work-horse per job for crash isolation"""
+
+class TimedInProcessWorker(EarliestDeadlineMixin, TimedWorkerMixin, SimpleWorker):
+    """Runs jobs in this long-lived process, reusing imports and connections"""
 
 def start_worker_for_queue(queue_name):
     """Start a dedicated worker for a specific queue"""
@@ -26,13 +77,24 @@ def start_worker_for_queue(queue_name):
         logger.info(f"Starting worker for queue: {queue_name}")
         
         # Create a new Redis connection
-        worker_redis = redis.Redis(host='localhost', port=6379, db=0)
+        worker_redis = create_queue_redis()
         
-        # Create queue with explicit connection
-        queue = Queue(queue_name, connection=worker_redis)
+        # Create queues with explicit connection; the shared worker serves
+        # every job class, earliest deadline first
+        queues = [Queue(name, connection=worker_redis) for name in worker_queues(queue_name)]
+        
+        # Report liveness to the supervisor
+        Heartbeat(create_queue_redis(), queue_name).start()
         
         # Create and start the worker
-        worker = Worker([queue], connection=worker_redis)
+        if WORKER_EXECUTION_MODE == "inprocess":
+            # Import job code once; a crash takes the process down and the
+            # manager restarts it instead of paying for a fork per job
+            import app.redis.audio_processor  # noqa: F401
+            worker = TimedInProcessWorker(queues, connection=worker_redis)
+        else:
+            worker = TimedForkWorker(queues, connection=worker_redis)
+        worker.supervised_name = queue_name
         
         # Set up signal handlers for graceful shutdown
         def graceful_shutdown(signum, frame):
@@ -44,13 +106,85 @@ def start_worker_for_queue(queue_name):
         signal.signal(signal.SIGTERM, graceful_shutdown)
         
         # Start working
-        logger.info(f"Worker listening on queue: {queue_name}")
+        logger.info(f"Worker listening on queues: {', '.join(q.name for q in queues)} "
+                    f"({WORKER_EXECUTION_MODE} mode)")
         worker.work(burst=False)  # Run continuously
     
     except Exception as e:
         logger.error(f"Error in worker process for {queue_name}: {e}")
         sys.exit(1)
 
+def warm_worker(conn):
+    """Pre-forked worker: import job code up front, then wait for a queue"""
+    # Pay the import cost before any device is waiting
+    import app.redis.audio_processor  # noqa: F401
+    
+    queue_name = conn.recv()
+    conn.close()
+    start_worker_for_queue(queue_name)
+
+def fork_warm_worker():
+    """Add one idle worker to the warm pool"""
+    parent_conn, child_conn = Pipe()
+    process = Process(target=warm_worker, args=(child_conn,), name="worker-warm")
+    process.daemon = True
+    process.start()
+    warm_pool.append((process, parent_conn))
+
+def fill_warm_pool():
+    """Top the warm pool back up to its configured size"""
+    # Drop idle workers that died before being used
+    warm_pool[:] = [(p, conn) for p, conn in warm_pool if p.is_alive()]
+    while len(warm_pool) < WARM_POOL_SIZE:
+        fork_warm_worker()
+
+# Supervised service processes that are not RQ workers
+SERVICES = {
+    DSP_WORKER: run_dsp_frontend,
+    STT_WORKER: run_transcription,
+}
+
+def launch_worker(queue):
+    """Start a worker process for the queue, using a warm one if possible"""
+    if queue in SERVICES:
+        process = Process(target=SERVICES[queue], name=queue)
+        process.daemon = True
+        process.start()
+        return process
+    
+    while warm_pool:
+        candidate, conn = warm_pool.pop(0)
+        if candidate.is_alive():
+            conn.send(queue)
+            conn.close()
+            return candidate
+    
+    # Pool exhausted, fall back to a cold start
+    process = Process(
+        target=start_worker_for_queue,
+        args=(queue,),
+        name=f"worker-{queue}"
+    )
+    process.daemon = True  # Automatically terminate when main process exits
+    process.start()
+    return process
+
+# Restarts individual workers that die, hang or stall
+supervisor = Supervisor(redis_conn, launch_worker)
+
+def activate_queue(queue):
+    """Make sure a worker is serving the queue"""
+    # Only one manager may claim the queue; the claim lapses once heartbeats stop
+    if not redis_conn.set(marker_key(queue), "starting", ex=HEARTBEAT_TTL, nx=True):
+        return False
+    
+    process = launch_worker(queue)
+    logger.info(f"Started worker process for queue {queue} with PID: {process.pid}")
+    
+    # Track the process
+    supervisor.watch(queue, process)
+    return True
+
 def monitor_user_queues():
     """Monitor for new user queues and start workers for them"""
     # Find all user queues
@@ -61,81 +195,62 @@ def monitor_user_queues():
     
     # Start a worker for each user queue if not already running
     for queue in user_queues:
-        worker_key = f"worker:{queue}"
-        if not redis_conn.exists(worker_key):
-            redis_conn.set(worker_key, "1", ex=3600)  # Mark worker as started
-            
-            # Start a new process for this worker
-            process = Process(
-                target=start_worker_for_queue,
-                args=(queue,),
-                name=f"worker-{queue}"
-            )
-            
-            process.daemon = True  # Automatically terminate when main process exits
-            process.start()
-            
-            logger.info(f"Started worker process for queue {queue} with PID: {process.pid}")
-            
-            # Track the process
-            worker_processes[queue] = {
-                'process': process,
-                'start_time': time.time()
-            }
-
-def check_worker_health():
-    """Check if worker processes are still alive and restart if needed"""
-    for queue_name, info in list(worker_processes.items()):
-        process = info['process']
-        if not process.is_alive():
-            logger.warning(f"Worker for {queue_name} (PID: {process.pid}) died, restarting")
-            
-            # Clean up the dead process
-            del worker_processes[queue_name]
-            
-            # Remove worker key from Redis
-            redis_conn.delete(f"worker:{queue_name}")
-            
-            # Let monitor_user_queues restart it
+        if queue not in supervisor:
+            activate_queue(queue)
 
 if __name__ == "__main__":
     logger.info("Starting worker manager...")
     
-    # Start the session management worker
-    session_process = Process(
-        target=start_worker_for_queue,
-        args=('session_management',),
-        name="worker-session_management"
-    )
-    session_process.daemon = True
-    session_process.start()
-    logger.info(f"Started session management worker with PID: {session_process.pid}")
-    worker_processes['session_management'] = {
-        'process': session_process,
-        'start_time': time.time()
-    }
-    
-    # Start a worker for the main audio processing queue
-    audio_process = Process(
-        target=start_worker_for_queue,
-        args=('audio_processing',),
-        name="worker-audio_processing"
-    )
-    audio_process.daemon = True
-    audio_process.start()
-    logger.info(f"Started audio processing worker with PID: {audio_process.pid}")
-    worker_processes['audio_processing'] = {
-        'process': audio_process,
-        'start_time': time.time()
-    }
+    # Start the shared job-class worker and the main audio processing worker
+    for queue in (SHARED_WORKER, 'audio_processing'):
+        redis_conn.set(marker_key(queue), "starting", ex=HEARTBEAT_TTL)
+        process = Process(
+            target=start_worker_for_queue,
+            args=(queue,),
+            name=f"worker-{queue}"
+        )
+        process.daemon = True
+        process.start()
+        logger.info(f"Started {queue} worker with PID: {process.pid}")
+        supervisor.watch(queue, process)
+    
+    # Batch inbound audio across sessions before it reaches the user queues,
+    # and batch finished utterances for transcription. With the in-process
+    # transport the server runs the DSP tick itself.
+    services = [name for name, enabled in ((DSP_WORKER, DSP_FRONTEND and PIPELINE_TRANSPORT == "redis"),
+                                           (STT_WORKER, TRANSCRIPTION_BACKEND != "off")) if enabled]
+    for service in services:
+        redis_conn.set(marker_key(service), "starting", ex=HEARTBEAT_TTL)
+        process = launch_worker(service)
+        logger.info(f"Started {service} with PID: {process.pid}")
+        supervisor.watch(service, process)
+    
+    # Pre-fork workers so activation does not wait on a fork and imports
+    fill_warm_pool()
+    
+    # Session start publishes the user queue name as soon as a device connects
+    pubsub = redis_conn.pubsub(ignore_subscribe_messages=True)
+    pubsub.subscribe(WORKER_ACTIVATION_CHANNEL)
     
     try:
-        # Monitor for new user queues and manage workers
+        last_poll = 0
         while True:
-            monitor_user_queues()
-            check_worker_health()
-            time.sleep(5)  # Check every 5 seconds
+            message = pubsub.get_message(timeout=1.0)
+            if message and message["type"] == "message":
+                queue = message["data"].decode('utf-8')
+                if queue not in supervisor and activate_queue(queue):
+                    fill_warm_pool()
+            
+            # Restart dead, hung or stalled workers one by one
+            supervisor.check()
+            
+            # Slow fallback scan in case an event was missed
+            if time.time() - last_poll >= QUEUE_POLL_INTERVAL:
+                last_poll = time.time()
+                monitor_user_queues()
+                fill_warm_pool()
     
     except KeyboardInterrupt:
         logger.info("Shutting down worker manager...")
+        supervisor.stop_all()
         sys.exit(0)
\ No newline at end of file
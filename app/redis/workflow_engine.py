@@ -1,8 +1,13 @@
 # app/workflow_engine.py
 import json
+import time
 import logging
-import asyncio
 from app.redis.redis_client import get_redis_client
+from app.redis import keys
+from app.syllabus_manger import get_syllabus
+from app.intent_router import get_intent_router, normalize
+from app.redis.review_scheduler import due_words, record_attempt, schedule_word
+from app.redis.session_state import EngineState, load_engine_state, save_engine_state, parse_age
 # from app.openai_service import transcribe_audio, generate_speech
 
 logger = logging.getLogger(__name__)
@@ -13,44 +18,73 @@ class WorkflowEngine:
     def __init__(self, user_id, user_data=None):
         self.user_id = user_id
         self.user_data = user_data or {}
-        self.context = {
-            "child_name": self.user_data.get("name"),
-            "child_age": self.user_data.get("age"),
-            "learned_words": {},
-            "current_game": None
-        }
+        # Hydrated from Redis on the first turn
+        self.state = None
         self.last_response = None
     
+    async def ensure_state(self):
+        """Load persisted state on first use so any worker can resume a user"""
+        if self.state is None:
+            state = await load_engine_state(self.user_id) or EngineState()
+            # Fresh profile data wins over what was persisted
+            if self.user_data.get("name") is not None:
+                state.set("child_name", self.user_data["name"])
+            if self.user_data.get("age") is not None:
+                age = parse_age(self.user_data["age"])
+                if age is None:
+                    logger.warning(f"Ignoring unusable age {self.user_data['age']!r} for {self.user_id}")
+                else:
+                    state.set("child_age", age)
+            self.state = state
+        return self.state
+    
     async def process_transcription(self, transcription):
         """Process user transcription and generate response"""
         try:
             redis = await get_redis_client()
+            state = await self.ensure_state()
             
             # Store transcription in history
-            history_key = f"conversation:{self.user_id}"
+            history_key = keys.conversation(self.user_id)
             await redis.rpush(
                 history_key,
                 json.dumps({"role": "user", "content": transcription})
             )
             await redis.ltrim(history_key, -10, -1)  # Keep last 10 messages
             
-            # For now, generate a simple response
-            # In a real implementation, this would use OpenAI API
-            if "hello" in transcription.lower():
-                response = f"¡Hola {self.context['child_name'] or 'amigo'}! How are you today?"
-            elif "animal" in transcription.lower():
-                response = "Let's learn about animals! In Spanish, 'dog' is 'perro'. Can you say 'perro'?"
-                # Track this word
-                await self.track_vocabulary("perro", "dog", "animal lesson")
+            # Grade the word we asked the child to say last turn
+            praise = await self.check_attempt(transcription)
+            
+            # Answer greetings, lessons and refusals locally
+            router = await get_intent_router()
+            route = router.classify(transcription)
+            if route.intent == "lesson":
+                due = await due_words(self.user_id, 1)
+                if due:
+                    response = await self.review_word(due[0])
+                else:
+                    response = await self.next_lesson(route.topic)
+            elif route.response is not None:
+                response = route.response.replace("{child_name}", state.child_name or 'amigo')
             else:
+                # Open-ended turn, this is where the OpenAI API would be called
                 response = f"I heard you say: {transcription}. What would you like to learn today?"
             
+            if praise:
+                response = f"{praise} {response}"
+            
+            if route.intent != "open":
+                logger.info(f"Routed turn locally for {self.user_id}: {route.intent} ({route.matched})")
+            
             # Store response in history
             await redis.rpush(
                 history_key,
                 json.dumps({"role": "assistant", "content": response})
             )
             
+            # Persist whatever this turn changed
+            await save_engine_state(self.user_id, state)
+            
             self.last_response = response
             return response
             
@@ -58,28 +92,69 @@ class WorkflowEngine:
             logger.error(f"Error in workflow: {e}")
             return "I'm sorry, I had a problem. Could you try again?"
     
+    async def next_lesson(self, topic=None):
+        """Teach the next syllabus word for the child's age band"""
+        syllabus = await get_syllabus()
+        state = await self.ensure_state()
+        item, cursor = syllabus.next_item(state.child_age, state.lesson_cursor, topic)
+        state.set("lesson_cursor", cursor)
+        if item is None:
+            return "Let's learn something new! What would you like to talk about?"
+        
+        # Track this word and ask the child to say it
+        await self.track_vocabulary(item.word, item.translation, f"{item.topic} lesson")
+        state.set("current_game", f"say:{item.word}")
+        return (f"Let's learn about {item.topic}! In Spanish, '{item.translation}' is "
+                f"'{item.word}'. Can you say '{item.word}'?")
+    
+    async def review_word(self, word):
+        """Ask the child to recall a word that is due for review"""
+        state = await self.ensure_state()
+        translation = state.learned_words.get(word)
+        if translation is None:
+            syllabus = await get_syllabus()
+            item = syllabus.lookup(word)
+            translation = item.translation if item else word
+        state.set("current_game", f"say:{word}")
+        return f"Do you remember how to say '{translation}' in Spanish? Can you say '{word}'?"
+    
+    async def check_attempt(self, transcription):
+        """Record whether the child said the word we prompted for"""
+        state = await self.ensure_state()
+        game = state.current_game
+        if not game or not game.startswith("say:"):
+            return None
+        
+        word = game[len("say:"):]
+        correct = normalize(word) in normalize(transcription)
+        await record_attempt(self.user_id, word, correct)
+        state.set("current_game", None)
+        return f"¡Muy bien! '{word}' is right!" if correct else None
+    
     async def track_vocabulary(self, word, translation, context):
         """Track vocabulary word"""
         try:
             redis = await get_redis_client()
             
             # Store in user's vocabulary
-            vocab_key = f"vocabulary:{self.user_id}"
+            vocab_key = keys.vocabulary(self.user_id)
             await redis.hset(
                 vocab_key,
                 word,
                 json.dumps({
                     "translation": translation,
                     "context": context,
-                    "timestamp": asyncio.get_event_loop().time()
+                    "timestamp": time.time()
                 })
             )
+            await schedule_word(self.user_id, word)
             
-            # Update context
-            self.context["learned_words"][word] = translation
+            # Update engine state
+            state = await self.ensure_state()
+            state.learn_word(word, translation)
             
             # Mark user data as modified
-            await redis.set(f"user:{self.user_id}:modified", "1", ex=3600)
+            await redis.set(keys.user_modified(self.user_id), "1", ex=3600)
             
             return True
         except Exception as e:
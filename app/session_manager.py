@@ -0,0 +1,111 @@
+# app/session_manager.py
+import json
+import time
+import uuid
+import secrets
+import logging
+from app.config import SESSION_TTL, SESSION_RESUME_GRACE, SAMPLE_RATE
+from app.redis import session_store, keys
+
+logger = logging.getLogger(__name__)
+
+# Delete the detach marker only if it still carries our stamp, so a
+# reattach (or a later detach) cancels the pending session end
+_CLAIM_DETACHED = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+resume_key = keys.session_resume
+detached_key = keys.session_detached
+
+def new_session_id(device_id):
+    """Collision-free session id, safe for two connects in the same second"""
+    return keys.new_session_id(device_id, uuid.uuid4().hex)
+
+def create_session(redis_conn, device_id, queue_name, input_rate=SAMPLE_RATE):
+    """Register a new session and return (session_id, resume_token)"""
+    session_id = new_session_id(device_id)
+    token = secrets.token_urlsafe(16)
+
+    session_store.create(redis_conn, session_id, device_id, queue_name, token, input_rate)
+    redis_conn.set(resume_key(device_id, token),
+                   json.dumps({"session_id": session_id, "device_id": device_id}),
+                   ex=SESSION_TTL)
+
+    return session_id, token
+
+def resume_session(redis_conn, device_id, token):
+    """Reattach to a session by resume token, returning its id or None.
+
+    Reattaching is idempotent: it clears any pending detach and leaves the
+    buffer, conversation state and the device's queue untouched.
+    """
+    raw = redis_conn.get(resume_key(device_id, token))
+    if not raw:
+        return None
+
+    try:
+        data = json.loads(raw)
+    except json.JSONDecodeError:
+        return None
+
+    session_id = data.get("session_id")
+    active = redis_conn.hget(session_store.session_key(session_id), session_store.F_ACTIVE)
+    if data.get("device_id") != device_id or active is None:
+        logger.warning(f"Rejected resume token for device {device_id}")
+        return None
+
+    # Sessions that already ended cannot be resumed
+    if active == b"0":
+        return None
+
+    pipe = redis_conn.pipeline()
+    pipe.delete(detached_key(session_id))
+    pipe.expire(resume_key(device_id, token), SESSION_TTL)
+    pipe.expire(session_store.session_key(session_id), SESSION_TTL)
+    pipe.expire(session_store.stream_key(session_id), SESSION_TTL)
+    pipe.execute()
+
+    logger.info(f"Resumed session {session_id} for device {device_id}")
+    return session_id
+
+# Sorted set of detached sessions scored by when their grace period ends.
+# Any server process can claim them, so a drained or crashed node does
+# not leave sessions that never end.
+EXPIRING_KEY = "session:expiring"
+
+def mark_detached(redis_conn, session_id, device_id, grace=SESSION_RESUME_GRACE):
+    """Start the grace period for a dropped connection"""
+    stamp = uuid.uuid4().hex
+    pipe = redis_conn.pipeline()
+    pipe.set(detached_key(session_id), stamp, ex=grace * 2)
+    pipe.zadd(EXPIRING_KEY, {json.dumps([session_id, device_id, stamp]): time.time() + grace})
+    pipe.execute()
+    return stamp
+
+def claim_expired(redis_conn, session_id, stamp):
+    """True if the session was not reattached since this detach"""
+    claim = redis_conn.register_script(_CLAIM_DETACHED)
+    return bool(claim(keys=[detached_key(session_id)], args=[stamp]))
+
+def claim_expired_sessions(redis_conn, now=None, limit=100):
+    """Return (session_id, device_id) for sessions whose grace period ran out.
+
+    Each expiry is handed to exactly one caller; resumed sessions are skipped.
+    """
+    now = now or time.time()
+    expired = []
+    for member in redis_conn.zrangebyscore(EXPIRING_KEY, "-inf", now, start=0, num=limit):
+        # Whoever removes the entry owns it
+        if not redis_conn.zrem(EXPIRING_KEY, member):
+            continue
+        session_id, device_id, stamp = json.loads(member)
+        if claim_expired(redis_conn, session_id, stamp):
+            expired.append((session_id, device_id))
+    return expired
+
+def drop_resume_token(redis_conn, device_id, token):
+    redis_conn.delete(resume_key(device_id, token))
@@ -0,0 +1,146 @@
+# app/session_recorder.py
+import os
+import json
+import glob
+import time
+import queue
+import struct
+import logging
+import threading
+from app.config import NODE_ID, RECORDING_DIR, RECORDING_SEGMENT_MB
+
+logger = logging.getLogger(__name__)
+
+# Segment files are append-only: a magic header, then records of
+# timestamp, kind, session id length and payload length, followed by
+# the session id and the payload. Sessions are interleaved in arrival
+# order. The id is per connection, so a resumed session records anew.
+MAGIC = b"SREC1\n"
+RECORD_HEADER = struct.Struct("<dBHI")
+
+# Record kinds. OPEN carries JSON connection details, AUDIO an inbound
+# binary frame, TEXT an inbound control message, CLOSE the close reason.
+OPEN = 0
+AUDIO = 1
+TEXT = 2
+CLOSE = 3
+
+# Seconds between flushes of the segment to disk
+FLUSH_INTERVAL = 1.0
+
+class SessionRecorder:
+    """Writes every session's inbound traffic to segmented recording files.
+
+    The socket handlers only put records on a queue; a writer thread owns
+    the files, so disk writes never block the event loop.
+    """
+
+    def __init__(self, directory=RECORDING_DIR, segment_mb=RECORDING_SEGMENT_MB):
+        self.directory = directory
+        self.segment_bytes = int(segment_mb * 1024 * 1024)
+        self.records = queue.SimpleQueue()
+        self.segment = None
+        self.segment_size = 0
+        self.sequence = 0
+        self.thread = None
+
+    def start(self):
+        os.makedirs(self.directory, exist_ok=True)
+        self.thread = threading.Thread(target=self.write_loop, name="session-recorder", daemon=True)
+        self.thread.start()
+        logger.info(f"Recording sessions to {self.directory}")
+
+    def open(self, session_id, device_id, rate, resumed=False):
+        self.put(OPEN, session_id, json.dumps({
+            "device_id": device_id, "rate": rate, "resumed": resumed
+        }).encode('utf-8'))
+
+    def audio(self, session_id, data):
+        self.put(AUDIO, session_id, data)
+
+    def text(self, session_id, text):
+        self.put(TEXT, session_id, text.encode('utf-8'))
+
+    def close(self, session_id, reason):
+        self.put(CLOSE, session_id, reason.encode('utf-8'))
+
+    def put(self, kind, session_id, payload):
+        self.records.put((time.time(), kind, session_id, payload))
+
+    def new_segment(self):
+        if self.segment is not None:
+            self.segment.close()
+        self.sequence += 1
+        name = f"{NODE_ID}-{os.getpid()}-{int(time.time())}-{self.sequence:04d}.srec"
+        self.segment = open(os.path.join(self.directory, name), "ab")
+        self.segment.write(MAGIC)
+        self.segment_size = len(MAGIC)
+
+    def write_loop(self):
+        last_flush = time.monotonic()
+        while True:
+            try:
+                record = self.records.get(timeout=FLUSH_INTERVAL)
+            except queue.Empty:
+                record = None
+            try:
+                if record is not None:
+                    self.write(*record)
+                if self.segment is not None and time.monotonic() - last_flush >= FLUSH_INTERVAL:
+                    self.segment.flush()
+                    last_flush = time.monotonic()
+            except OSError as e:
+                logger.error(f"Error writing session recording: {e}")
+
+    def write(self, timestamp, kind, session_id, payload):
+        sid = session_id.encode('utf-8')
+        size = RECORD_HEADER.size + len(sid) + len(payload)
+        if self.segment is None or self.segment_size + size > self.segment_bytes:
+            self.new_segment()
+        self.segment.write(RECORD_HEADER.pack(timestamp, kind, len(sid), len(payload)))
+        self.segment.write(sid)
+        self.segment.write(payload)
+        self.segment_size += size
+
+def read_segment(path):
+    """Yield (timestamp, kind, session_id, payload) from one segment file.
+
+    A record cut short by a crash ends the segment.
+    """
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not a session recording")
+        while True:
+            header = f.read(RECORD_HEADER.size)
+            if len(header) < RECORD_HEADER.size:
+                return
+            timestamp, kind, sid_length, payload_length = RECORD_HEADER.unpack(header)
+            body = f.read(sid_length + payload_length)
+            if len(body) < sid_length + payload_length:
+                return
+            yield timestamp, kind, body[:sid_length].decode('utf-8'), body[sid_length:]
+
+def load_sessions(paths):
+    """Group the records of the given segment files (or directories) by session.
+
+    Returns {session_id: {"device_id", "rate", "start", "events"}} where
+    events are (seconds since the session opened, kind, payload).
+    """
+    files = []
+    for path in paths:
+        files.extend(sorted(glob.glob(os.path.join(path, "*.srec"))) if os.path.isdir(path) else [path])
+
+    sessions = {}
+    for path in files:
+        for timestamp, kind, session_id, payload in read_segment(path):
+            if kind == OPEN:
+                details = json.loads(payload)
+                sessions[session_id] = {"device_id": details["device_id"], "rate": details["rate"],
+                                        "start": timestamp, "events": []}
+                continue
+            session = sessions.get(session_id)
+            # Sessions whose open is in a segment we were not given are skipped
+            if session is None:
+                continue
+            session["events"].append((timestamp - session["start"], kind, payload))
+    return sessions
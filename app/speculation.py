@@ -0,0 +1,131 @@
+# app/speculation.py
+import time
+import asyncio
+import logging
+from difflib import SequenceMatcher
+import numpy as np
+from app.config import (SAMPLE_RATE, SAMPLE_WIDTH, SPECULATION_SILENCE_MS, SPEECH_RMS_THRESHOLD,
+                        SPECULATION_MIN_SIMILARITY)
+from app.intent_router import normalize
+
+logger = logging.getLogger(__name__)
+
+STATS_KEY = "spec:stats"
+
+# Speech detection works on 20 ms frames
+FRAME_MS = 20
+
+class EndOfTurnDetector:
+    """Spots a probable end of turn: speech followed by enough trailing silence"""
+
+    def __init__(self, sample_rate=SAMPLE_RATE, silence_ms=SPECULATION_SILENCE_MS,
+                 threshold=SPEECH_RMS_THRESHOLD):
+        self.frame_bytes = int(sample_rate * FRAME_MS / 1000) * SAMPLE_WIDTH
+        self.silent_frames_needed = max(1, int(silence_ms / FRAME_MS))
+        self.threshold = threshold
+        self.pending = b""
+        self.heard_speech = False
+        self.silent_frames = 0
+        self.fired = False
+
+    def feed(self, pcm):
+        """Add audio; True the first time a pause after speech is long enough"""
+        data = self.pending + pcm
+        usable = len(data) - len(data) % self.frame_bytes
+        self.pending = data[usable:]
+        if not usable:
+            return False
+
+        frames = np.frombuffer(data[:usable], dtype="<i2").astype(np.float32).reshape(-1, self.frame_bytes // SAMPLE_WIDTH)
+        speech = np.sqrt((frames * frames).mean(axis=1)) > self.threshold
+
+        end_of_turn = False
+        for is_speech in speech:
+            if is_speech:
+                # Talking again, a later pause may end the turn
+                self.heard_speech = True
+                self.silent_frames = 0
+                self.fired = False
+            elif self.heard_speech:
+                self.silent_frames += 1
+                if self.silent_frames >= self.silent_frames_needed and not self.fired:
+                    self.fired = True
+                    end_of_turn = True
+        return end_of_turn
+
+def transcripts_match(speculative, final, min_similarity=SPECULATION_MIN_SIMILARITY):
+    """Equal after normalization, or similar enough by character ratio"""
+    a, b = normalize(speculative).strip(), normalize(final).strip()
+    if a == b:
+        return True
+    return SequenceMatcher(None, a, b).ratio() >= min_similarity
+
+class SpeculativeResponder:
+    """Starts the response from a provisional transcript and keeps it if the final one agrees.
+
+    generate is an async function taking a transcript and returning the
+    response text.
+    """
+
+    def __init__(self, generate, redis_conn=None):
+        self.generate = generate
+        self.redis_conn = redis_conn
+        self.task = None
+        self.transcript = None
+        self.started = None
+        self.finished = None
+
+    async def _run(self, transcript):
+        try:
+            return await self.generate(transcript)
+        finally:
+            self.finished = time.perf_counter()
+
+    def speculate(self, transcript):
+        """Start generating from a provisional transcript, replacing any earlier guess"""
+        if not transcript:
+            return
+        self.cancel()
+        self.transcript = transcript
+        self.started = time.perf_counter()
+        self.finished = None
+        self.task = asyncio.create_task(self._run(transcript))
+        self.record("attempts")
+
+    def cancel(self):
+        if self.task is not None and not self.task.done():
+            self.task.cancel()
+        self.task = None
+
+    async def resolve(self, final_transcript):
+        """Response for the final transcript, reusing the speculative one on a hit"""
+        resolved_at = time.perf_counter()
+        if self.task is not None and transcripts_match(self.transcript, final_transcript):
+            try:
+                response = await self.task
+            except Exception as e:
+                logger.error(f"Speculative generation failed, regenerating: {e}")
+            else:
+                # Without speculation generation would only start now
+                generate_ms = (self.finished - self.started) * 1000
+                waited_ms = max(0.0, (self.finished - resolved_at) * 1000)
+                self.record("hits", saved_ms=generate_ms - waited_ms)
+                return response
+
+        if self.task is not None:
+            self.cancel()
+            self.record("misses")
+            logger.info(f"Speculation missed: {self.transcript!r} vs {final_transcript!r}")
+        return await self.generate(final_transcript)
+
+    def record(self, outcome, saved_ms=0.0):
+        if self.redis_conn is None:
+            return
+        try:
+            pipe = self.redis_conn.pipeline()
+            pipe.hincrby(STATS_KEY, outcome, 1)
+            if saved_ms:
+                pipe.hincrbyfloat(STATS_KEY, "saved_ms", saved_ms)
+            pipe.execute()
+        except Exception as e:
+            logger.error(f"Error recording speculation stats: {e}")
@@ -0,0 +1,205 @@
+# app/syllabus_manger.py
+import os
+import json
+import hashlib
+import logging
+from collections import namedtuple
+from types import MappingProxyType
+from app.redis.redis_client import get_redis_client
+from app.config import SYLLABUS_DIR
+
+logger = logging.getLogger(__name__)
+
+# Redis keys for the published syllabus
+SYLLABUS_SNAPSHOT_KEY = "syllabus:snapshot"
+SYLLABUS_VERSION_KEY = "syllabus:version"
+
+# Snapshot format version, bump when the layout below changes
+SNAPSHOT_FORMAT = 1
+
+# A single teachable word
+LessonItem = namedtuple("LessonItem", ["word", "translation", "topic", "age_band"])
+
+class Syllabus:
+    """Immutable syllabus indexed by age band, topic and word"""
+
+    __slots__ = ("version", "language", "age_bands", "topic_keywords",
+                 "intents", "items", "by_age_band", "by_topic", "by_band_topic",
+                 "by_word", "_band_for_age")
+
+    def __init__(self, version, language, age_bands, topic_keywords, items, intents=None):
+        self.version = version
+        self.language = language
+        # Tuples of (name, min_age, max_age), youngest first
+        self.age_bands = tuple(tuple(band) for band in age_bands)
+        self.topic_keywords = MappingProxyType(
+            {topic: tuple(words) for topic, words in topic_keywords.items()}
+        )
+        # Deterministic intents as name -> (patterns, response)
+        self.intents = MappingProxyType({
+            name: (tuple(patterns), response)
+            for name, (patterns, response) in (intents or {}).items()
+        })
+        self.items = tuple(LessonItem(*item) for item in items)
+
+        band_names = [band[0] for band in self.age_bands]
+        band_rank = {name: rank for rank, name in enumerate(band_names)}
+
+        # Resolve an age to its band with a single dict lookup
+        band_for_age = {}
+        for name, min_age, max_age in self.age_bands:
+            for age in range(int(min_age), int(max_age) + 1):
+                band_for_age[age] = name
+        self._band_for_age = MappingProxyType(band_for_age)
+
+        # A band offers its own words first, then everything from younger bands
+        def band_order(item, rank):
+            item_rank = band_rank.get(item.age_band, 0)
+            return (item_rank != rank, -item_rank)
+
+        by_age_band = {}
+        by_band_topic = {}
+        for rank, name in enumerate(band_names):
+            eligible = [item for item in self.items if band_rank.get(item.age_band, 0) <= rank]
+            eligible.sort(key=lambda item: band_order(item, rank))
+            by_age_band[name] = tuple(eligible)
+            for topic in self.topic_keywords:
+                by_band_topic[(name, topic)] = tuple(item for item in eligible if item.topic == topic)
+
+        by_topic = {}
+        for item in self.items:
+            by_topic.setdefault(item.topic, []).append(item)
+
+        self.by_age_band = MappingProxyType(by_age_band)
+        self.by_band_topic = MappingProxyType(by_band_topic)
+        self.by_topic = MappingProxyType({topic: tuple(items) for topic, items in by_topic.items()})
+        self.by_word = MappingProxyType({item.word: item for item in self.items})
+
+    def age_band_for(self, age):
+        """Return the band name for an age, defaulting to the youngest band"""
+        if not self.age_bands:
+            return None
+        try:
+            age = int(age)
+        except (TypeError, ValueError):
+            return self.age_bands[0][0]
+        band = self._band_for_age.get(age)
+        if band is None:
+            return self.age_bands[-1][0] if age > self.age_bands[-1][2] else self.age_bands[0][0]
+        return band
+
+    def lookup(self, word):
+        """Return the lesson item for a word, or None"""
+        return self.by_word.get(word)
+
+    def next_item(self, age, cursor=0, topic=None):
+        """Return (item, next_cursor) for the given age band and optional topic"""
+        band = self.age_band_for(age)
+        if topic is None:
+            items = self.by_age_band.get(band, ())
+        else:
+            items = self.by_band_topic.get((band, topic), ())
+        if not items:
+            return None, cursor
+        return items[cursor % len(items)], cursor + 1
+
+    def to_snapshot(self):
+        """Serialize to the compact JSON snapshot published to Redis"""
+        return json.dumps({
+            "format": SNAPSHOT_FORMAT,
+            "version": self.version,
+            "language": self.language,
+            "age_bands": self.age_bands,
+            "topics": dict(self.topic_keywords),
+            "intents": dict(self.intents),
+            "items": self.items
+        }, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+    @classmethod
+    def from_snapshot(cls, raw):
+        """Rebuild a syllabus from a Redis snapshot"""
+        data = json.loads(raw)
+        if data.get("format") != SNAPSHOT_FORMAT:
+            raise ValueError(f"Unsupported syllabus snapshot format: {data.get('format')}")
+        return cls(data["version"], data["language"], data["age_bands"], data["topics"],
+                   data["items"], data.get("intents"))
+
+class SyllabusManager:
+    """Parses the syllabus directory and publishes it to Redis"""
+
+    def __init__(self, syllabus_dir):
+        self.syllabus_dir = syllabus_dir
+        self.config_path = os.path.join(syllabus_dir, "config.json")
+        self.syllabus = None
+
+    def load(self):
+        """Parse config.json once into an immutable Syllabus"""
+        with open(self.config_path, "rb") as f:
+            raw = f.read()
+        config = json.loads(raw)
+
+        # Version changes whenever the file content does
+        digest = hashlib.sha1(raw).hexdigest()[:12]
+        version = f"{config.get('version', 0)}-{digest}"
+
+        age_bands = [
+            (band["name"], band["min_age"], band["max_age"])
+            for band in config.get("age_bands", [])
+        ]
+        topic_keywords = {}
+        items = []
+        for topic in config.get("topics", []):
+            name = topic["name"]
+            topic_keywords[name] = [keyword.lower() for keyword in topic.get("keywords", [])]
+            for item in topic.get("items", []):
+                items.append((item["word"], item["translation"], name, item["age_band"]))
+
+        intents = {
+            intent["name"]: ([pattern.lower() for pattern in intent["patterns"]], intent["response"])
+            for intent in config.get("intents", [])
+        }
+
+        self.syllabus = Syllabus(version, config.get("language", "es"), age_bands,
+                                 topic_keywords, items, intents)
+        logger.info(f"Loaded syllabus {version}: {len(items)} items, {len(topic_keywords)} topics")
+        return self.syllabus
+
+    async def load_syllabus_to_redis(self):
+        """Publish the parsed syllabus as a versioned snapshot"""
+        syllabus = self.syllabus or self.load()
+        redis = await get_redis_client()
+
+        current = await redis.get(SYLLABUS_VERSION_KEY)
+        if current and current.decode("utf-8") == syllabus.version:
+            logger.info(f"Syllabus {syllabus.version} already published")
+            return syllabus
+
+        pipe = redis.pipeline()
+        pipe.set(SYLLABUS_SNAPSHOT_KEY, syllabus.to_snapshot())
+        pipe.set(SYLLABUS_VERSION_KEY, syllabus.version)
+        await pipe.execute()
+
+        logger.info(f"Published syllabus {syllabus.version} to Redis")
+        return syllabus
+
+# Per-process cache, filled on first use
+_syllabus = None
+
+async def get_syllabus():
+    """Get the syllabus, loading the Redis snapshot with a single GET on first use"""
+    global _syllabus
+    if _syllabus is None:
+        redis = await get_redis_client()
+        raw = await redis.get(SYLLABUS_SNAPSHOT_KEY)
+        if raw:
+            _syllabus = Syllabus.from_snapshot(raw)
+        else:
+            # Nothing published yet, fall back to parsing the local file
+            logger.warning("No syllabus snapshot in Redis, loading from disk")
+            _syllabus = SyllabusManager(SYLLABUS_DIR).load()
+    return _syllabus
+
+def reset_syllabus_cache():
+    """Drop the cached syllabus so the next call reloads it"""
+    global _syllabus
+    _syllabus = None
@@ -0,0 +1,160 @@
+# app/utterance_buffer.py
+import io
+import sys
+import mmap
+import struct
+import tempfile
+from app.config import (UTTERANCE_MEMORY_KB, UTTERANCE_MAX_MB, UTTERANCE_SPILL_DIR,
+                        SAMPLE_RATE, CHANNELS, SAMPLE_WIDTH)
+
+# Canonical 44 byte PCM WAV header: RIFF chunk, fmt chunk, data chunk header
+WAV_HEADER = struct.Struct("<4sI4s4sIHHIIHH4sI")
+
+def wav_header(data_length, sample_rate=SAMPLE_RATE, channels=CHANNELS, sample_width=SAMPLE_WIDTH):
+    """Header for data_length bytes of PCM; send it followed by the PCM itself"""
+    return WAV_HEADER.pack(
+        b"RIFF", WAV_HEADER.size - 8 + data_length, b"WAVE",
+        b"fmt ", 16, 1, channels, sample_rate, sample_rate * channels * sample_width,
+        channels * sample_width, sample_width * 8,
+        b"data", data_length
+    )
+
+class WavFile(io.RawIOBase):
+    """A WAV file read as its header followed by the caller's PCM, never joined.
+
+    For uploads: readers pull it in chunks straight from the PCM, which
+    may be a memoryview of an UtteranceBuffer.
+    """
+
+    def __init__(self, pcm, name="audio.wav", sample_rate=SAMPLE_RATE, channels=CHANNELS,
+                 sample_width=SAMPLE_WIDTH):
+        super().__init__()
+        data = memoryview(pcm).cast("B")
+        self.parts = (memoryview(wav_header(len(data), sample_rate, channels, sample_width)), data)
+        self.length = WAV_HEADER.size + len(data)
+        self.position = 0
+        self.name = name
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self.position, io.SEEK_END: self.length}[whence]
+        self.position = max(0, base + offset)
+        return self.position
+
+    def readinto(self, buffer):
+        out = memoryview(buffer).cast("B")
+        written = 0
+        offset = self.position
+        for part in self.parts:
+            if offset >= len(part):
+                offset -= len(part)
+                continue
+            count = min(len(part) - offset, len(out) - written)
+            out[written:written + count] = part[offset:offset + count]
+            written += count
+            offset = 0
+            if written == len(out):
+                break
+        self.position += written
+        return written
+
+class UtteranceTooLong(Exception):
+    pass
+
+class UtteranceBuffer:
+    """One connection's utterance, capped, spilling to a temp file when long.
+
+    Audio stays in memory up to memory_kb, then moves to an unlinked temp
+    file and is read back through mmap, so a long utterance costs page
+    cache rather than heap. Past max_mb, append raises UtteranceTooLong.
+    """
+
+    def __init__(self, memory_kb=UTTERANCE_MEMORY_KB, max_mb=UTTERANCE_MAX_MB, spill_dir=UTTERANCE_SPILL_DIR):
+        self.memory_bytes = int(memory_kb * 1024)
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.spill_dir = spill_dir
+        self.buffer = bytearray()
+        self.file = None
+        self.length = 0
+        # A memoryview of buffer is out, so it must not be resized in place
+        self.exported = False
+        # Most heap held at once and most audio spilled, for the whole connection
+        self.peak_memory = 0
+        self.peak_spilled = 0
+        self.spills = 0
+
+    def __len__(self):
+        return self.length
+
+    @property
+    def spilled(self):
+        return self.file is not None
+
+    def append(self, data):
+        if self.length + len(data) > self.max_bytes:
+            raise UtteranceTooLong(f"Utterance would exceed {self.max_bytes} bytes")
+        if self.file is None and len(self.buffer) + len(data) > self.memory_bytes:
+            self.spill()
+        if self.file is not None:
+            self.file.write(data)
+            self.peak_spilled = max(self.peak_spilled, self.length + len(data))
+        else:
+            if self.exported:
+                # Copy on write, bounded by memory_kb
+                self.buffer = bytearray(self.buffer)
+                self.exported = False
+            self.buffer.extend(data)
+            self.peak_memory = max(self.peak_memory, len(self.buffer))
+        self.length += len(data)
+
+    def spill(self):
+        self.file = tempfile.TemporaryFile(dir=self.spill_dir, prefix="utterance-")
+        self.file.write(self.buffer)
+        self.buffer = bytearray()
+        self.spills += 1
+
+    def view(self):
+        """The audio so far as a read-only memoryview, without copying.
+
+        The view stays valid across later appends and reset(): spilled
+        audio is mapped from the file, and the first append after a view
+        of in-memory audio moves on to a copy of the buffer.
+        """
+        if self.length == 0:
+            return memoryview(b"")
+        if self.file is None:
+            self.exported = True
+            return memoryview(self.buffer).toreadonly()
+        self.file.flush()
+        return memoryview(mmap.mmap(self.file.fileno(), self.length, access=mmap.ACCESS_READ))
+
+    def reset(self):
+        """Start the next utterance; views handed out keep their audio"""
+        self.buffer = bytearray()
+        self.exported = False
+        if self.file is not None:
+            # Mappings keep their own reference to the file's pages
+            self.file.close()
+            self.file = None
+        self.length = 0
+
+    def close(self):
+        self.reset()
+
+def peak_rss_kib():
+    """Peak resident set size of this process"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    # Kilobytes on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak // 1024 if sys.platform == "darwin" else peak
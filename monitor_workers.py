@@ -1,5 +1,4 @@
 # monitor_workers.py
-import redis
 import time
 import json
 import os
@@ -7,6 +6,9 @@ import sys
 import argparse
 from prettytable import PrettyTable
 from datetime import datetime
+from app.redis import session_store
+from app.redis.redis_client import create_redis, create_queue_redis
+from app.redis.job_scheduler import JOB_CLASSES, stats_key
 
 # Parse command line arguments
 parser = argparse.ArgumentParser(description='Monitor Redis Queue workers and audio processing')
@@ -14,8 +16,9 @@ parser.add_argument('--refresh', type=int, default=5, help='Refresh interval in
 parser.add_argument('--device', type=str, help='Filter by specific device ID')
 args = parser.parse_args()
 
-# Redis connection
-redis_conn = redis.Redis(host='localhost', port=6379, db=0)
+# Redis connections: queues and workers, and session data
+redis_conn = create_queue_redis()
+data_conn = create_redis()
 
 def clear_screen():
     """Clear the terminal screen"""
@@ -54,64 +57,109 @@ def get_session_stats():
     """Get statistics for all active sessions"""
     sessions = []
     
-    # Find all session info in Redis
-    for key in redis_conn.keys("session:info:*"):
+    # One hash per session holds its info, state and stats
+    for key in data_conn.scan_iter(match="sess:*", count=500, _type="hash"):
         try:
-            session_id = key.decode('utf-8').replace("session:info:", "")
-            info = redis_conn.get(key)
+            session_id = key.decode('utf-8').replace("sess:", "", 1)
+            data = session_store.decode(data_conn.hgetall(key))
+            if not data:
+                continue
             
-            if info:
-                session_data = json.loads(info)
-                device_id = session_data.get("device_id", "unknown")
-                
-                # If filtering by device ID, skip non-matching sessions
-                if args.device and args.device != device_id:
-                    continue
-                
-                # Get session stats
-                stats_key = f"stats:{session_id}"
-                stats = {}
-                
-                if redis_conn.exists(stats_key):
-                    raw_stats = redis_conn.hgetall(stats_key)
-                    
-                    # Convert byte keys/values to strings/numbers
-                    for k, v in raw_stats.items():
-                        key = k.decode('utf-8') if isinstance(k, bytes) else k
-                        try:
-                            # Try to convert to number if possible
-                            value = float(v) if isinstance(v, bytes) else v
-                        except:
-                            value = v.decode('utf-8') if isinstance(v, bytes) else v
-                        
-                        stats[key] = value
-                
-                # Get session state
-                state_key = f"session:state:{session_id}"
-                state = {"active": "Unknown"}
-                
-                if redis_conn.exists(state_key):
-                    try:
-                        state_data = json.loads(redis_conn.get(state_key))
-                        state = state_data
-                    except:
-                        pass
-                
-                # Add session to list
-                sessions.append({
-                    "session_id": session_id,
-                    "device_id": device_id,
-                    "start_time": session_data.get("start_time", 0),
-                    "active": state.get("active", False),
-                    "chunks_processed": stats.get("chunks_processed", 0),
-                    "buffers_processed": stats.get("buffers_processed", 0),
-                    "last_activity": stats.get("last_activity", 0)
-                })
+            device_id = data.get("device_id", "unknown")
+            
+            # If filtering by device ID, skip non-matching sessions
+            if args.device and args.device != device_id:
+                continue
+            
+            sessions.append({
+                "session_id": session_id,
+                "device_id": device_id,
+                "start_time": data.get("start_time", 0),
+                "active": bool(data.get("active", 0)),
+                "chunks_processed": data.get("chunks_processed", 0),
+                "buffers_processed": data.get("buffers_processed", 0),
+                "buffer_size": int(data.get("buffer_size", 0)),
+                "last_activity": data.get("last_activity", 0)
+            })
         except Exception as e:
             print(f"Error parsing session info: {e}")
     
     return sessions
 
+def get_job_overhead():
+    """Get per-queue job timings recorded by the workers"""
+    overhead = []
+    
+    for key in redis_conn.keys("worker:overhead:*"):
+        try:
+            queue = key.decode('utf-8').replace("worker:overhead:", "")
+            data = {k.decode('utf-8'): v.decode('utf-8') for k, v in redis_conn.hgetall(key).items()}
+            jobs = int(data.get("jobs", 0))
+            if not jobs:
+                continue
+            
+            total_ms = float(data.get("total_ms", 0))
+            perform_ms = float(data.get("perform_ms", 0))
+            overhead.append({
+                "queue": queue,
+                "mode": data.get("mode", "unknown"),
+                "jobs": jobs,
+                "avg_total_ms": total_ms / jobs,
+                "avg_overhead_ms": (total_ms - perform_ms) / jobs
+            })
+        except Exception as e:
+            print(f"Error parsing job overhead: {e}")
+    
+    return overhead
+
+def get_scheduler_stats():
+    """Get per job class latency and deadline misses"""
+    classes = []
+    
+    for job_class, (queue, deadline) in JOB_CLASSES.items():
+        data = {k.decode('utf-8'): v.decode('utf-8') for k, v in redis_conn.hgetall(stats_key(job_class)).items()}
+        jobs = int(data.get("jobs", 0))
+        if not jobs:
+            continue
+        
+        misses = int(data.get("misses", 0))
+        classes.append({
+            "job_class": job_class,
+            "queue": queue,
+            "deadline": deadline,
+            "waiting": redis_conn.llen(f"rq:queue:{queue}"),
+            "jobs": jobs,
+            "misses": misses,
+            "avg_latency_ms": float(data.get("latency_ms", 0)) / jobs,
+            "avg_late_ms": float(data.get("late_ms", 0)) / misses if misses else 0
+        })
+    
+    return classes
+
+def get_supervisor_status():
+    """Get heartbeat and restart status for every supervised worker"""
+    workers = []
+    stats = {k.decode('utf-8'): v.decode('utf-8') for k, v in redis_conn.hgetall("supervisor:stats").items()}
+    
+    for key in redis_conn.keys("worker:heartbeat:*"):
+        try:
+            queue = key.decode('utf-8').replace("worker:heartbeat:", "")
+            heartbeat = {k.decode('utf-8'): v.decode('utf-8') for k, v in redis_conn.hgetall(key).items()}
+            job_started = float(heartbeat.get("job_started") or 0)
+            
+            workers.append({
+                "queue": queue,
+                "pid": heartbeat.get("pid", "?"),
+                "heartbeat_age": time.time() - float(heartbeat.get("ts", 0)),
+                "job_age": time.time() - job_started if job_started else 0,
+                "restarts": int(stats.get(f"restarts:{queue}", 0)),
+                "recover_ms": stats.get(f"recover_ms:{queue}", "N/A")
+            })
+        except Exception as e:
+            print(f"Error parsing heartbeat: {e}")
+    
+    return workers, stats
+
 def format_time(timestamp):
     """Format timestamp as readable time"""
     if not timestamp:
@@ -198,6 +246,145 @@ def display_dashboard():
     else:
         print("No active sessions found")
     
+    # Display supervisor status
+    supervised, supervisor_stats = get_supervisor_status()
+    
+    if supervised:
+        print()
+        recoveries = int(supervisor_stats.get("recoveries", 0))
+        mean_recover = float(supervisor_stats.get("recover_ms_total", 0)) / recoveries if recoveries else 0
+        print(f"=== Supervisor === (restarts: {supervisor_stats.get('restarts', 0)}, "
+              f"mean time to recover: {mean_recover:.0f} ms)")
+        table = PrettyTable()
+        table.field_names = ["Queue", "PID", "Heartbeat Age", "Job Age", "Restarts", "Last Recover (ms)"]
+        
+        for worker in supervised:
+            table.add_row([
+                worker["queue"],
+                worker["pid"],
+                f"{worker['heartbeat_age']:.1f}s",
+                f"{worker['job_age']:.1f}s" if worker["job_age"] else "idle",
+                worker["restarts"],
+                worker["recover_ms"]
+            ])
+        
+        print(table)
+    
+    # Display per-job worker overhead
+    overhead = get_job_overhead()
+    
+    if overhead:
+        print()
+        print("=== Job Overhead ===")
+        table = PrettyTable()
+        table.field_names = ["Queue", "Mode", "Jobs", "Avg Job (ms)", "Avg Overhead (ms)"]
+        
+        for row in overhead:
+            table.add_row([
+                row["queue"],
+                row["mode"],
+                row["jobs"],
+                f"{row['avg_total_ms']:.2f}",
+                f"{row['avg_overhead_ms']:.2f}"
+            ])
+        
+        print(table)
+    
+    # Display deadline scheduling per job class
+    scheduling = get_scheduler_stats()
+    
+    if scheduling:
+        print()
+        print("=== Job Classes ===")
+        table = PrettyTable()
+        table.field_names = ["Class", "Queue", "Deadline (s)", "Waiting", "Jobs", "Missed", "Avg Latency (ms)", "Avg Late By (ms)"]
+        
+        for row in scheduling:
+            table.add_row([
+                row["job_class"],
+                row["queue"],
+                row["deadline"],
+                row["waiting"],
+                row["jobs"],
+                f"{row['misses']} ({100 * row['misses'] / row['jobs']:.1f}%)",
+                f"{row['avg_latency_ms']:.1f}",
+                f"{row['avg_late_ms']:.1f}"
+            ])
+        
+        print(table)
+    
+    # Display DSP front end batching
+    dsp = {k.decode('utf-8'): float(v) for k, v in redis_conn.hgetall("dsp:stats").items()}
+    
+    if dsp.get("ticks"):
+        print()
+        print(f"=== DSP Front End === (ticks: {int(dsp['ticks'])}, "
+              f"avg sessions per batch: {dsp.get('sessions', 0) / dsp['ticks']:.1f}, "
+              f"avg tick: {dsp.get('tick_ms', 0) / dsp['ticks']:.2f} ms)")
+    
+    # Display transcription batching
+    stt = {k.decode('utf-8'): float(v) for k, v in data_conn.hgetall("stt:stats").items()}
+    
+    if stt.get("batches"):
+        batches = stt["batches"]
+        print()
+        print(f"=== Transcription === (batches: {int(batches)}, items: {int(stt.get('items', 0))}, "
+              f"max batch: {int(stt.get('max_batch', 0))}, max wait: {stt.get('max_wait_ms', 0):.0f} ms)")
+        print(f"  Avg occupancy: {100 * stt.get('occupancy', 0) / batches:.0f}%, "
+              f"avg batch wait: {stt.get('wait_ms', 0) / batches:.1f} ms, "
+              f"avg backend: {stt.get('backend_ms', 0) / batches:.1f} ms")
+    
+    # Display admission control decisions
+    admission = {k.decode('utf-8'): v.decode('utf-8') for k, v in data_conn.hgetall("admission:stats").items()}
+    
+    if admission:
+        print()
+        print(f"=== Admission === (admitted: {admission.get('admitted', 0)}, "
+              f"deferred: {admission.get('deferred', 0)}, rejected: {admission.get('rejected', 0)}, "
+              f"frames dropped: {admission.get('frames_dropped', 0)})")
+        reasons = sorted((k, v) for k, v in admission.items() if ":" in k)
+        if reasons:
+            table = PrettyTable()
+            table.field_names = ["Decision", "Reason", "Count"]
+            for key, count in reasons:
+                decision, reason = key.split(":", 1)
+                table.add_row([decision, reason, count])
+            print(table)
+    
+    # Display speculative generation outcomes
+    spec = {k.decode('utf-8'): float(v) for k, v in data_conn.hgetall("spec:stats").items()}
+    
+    if spec.get("attempts"):
+        hits = spec.get("hits", 0)
+        resolved = hits + spec.get("misses", 0)
+        print()
+        print(f"=== Speculation === (attempts: {int(spec['attempts'])}, hits: {int(hits)}, "
+              f"hit rate: {100 * hits / resolved if resolved else 0:.0f}%, "
+              f"avg saved per hit: {spec.get('saved_ms', 0) / hits if hits else 0:.0f} ms)")
+    
+    # Display barge-in cancellations and the work they avoided
+    turn_stats = {k.decode('utf-8'): v.decode('utf-8') for k, v in data_conn.hgetall("turn:stats").items()}
+    
+    if turn_stats:
+        print()
+        print(f"=== Turn Cancellation === (cancelled: {turn_stats.get('cancelled', 0)}, "
+              + ", ".join(f"{k}: {v}" for k, v in sorted(turn_stats.items())
+                          if k != "cancelled" and not k.startswith("cancelled:"))
+              + ")")
+        reasons = sorted((k.split(":", 1)[1], v) for k, v in turn_stats.items() if k.startswith("cancelled:"))
+        if reasons:
+            print("  By reason: " + ", ".join(f"{reason} {count}" for reason, count in reasons))
+    
+    # Display workers and queues being profiled
+    now = time.time()
+    profiling = {k.decode('utf-8'): float(v) for k, v in redis_conn.hgetall("profile:control").items()}
+    active = sorted((target, until) for target, until in profiling.items() if until > now)
+    
+    if active:
+        print()
+        print("=== Profiling === " + ", ".join(f"{target} ({until - now:.0f}s left)" for target, until in active))
+        print("  Dump with: python -m app.redis.profiler dump <target> --output stacks.txt")
+    
     # If filtering by device, show detailed stats
     if args.device:
         print(f"\n=== Detailed Stats for Device: {args.device} ===")
@@ -217,14 +404,11 @@ def display_dashboard():
         buffer_sizes = []
         
         for session in sessions:
-            if session["device_id"] == args.device:
-                buffer_key = f"buffer:{session['session_id']}"
-                if redis_conn.exists(buffer_key):
-                    buffer_size = redis_conn.strlen(buffer_key)
-                    buffer_sizes.append({
-                        "session_id": session["session_id"],
-                        "size": buffer_size
-                    })
+            if session["device_id"] == args.device and session["buffer_size"]:
+                buffer_sizes.append({
+                    "session_id": session["session_id"],
+                    "size": session["buffer_size"]
+                })
         
         if buffer_sizes:
             print("\nCurrent Audio Buffers:")
@@ -2,6 +2,8 @@ import { useState, useEffect, useRef, useCallback } from 'react';
 
 // Use the exact same URL format that works in your logs
 const WEBSOCKET_URL = 'ws://127.0.0.1:8000/ws/TEST_DEVICE_1234';
+// useAudioRecorder captures at 16 kHz; the server resamples to its own rate
+const CAPTURE_RATE = 16000;
 
 interface WebSocketHook {
   connected: boolean;
@@ -15,6 +17,8 @@ export const useWebSocketConnection = (): WebSocketHook => {
   const [connected, setConnected] = useState<boolean>(false);
   const [responseAudio, setResponseAudio] = useState<Uint8Array | null>(null);
   const websocketRef = useRef<WebSocket | null>(null);
+  // Token the server hands out so a dropped connection can resume its session
+  const resumeTokenRef = useRef<string | null>(null);
   
   // Connect to the WebSocket server
   const connect = useCallback(async (): Promise<void> => {
@@ -29,10 +33,13 @@ export const useWebSocketConnection = (): WebSocketHook => {
           return;
         }
         
-        console.log('Connecting to WebSocket server at:', WEBSOCKET_URL);
+        const url = resumeTokenRef.current
+          ? `${WEBSOCKET_URL}?rate=${CAPTURE_RATE}&resume=${encodeURIComponent(resumeTokenRef.current)}`
+          : `${WEBSOCKET_URL}?rate=${CAPTURE_RATE}`;
+        console.log('Connecting to WebSocket server at:', url);
         
         // Create a new WebSocket connection
-        const ws = new WebSocket(WEBSOCKET_URL);
+        const ws = new WebSocket(url);
         
         // Set up event handlers
         ws.onopen = () => {
@@ -67,6 +74,9 @@ export const useWebSocketConnection = (): WebSocketHook => {
               // If we received an acknowledgment, we don't need to do anything special
               if (response.type === 'ack') {
                 console.log('Received acknowledgment from server');
+              } else if (response.type === 'session') {
+                console.log('Session', response.resumed ? 'resumed:' : 'started:', response.session_id);
+                resumeTokenRef.current = response.resume_token;
               } else if (response.type === 'info') {
                 console.log('Received info from server:', response.message);
               }
@@ -113,13 +123,17 @@ export const useWebSocketConnection = (): WebSocketHook => {
     console.log('Disconnecting WebSocket...');
     if (websocketRef.current) {
       // Only close if it's connected
-      if (websocketRef.current.readyState === WebSocket.OPEN ||
-          websocketRef.current.readyState === WebSocket.CONNECTING) {
+      if (websocketRef.current.readyState === WebSocket.OPEN) {
+        // Deliberate hang-up, let the server end the session right away
+        websocketRef.current.send(JSON.stringify({ type: 'end_session' }));
+        websocketRef.current.close();
+      } else if (websocketRef.current.readyState === WebSocket.CONNECTING) {
         websocketRef.current.close();
       }
       websocketRef.current = null;
     }
     
+    resumeTokenRef.current = null;
     setConnected(false);
   }, []);
   
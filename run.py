@@ -4,8 +4,9 @@ import logging
 import uvicorn
 from app.main import app
 from app.redis.redis_client import get_redis_client
-# from app.syllabus_manager import SyllabusManager
+from app.syllabus_manger import SyllabusManager
 from app.redis.workflow_engine import WorkflowEngine
+from app.config import SYLLABUS_DIR
 
 async def setup():
     """Perform setup tasks before starting server"""
@@ -13,8 +14,8 @@ async def setup():
     redis = await get_redis_client()
     
     # Load syllabus into Redis
-    # syllabus = SyllabusManager("./syllabus")
-    # await syllabus.load_syllabus_to_redis()
+    syllabus = SyllabusManager(SYLLABUS_DIR)
+    await syllabus.load_syllabus_to_redis()
     
     logging.info("Setup complete")
 
@@ -0,0 +1,104 @@
+# serve.py
+import os
+import sys
+import signal
+import socket
+import asyncio
+import logging
+import argparse
+import multiprocessing
+import uvicorn
+from run import setup
+
+logging.basicConfig(level=logging.INFO,
+                   format='%(asctime)s [%(levelname)s] %(message)s')
+logger = logging.getLogger(__name__)
+
+def fastest_loop():
+    """Prefer uvloop when it is installed"""
+    try:
+        import uvloop  # noqa: F401
+        return "uvloop"
+    except ImportError:
+        return "asyncio"
+
+def fastest_http():
+    """Prefer httptools when it is installed"""
+    try:
+        import httptools  # noqa: F401
+        return "httptools"
+    except ImportError:
+        return "h11"
+
+def serve_reuseport(host, port, loop, http):
+    """Run one server process on its own SO_REUSEPORT socket"""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind((host, port))
+    sock.set_inheritable(True)
+
+    config = uvicorn.Config("app.main:app", loop=loop, http=http, log_level="info")
+    server = uvicorn.Server(config)
+    server.run(sockets=[sock])
+
+def run_reuseport(args, loop, http):
+    """Start N processes that each accept on the shared port, kernel balanced"""
+    # Spawned, not forked: setup() left an async Redis client in this
+    # process bound to a loop that has since closed, and a forked child
+    # would inherit it
+    context = multiprocessing.get_context("spawn")
+    processes = []
+    for index in range(args.workers):
+        process = context.Process(
+            target=serve_reuseport,
+            args=(args.host, args.port, loop, http),
+            name=f"ws-{index}"
+        )
+        process.start()
+        logger.info(f"Started WebSocket process {index} with PID: {process.pid}")
+        processes.append(process)
+
+    def shutdown(signum, frame):
+        logger.info(f"Received signal {signum}, stopping WebSocket processes")
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+
+    signal.signal(signal.SIGINT, shutdown)
+    signal.signal(signal.SIGTERM, shutdown)
+
+    for process in processes:
+        process.join()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Production launcher for the WebSocket tier')
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help='Number of server processes')
+    parser.add_argument('--mode', choices=['prefork', 'reuseport'], default='prefork',
+                        help='prefork shares one listening socket, reuseport gives each process its own')
+    parser.add_argument('--node-id', help='Name of this node in the connection directory')
+    args = parser.parse_args()
+
+    if args.node_id:
+        # Read by app.config in every child process
+        os.environ["NODE_ID"] = args.node_id
+
+    if args.mode == 'reuseport' and not hasattr(socket, "SO_REUSEPORT"):
+        logger.error("SO_REUSEPORT is not available on this platform, use --mode prefork")
+        sys.exit(1)
+
+    # Publish the syllabus once, before any worker starts
+    asyncio.run(setup())
+
+    loop = fastest_loop()
+    http = fastest_http()
+    logger.info(f"Starting {args.workers} {args.mode} workers on {args.host}:{args.port} (loop={loop}, http={http})")
+
+    if args.mode == 'reuseport':
+        run_reuseport(args, loop, http)
+    else:
+        uvicorn.run("app.main:app", host=args.host, port=args.port,
+                    workers=args.workers, loop=loop, http=http)
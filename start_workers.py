@@ -4,6 +4,7 @@ import sys
 import subprocess
 import logging
 import signal
+import threading
 import time
 
 # Configure logging
@@ -17,6 +18,11 @@ logger = logging.getLogger(__name__)
 # Worker manager process
 worker_manager_process = None
 
+# Restart backoff for the manager itself; individual workers are
+# restarted by the manager's supervisor
+MAX_RESTART_DELAY = 60
+STABLE_AFTER = 60
+
 def start_worker_manager():
     """Start the worker manager as a subprocess"""
     global worker_manager_process
@@ -25,7 +31,7 @@ def start_worker_manager():
     
     # Start the worker manager
     worker_manager_process = subprocess.Popen(
-        [sys.executable, "app/redis/worker_manager.py"],
+        [sys.executable, "-m", "app.redis.worker_manager"],
         stdout=subprocess.PIPE,
         stderr=subprocess.STDOUT,
         universal_newlines=True,
@@ -37,17 +43,25 @@ def start_worker_manager():
     # Return the process
     return worker_manager_process
 
+def forward_output(process):
+    """Log a subprocess's output from a background thread"""
+    def pump():
+        for line in process.stdout:
+            line = line.strip()
+            if line:
+                logger.info(line)
+    
+    thread = threading.Thread(target=pump, name="manager-output", daemon=True)
+    thread.start()
+    return thread
+
 def monitor_process_output(process):
-    """Monitor and log output from a subprocess"""
-    while True:
-        output = process.stdout.readline()
-        if output == '' and process.poll() is not None:
-            break
-        if output:
-            logger.info(output.strip())
+    """Wait for a subprocess while its output is forwarded to the log"""
+    thread = forward_output(process)
+    rc = process.wait()
+    thread.join(timeout=1)
     
     # Process has terminated
-    rc = process.poll()
     logger.info(f"Process exited with return code: {rc}")
     return rc
 
@@ -88,12 +102,19 @@ if __name__ == "__main__":
         # If we get here, worker manager exited
         logger.error("Worker manager exited unexpectedly")
         
-        # Try to restart it
+        # Restart it with exponential backoff, reset once it stays up
+        failures = 1
         while True:
-            logger.info("Restarting worker manager in 5 seconds...")
-            time.sleep(5)
+            delay = min(MAX_RESTART_DELAY, 2 ** (failures - 1))
+            logger.info(f"Restarting worker manager in {delay} seconds...")
+            time.sleep(delay)
+            
+            started = time.time()
             process = start_worker_manager()
             monitor_process_output(process)
+            logger.error("Worker manager exited unexpectedly")
+            
+            failures = 1 if time.time() - started > STABLE_AFTER else failures + 1
     
     except KeyboardInterrupt:
         logger.info("Keyboard interrupt received, shutting down...")
@@ -0,0 +1,259 @@
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import tracemalloc
+
+# Micro-benchmarks for the audio processor and workflow hot paths.
+# Runs against an in-memory Redis (fakeredis) by default, or the Redis
+# from the usual REDIS_* settings with --redis. Reports ops/sec, peak
+# allocation and Redis round trips per call, and exits non-zero when a
+# case regresses past --threshold against a saved baseline.
+
+CHUNK_SIZE = 1024  # 64 ms of 8 kHz 16-bit audio
+BUFFER_SIZE = 32000  # the processor's 2 second threshold
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench_baseline.json")
+
+# Benchmarks measure our code, not transcription or archiving
+os.environ["TRANSCRIPTION_BACKEND"] = "off"
+os.environ["AUDIO_ARCHIVE"] = "false"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Async code under test runs on one loop for the whole run
+loop = asyncio.new_event_loop()
+asyncio.set_event_loop(loop)
+
+class RoundTrips:
+    """Counts commands and pipelines sent by the clients it wraps"""
+
+    def __init__(self):
+        self.count = 0
+
+    def wrap(self, conn, is_async=False):
+        execute_command, pipeline = conn.execute_command, conn.pipeline
+
+        def counted_execute_command(*args, **kwargs):
+            self.count += 1
+            return execute_command(*args, **kwargs)
+
+        def counted_pipeline(*args, **kwargs):
+            pipe = pipeline(*args, **kwargs)
+            execute = pipe.execute
+
+            if is_async:
+                async def counted_execute(*a, **kw):
+                    self.count += 1
+                    return await execute(*a, **kw)
+            else:
+                def counted_execute(*a, **kw):
+                    self.count += 1
+                    return execute(*a, **kw)
+            pipe.execute = counted_execute
+            return pipe
+
+        conn.execute_command = counted_execute_command
+        conn.pipeline = counted_pipeline
+        return conn
+
+def connect(use_redis, round_trips):
+    """Point the app's module-level clients at the benchmark Redis"""
+    from app.redis import redis_client, audio_processor
+    if use_redis:
+        sync_conn = redis_client.create_redis()
+        async_conn = loop.run_until_complete(redis_client.get_redis_client())
+    else:
+        try:
+            import fakeredis
+        except ImportError:
+            sys.exit("fakeredis is not installed; install it or run with --redis")
+        server = fakeredis.FakeServer()
+        sync_conn = fakeredis.FakeRedis(server=server)
+        async_conn = fakeredis.FakeAsyncRedis(server=server)
+    audio_processor.redis_conn = round_trips.wrap(sync_conn)
+    redis_client._redis_client = round_trips.wrap(async_conn, is_async=True)
+    return sync_conn
+
+# Each case returns (setup, op): setup() runs untimed before every call
+# and returns the op's arguments.
+
+def case_pcm_to_wav(conn):
+    from app.main import pcm_to_wav
+    pcm = os.urandom(BUFFER_SIZE)
+    return (lambda: (pcm,)), pcm_to_wav
+
+def case_mp3_to_wav(conn):
+    from io import BytesIO
+    from pydub import AudioSegment
+    from app.main import mp3_to_wav
+    mp3 = BytesIO()
+    AudioSegment(os.urandom(BUFFER_SIZE), frame_rate=8000, sample_width=2, channels=1).export(mp3, format="mp3")
+    data = mp3.getvalue()
+    return (lambda: (data,)), mp3_to_wav
+
+def new_session(conn, name):
+    from app.redis import session_store
+    from app.session_manager import new_session_id
+    device_id = f"BENCH_{name}"
+    session_id = new_session_id(device_id)
+    session_store.create(conn, session_id, device_id, f"user_{device_id}", "bench")
+    return device_id, session_id
+
+def case_process_user_audio_chunk(conn):
+    from app.redis import session_store
+    from app.redis.audio_processor import process_user_audio_chunk
+    device_id, session_id = new_session(conn, "chunk")
+    entry_id = session_store.append_audio(conn, session_id, os.urandom(CHUNK_SIZE))
+    # Keep the buffer under its threshold so every call takes the chunk path
+    conn.hset(session_store.session_key(session_id), session_store.F_BUFFERED_BYTES, -10 ** 12)
+    return (lambda: (session_id, entry_id, CHUNK_SIZE, time.time())), process_user_audio_chunk
+
+def case_process_audio_buffer(conn):
+    from app.redis import session_store
+    from app.redis.audio_processor import process_audio_buffer
+    device_id, session_id = new_session(conn, "buffer")
+    payload = os.urandom(CHUNK_SIZE)
+
+    def setup():
+        pipe = conn.pipeline()
+        for _ in range(BUFFER_SIZE // CHUNK_SIZE):
+            session_store.append_audio(conn, session_id, payload, pipe=pipe)
+        pipe.hincrby(session_store.session_key(session_id), session_store.F_BUFFERED_BYTES, BUFFER_SIZE)
+        pipe.execute()
+        return session_id, device_id
+    return setup, process_audio_buffer
+
+def case_end_stream_processing(conn):
+    from app.redis import session_store
+    from app.redis.audio_processor import end_stream_processing
+    payload = os.urandom(CHUNK_SIZE)
+    counter = iter(range(10 ** 9))
+
+    def setup():
+        device_id, session_id = new_session(conn, f"end_{next(counter)}")
+        pipe = conn.pipeline()
+        for _ in range(BUFFER_SIZE // CHUNK_SIZE // 2):
+            session_store.append_audio(conn, session_id, payload, pipe=pipe)
+        pipe.hincrby(session_store.session_key(session_id), session_store.F_BUFFERED_BYTES, BUFFER_SIZE // 2)
+        pipe.execute()
+        return session_id, device_id
+    return setup, end_stream_processing
+
+def case_process_transcription(conn):
+    from app.redis.workflow_engine import WorkflowEngine
+    engine = WorkflowEngine("BENCH_workflow", {"name": "Bench", "age": 7})
+    turns = iter(["hello", "let's learn about animals", "perro", "why is the sky blue"] * 10 ** 6)
+
+    def op(transcription):
+        return loop.run_until_complete(engine.process_transcription(transcription))
+    return (lambda: (next(turns),)), op
+
+CASES = {
+    "pcm_to_wav": case_pcm_to_wav,
+    "mp3_to_wav": case_mp3_to_wav,
+    "process_user_audio_chunk": case_process_user_audio_chunk,
+    "process_audio_buffer": case_process_audio_buffer,
+    "end_stream_processing": case_end_stream_processing,
+    "WorkflowEngine.process_transcription": case_process_transcription,
+}
+
+# Timed runs per case; the fastest one counts, to keep noise out of the comparison
+REPEATS = 3
+
+def measure(setup, op, iterations, round_trips):
+    """Time each call on its own so setup stays out of the numbers"""
+    for _ in range(min(10, iterations)):
+        op(*setup())
+
+    runs = []
+    trips = 0
+    for _ in range(REPEATS):
+        elapsed = 0.0
+        for _ in range(iterations):
+            args = setup()
+            before = round_trips.count
+            start = time.perf_counter()
+            op(*args)
+            elapsed += time.perf_counter() - start
+            trips += round_trips.count - before
+        runs.append(elapsed)
+    elapsed = min(runs)
+
+    # Allocation profile in a separate, shorter pass; tracing slows calls down
+    peaks = []
+    tracemalloc.start()
+    for _ in range(min(20, iterations)):
+        args = setup()
+        tracemalloc.reset_peak()
+        base = tracemalloc.get_traced_memory()[0]
+        op(*args)
+        peaks.append(tracemalloc.get_traced_memory()[1] - base)
+    tracemalloc.stop()
+
+    return {
+        "ops_per_sec": iterations / elapsed,
+        "us_per_op": elapsed / iterations * 1e6,
+        "round_trips": trips / (iterations * REPEATS),
+        "peak_kib": sorted(peaks)[len(peaks) // 2] / 1024,
+    }
+
+def regressions(name, result, baseline, threshold):
+    """Reasons a case is worse than its baseline"""
+    base = baseline.get(name)
+    if not base:
+        return []
+    found = []
+    if result["ops_per_sec"] < base["ops_per_sec"] * (1 - threshold):
+        found.append(f"ops/sec {result['ops_per_sec']:.0f} < {base['ops_per_sec']:.0f}")
+    # Round trips are deterministic, any increase counts
+    if result["round_trips"] > base["round_trips"] + 0.01:
+        found.append(f"round trips {result['round_trips']:.2f} > {base['round_trips']:.2f}")
+    if result["peak_kib"] > base["peak_kib"] * (1 + threshold) + 1:
+        found.append(f"peak {result['peak_kib']:.1f} KiB > {base['peak_kib']:.1f} KiB")
+    return found
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Micro-benchmarks for the processing hot paths')
+    parser.add_argument('cases', nargs='*', help=f"Subset of: {', '.join(CASES)}")
+    parser.add_argument('--iterations', type=int, default=500)
+    parser.add_argument('--redis', action='store_true', help='Use the configured Redis instead of fakeredis')
+    parser.add_argument('--baseline', default=BASELINE)
+    parser.add_argument('--save-baseline', action='store_true', help='Store these results as the baseline')
+    parser.add_argument('--threshold', type=float, default=0.2, help='Allowed slowdown, 0.2 for 20%%')
+    args = parser.parse_args()
+
+    import logging
+    logging.disable(logging.WARNING)
+
+    round_trips = RoundTrips()
+    conn = connect(args.redis, round_trips)
+    baseline = {}
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    results = {}
+    failed = []
+    print(f"{'case':<38} {'ops/s':>10} {'us/op':>10} {'trips':>7} {'peak KiB':>9}")
+    for name in args.cases or CASES:
+        try:
+            setup, op = CASES[name](conn)
+        except ImportError as e:
+            print(f"{name:<38} skipped ({e})")
+            continue
+        result = results[name] = measure(setup, op, args.iterations, round_trips)
+        problems = regressions(name, result, baseline, args.threshold)
+        print(f"{name:<38} {result['ops_per_sec']:>10.0f} {result['us_per_op']:>10.1f} "
+              f"{result['round_trips']:>7.2f} {result['peak_kib']:>9.1f}"
+              + (f"  REGRESSED: {'; '.join(problems)}" if problems else ""))
+        if problems:
+            failed.append(name)
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Baseline saved to {args.baseline}")
+    if failed:
+        print(f"{len(failed)} case(s) regressed beyond {args.threshold:.0%}")
+        sys.exit(1)
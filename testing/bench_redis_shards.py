@@ -0,0 +1,138 @@
+import os
+import sys
+import time
+import shutil
+import tempfile
+import argparse
+import subprocess
+import multiprocessing
+
+# Benchmark how the session pipeline scales across Redis Cluster shards.
+# Starts a local cluster of 1..N redis-server nodes for every run (needs
+# redis-server on PATH) and drives the real chunk-processing code at it.
+
+CHUNK_SIZE = 1024  # 64 ms of 8 kHz 16-bit audio
+SLOTS = 16384
+
+def start_cluster(base_port, shards, workdir):
+    """Start `shards` cluster nodes and split the slots evenly between them"""
+    import redis
+
+    processes = []
+    for i in range(shards):
+        port = base_port + i
+        node_dir = os.path.join(workdir, str(port))
+        os.makedirs(node_dir)
+        processes.append(subprocess.Popen(
+            ["redis-server", "--port", str(port), "--cluster-enabled", "yes",
+             "--cluster-config-file", "nodes.conf", "--save", "", "--appendonly", "no"],
+            cwd=node_dir, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        ))
+
+    nodes = [redis.Redis(port=base_port + i) for i in range(shards)]
+    for node in nodes:
+        for _ in range(50):
+            try:
+                node.ping()
+                break
+            except redis.ConnectionError:
+                time.sleep(0.1)
+
+    per_node = SLOTS // shards
+    for i, node in enumerate(nodes):
+        end = SLOTS if i == shards - 1 else (i + 1) * per_node
+        node.execute_command("CLUSTER", "ADDSLOTS", *range(i * per_node, end))
+        if i:
+            node.execute_command("CLUSTER", "MEET", "127.0.0.1", base_port)
+
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        if all(b"cluster_state:ok" in node.execute_command("CLUSTER", "INFO") for node in nodes):
+            return processes, nodes
+        time.sleep(0.2)
+    raise RuntimeError(f"cluster of {shards} nodes did not become ready")
+
+def run_sessions(worker_index, sessions, chunks, results):
+    """Drive `sessions` devices through connect and `chunks` audio chunks each"""
+    # Imported here so the cluster settings in the environment take effect
+    import logging
+    logging.disable(logging.INFO)
+    from app.redis import session_store
+    from app.redis.audio_processor import redis_conn, process_user_audio_chunk
+    from app.session_manager import new_session_id
+
+    payload = os.urandom(CHUNK_SIZE)
+    session_ids = []
+    for i in range(sessions):
+        device_id = f"BENCH_{worker_index}_{i}"
+        session_id = new_session_id(device_id)
+        session_store.create(redis_conn, session_id, device_id, f"user_{device_id}", "bench")
+        session_ids.append(session_id)
+
+    done = 0
+    start = time.perf_counter()
+    for _ in range(chunks):
+        for session_id in session_ids:
+            entry_id = session_store.append_audio(redis_conn, session_id, payload)
+            process_user_audio_chunk(session_id, entry_id, CHUNK_SIZE, time.time())
+            done += 1
+    results.put((done, time.perf_counter() - start))
+
+def run_load(port, clients, sessions, chunks):
+    os.environ["REDIS_CLUSTER"] = "1"
+    os.environ["REDIS_HOST"] = "127.0.0.1"
+    os.environ["REDIS_PORT"] = str(port)
+    # Measure the Redis pipeline only, not transcription
+    os.environ["TRANSCRIPTION_BACKEND"] = "off"
+
+    ctx = multiprocessing.get_context("spawn")
+    results = ctx.Queue()
+    workers = [ctx.Process(target=run_sessions, args=(i, sessions, chunks, results))
+               for i in range(clients)]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    totals = [results.get() for _ in workers]
+    elapsed = time.perf_counter() - start
+    for worker in workers:
+        worker.join()
+    return sum(done for done, _ in totals) / elapsed
+
+def commands_per_node(nodes):
+    """Commands each node served, to show the load is spread by hash tag"""
+    return [node.info("stats")["total_commands_processed"] for node in nodes]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Redis Cluster shard scaling benchmark')
+    parser.add_argument('--max-shards', type=int, default=4)
+    parser.add_argument('--clients', type=int, default=os.cpu_count() or 1,
+                        help='Load generating processes')
+    parser.add_argument('--sessions', type=int, default=20, help='Sessions per client')
+    parser.add_argument('--chunks', type=int, default=100, help='Chunks per session')
+    parser.add_argument('--port', type=int, default=7100)
+    args = parser.parse_args()
+
+    if not shutil.which("redis-server"):
+        print("redis-server not found on PATH")
+        sys.exit(1)
+
+    # Let the spawned clients import the app package
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+    counts = sorted({1, *[n for n in (2, 4, 8) if n < args.max_shards], args.max_shards})
+
+    print(f"{'shards':>7} {'chunks/s':>10}  commands per node")
+    for shards in counts:
+        base_port = args.port + shards * 10
+        workdir = tempfile.mkdtemp(prefix=f"bench_shards_{shards}_")
+        processes = []
+        try:
+            processes, nodes = start_cluster(base_port, shards, workdir)
+            rate = run_load(base_port, args.clients, args.sessions, args.chunks)
+            spread = " ".join(str(n) for n in commands_per_node(nodes))
+            print(f"{shards:>7} {rate:>10.0f}  {spread}")
+        finally:
+            for process in processes:
+                process.terminate()
+                process.wait()
+            shutil.rmtree(workdir, ignore_errors=True)
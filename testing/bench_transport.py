@@ -0,0 +1,125 @@
+import os
+import sys
+import time
+import asyncio
+import argparse
+import multiprocessing
+
+# Latency of pipeline jobs through the two transports: RQ on Redis, with a
+# worker in another process, and the in-process task pool. Both run the
+# real process_user_audio_chunk against the configured Redis, so the
+# difference is the queueing alone. Needs a Redis at REDIS_HOST/PORT.
+
+CHUNK_SIZE = 1024  # 64 ms of 8 kHz 16-bit audio
+
+os.environ["TRANSCRIPTION_BACKEND"] = "off"
+os.environ["AUDIO_ARCHIVE"] = "false"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+def new_sessions(conn, count):
+    """Sessions kept under the buffer threshold, with one chunk each to process"""
+    from app.redis import session_store
+    from app.session_manager import new_session_id
+    sessions = []
+    for i in range(count):
+        device_id = f"BENCH_transport_{i}"
+        session_id = new_session_id(device_id)
+        session_store.create(conn, session_id, device_id, f"user_{device_id}", "bench")
+        conn.hset(session_store.session_key(session_id), session_store.F_BUFFERED_BYTES, -10 ** 12)
+        entry_id = session_store.append_audio(conn, session_id, os.urandom(CHUNK_SIZE))
+        sessions.append((device_id, session_id, entry_id))
+    return sessions
+
+def chunk_job(queue_conn, session):
+    from app.redis import job_scheduler
+    device_id, session_id, entry_id = session
+    return job_scheduler.enqueue(
+        queue_conn, job_scheduler.INGEST,
+        'app.redis.audio_processor.process_user_audio_chunk',
+        kwargs={"session_id": session_id, "entry_id": entry_id,
+                "chunk_size": CHUNK_SIZE, "timestamp": time.time()},
+        queue=f"user_{device_id}"
+    )
+
+def serve_rq(queue_names):
+    import logging
+    logging.disable(logging.WARNING)
+    from rq import Queue
+    from app.redis.redis_client import create_queue_redis
+    from app.redis.worker_manager import TimedInProcessWorker
+    conn = create_queue_redis()
+    TimedInProcessWorker([Queue(name, connection=conn) for name in queue_names], connection=conn).work()
+
+def run_rq(sessions, jobs, concurrency):
+    """Latencies in ms from enqueue to finish, read from RQ's own timestamps"""
+    from rq.job import Job
+    from app.redis.redis_client import create_queue_redis
+    queue_conn = create_queue_redis()
+    worker = multiprocessing.Process(target=serve_rq, args=([f"user_{s[0]}" for s in sessions],), daemon=True)
+    worker.start()
+    try:
+        # Let the worker register and start polling
+        time.sleep(1.0)
+        latencies = []
+        start = time.perf_counter()
+        for i in range(0, jobs, concurrency):
+            batch = [chunk_job(queue_conn, sessions[j % len(sessions)]).id
+                     for j in range(i, min(i + concurrency, jobs))]
+            while True:
+                fetched = Job.fetch_many(batch, connection=queue_conn)
+                if all(job.ended_at for job in fetched):
+                    break
+                time.sleep(0.001)
+            latencies += [(job.ended_at - job.enqueued_at).total_seconds() * 1000 for job in fetched]
+        return latencies, time.perf_counter() - start
+    finally:
+        worker.terminate()
+
+async def run_inprocess(sessions, jobs, concurrency):
+    from app.redis import job_scheduler
+    from app.redis.redis_client import create_queue_redis
+    from app.pipeline_transport import InProcessTransport
+    queue_conn = create_queue_redis()
+    transport = InProcessTransport(queue_conn)
+    transport.start()
+    job_scheduler.use_local_transport(transport)
+    try:
+        latencies = []
+        start = time.perf_counter()
+        for i in range(0, jobs, concurrency):
+            batch = [chunk_job(queue_conn, sessions[j % len(sessions)])
+                     for j in range(i, min(i + concurrency, jobs))]
+            await asyncio.gather(*(asyncio.wrap_future(job.future) for job in batch))
+            latencies += [(job.ended - job.meta["enqueued"]) * 1000 for job in batch]
+        return latencies, time.perf_counter() - start
+    finally:
+        job_scheduler.use_local_transport(None)
+
+def summary(latencies, elapsed):
+    latencies = sorted(latencies)
+    p50 = latencies[len(latencies) // 2]
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+    return f"{p50:>9.2f} {p99:>9.2f} {len(latencies) / elapsed:>9.0f}"
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Compare pipeline job latency across transports')
+    parser.add_argument('--jobs', type=int, default=500)
+    parser.add_argument('--sessions', type=int, default=8, help='Devices the jobs are spread over')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 8],
+                        help='Jobs in flight at once; 1 measures pure per-job latency')
+    parser.add_argument('--transport', choices=['redis', 'inprocess'], nargs='+', default=['redis', 'inprocess'])
+    args = parser.parse_args()
+
+    import logging
+    logging.disable(logging.WARNING)
+    from app.redis.redis_client import create_redis
+    sessions = new_sessions(create_redis(), args.sessions)
+
+    print(f"{'transport':<10} {'in flight':>9} {'p50 ms':>9} {'p99 ms':>9} {'jobs/s':>9}")
+    for concurrency in args.concurrency:
+        for name in args.transport:
+            if name == 'redis':
+                result = run_rq(sessions, args.jobs, concurrency)
+            else:
+                result = asyncio.run(run_inprocess(sessions, args.jobs, concurrency))
+            print(f"{name:<10} {concurrency:>9} {summary(*result)}")
@@ -0,0 +1,95 @@
+import asyncio
+import websockets
+import os
+import sys
+import time
+import json
+import argparse
+import subprocess
+
+# Benchmark how the WebSocket tier scales from 1 to N server processes.
+# Needs a local Redis; starts serve.py itself for every worker count.
+
+CHUNK_SIZE = 1024  # 64 ms of 8 kHz 16-bit audio
+
+async def run_client(uri, frames):
+    """Send frames and wait for each ack, returning per-frame round trips"""
+    latencies = []
+    async with websockets.connect(uri) as websocket:
+        # Session message sent on connect
+        await websocket.recv()
+        payload = os.urandom(CHUNK_SIZE)
+        for _ in range(frames):
+            start = time.perf_counter()
+            await websocket.send(payload)
+            await websocket.recv()
+            latencies.append(time.perf_counter() - start)
+        await websocket.send(json.dumps({"type": "end_session"}))
+    return latencies
+
+async def run_load(port, clients, frames):
+    uris = [f"ws://127.0.0.1:{port}/ws/BENCH_{port}_{i}" for i in range(clients)]
+    start = time.perf_counter()
+    results = await asyncio.gather(*(run_client(uri, frames) for uri in uris), return_exceptions=True)
+    elapsed = time.perf_counter() - start
+
+    latencies = sorted(l for r in results if not isinstance(r, Exception) for l in r)
+    errors = sum(1 for r in results if isinstance(r, Exception))
+    if not latencies:
+        return 0, 0, 0, errors
+    p50 = latencies[len(latencies) // 2]
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+    return len(latencies) / elapsed, p50, p99, errors
+
+def worst_blocking_site(port):
+    """Call site that blocked the event loop longest, per one server process"""
+    import urllib.request
+    try:
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}/admin/loop_lag", timeout=2) as response:
+            sites = json.load(response)["sites"]
+    except Exception:
+        return "-"
+    if not sites:
+        return "none"
+    return f"{sites[0]['site']} ({sites[0]['total_ms']:.0f} ms over {sites[0]['count']})"
+
+def wait_for_server(port, timeout=15):
+    import urllib.request
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            urllib.request.urlopen(f"http://127.0.0.1:{port}/health", timeout=1)
+            return True
+        except Exception:
+            time.sleep(0.2)
+    return False
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='WebSocket tier scaling benchmark')
+    parser.add_argument('--max-workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--clients', type=int, default=200)
+    parser.add_argument('--frames', type=int, default=50)
+    parser.add_argument('--port', type=int, default=8100)
+    parser.add_argument('--mode', choices=['prefork', 'reuseport'], default='reuseport')
+    args = parser.parse_args()
+
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    counts = sorted({1, *[n for n in (2, 4, 8, 16, 32) if n < args.max_workers], args.max_workers})
+
+    print(f"{'workers':>8} {'frames/s':>10} {'p50 ms':>8} {'p99 ms':>8} {'errors':>7}  worst loop blocker")
+    for workers in counts:
+        port = args.port + workers
+        server = subprocess.Popen(
+            [sys.executable, "serve.py", "--workers", str(workers), "--port", str(port), "--mode", args.mode],
+            cwd=root, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+        try:
+            if not wait_for_server(port):
+                print(f"{workers:>8} server did not start")
+                continue
+            rate, p50, p99, errors = asyncio.run(run_load(port, args.clients, args.frames))
+            blocker = worst_blocking_site(port)
+            print(f"{workers:>8} {rate:>10.0f} {p50 * 1000:>8.1f} {p99 * 1000:>8.1f} {errors:>7}  {blocker}")
+        finally:
+            server.terminate()
+            server.wait()
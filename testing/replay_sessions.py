@@ -0,0 +1,128 @@
+import asyncio
+import websockets
+import os
+import sys
+import time
+import json
+import argparse
+import subprocess
+from collections import deque
+
+# Replay recorded sessions (RECORD_SESSIONS=true on the server) against a
+# running server, keeping each session's frame timing and the sessions'
+# relative start times, optionally sped up and multiplied for load.
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app.session_recorder import load_sessions, AUDIO, TEXT, CLOSE  # noqa: E402
+
+async def drain_replies(websocket, sent, latencies, dropped):
+    """Match acks and drop notices to the frames they answer, in order"""
+    async for message in websocket:
+        if not isinstance(message, str) or not sent:
+            continue
+        reply = json.loads(message)
+        if reply.get("type") == "ack":
+            latencies.append(time.perf_counter() - sent.popleft())
+        elif reply.get("type") == "slow_down":
+            sent.popleft()
+            dropped.append(1)
+
+async def replay_session(url, device_id, session, speed, offset, latencies, dropped):
+    """Open a socket as the recorded device and resend its traffic on schedule"""
+    await asyncio.sleep(offset / speed)
+    uri = f"{url}/ws/{device_id}?rate={session['rate']}"
+    async with websockets.connect(uri) as websocket:
+        # Session message sent on connect
+        await websocket.recv()
+        # Send times of frames not answered yet
+        sent = deque()
+        reader = asyncio.create_task(drain_replies(websocket, sent, latencies, dropped))
+        start = time.perf_counter()
+        try:
+            for at, kind, payload in session["events"]:
+                delay = at / speed - (time.perf_counter() - start)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                if kind == AUDIO:
+                    sent.append(time.perf_counter())
+                    await websocket.send(payload)
+                elif kind == TEXT:
+                    await websocket.send(payload.decode('utf-8'))
+                elif kind == CLOSE:
+                    break
+            # Give the last acks a moment to arrive
+            await asyncio.sleep(0.5)
+        finally:
+            reader.cancel()
+
+async def run_replay(url, sessions, speed, copies):
+    first = min(session["start"] for session in sessions.values())
+    latencies = []
+    dropped = []
+    tasks = []
+    for copy in range(copies):
+        for i, session in enumerate(sessions.values()):
+            device_id = f"REPLAY_{copy}_{i}_{session['device_id']}"
+            tasks.append(replay_session(url, device_id, session, speed, session["start"] - first,
+                                        latencies, dropped))
+
+    start = time.perf_counter()
+    results = await asyncio.gather(*tasks, return_exceptions=True)
+    elapsed = time.perf_counter() - start
+    errors = [r for r in results if isinstance(r, Exception)]
+    return sorted(latencies), len(dropped), elapsed, errors
+
+def wait_for_server(port, timeout=15):
+    import urllib.request
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            urllib.request.urlopen(f"http://127.0.0.1:{port}/health", timeout=1)
+            return True
+        except Exception:
+            time.sleep(0.2)
+    return False
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Replay recorded sessions against a server')
+    parser.add_argument('recordings', nargs='+', help='Segment files or recording directories')
+    parser.add_argument('--url', default='ws://127.0.0.1:8000')
+    parser.add_argument('--serve', type=int, metavar='WORKERS',
+                        help='Start app.main:app through serve.py with this many processes on --port')
+    parser.add_argument('--port', type=int, default=8200)
+    parser.add_argument('--speed', type=float, default=1.0, help='Replay speed, 10 for 10x')
+    parser.add_argument('--copies', type=int, default=1, help='Replay every session this many times at once')
+    args = parser.parse_args()
+
+    sessions = {sid: s for sid, s in load_sessions(args.recordings).items() if s["events"]}
+    if not sessions:
+        print("No recorded sessions found")
+        sys.exit(1)
+    frames = sum(1 for s in sessions.values() for _, kind, _ in s["events"] if kind == AUDIO)
+    print(f"Replaying {len(sessions)} sessions ({frames} frames) x{args.copies} at {args.speed}x")
+
+    server = None
+    if args.serve:
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        server = subprocess.Popen(
+            [sys.executable, "serve.py", "--workers", str(args.serve), "--port", str(args.port)],
+            cwd=root, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+        args.url = f"ws://127.0.0.1:{args.port}"
+        if not wait_for_server(args.port):
+            server.terminate()
+            print("Server did not start")
+            sys.exit(1)
+    try:
+        latencies, dropped, elapsed, errors = asyncio.run(run_replay(args.url, sessions, args.speed, args.copies))
+    finally:
+        if server:
+            server.terminate()
+            server.wait()
+    print(f"Elapsed: {elapsed:.1f}s, sessions failed: {len(errors)}, frames dropped by the server: {dropped}")
+    for error in errors[:5]:
+        print(f"  {type(error).__name__}: {error}")
+    if latencies:
+        p50 = latencies[len(latencies) // 2]
+        p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+        print(f"Frames acked: {len(latencies)}, ack p50 {p50 * 1000:.1f} ms, p99 {p99 * 1000:.1f} ms")
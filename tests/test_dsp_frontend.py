@@ -0,0 +1,58 @@
+# tests/test_dsp_frontend.py
+import time
+import threading
+import numpy as np
+import pytest
+
+fakeredis = pytest.importorskip("fakeredis")
+
+from app.redis import session_store, dsp_frontend, job_scheduler
+
+TICKERS = 4
+ROUNDS = 50
+FRAME = np.arange(160, dtype="<i2").tobytes()
+
+class SlowRedis(fakeredis.FakeRedis):
+    """Yields to other threads on every command, so claims interleave"""
+
+    def execute_command(self, *args, **options):
+        time.sleep(0.001)
+        return super().execute_command(*args, **options)
+
+@pytest.fixture
+def conn(monkeypatch):
+    # Chunk jobs are not under test; count them instead of queueing them
+    jobs = []
+    monkeypatch.setattr(job_scheduler, "enqueue", lambda *args, **kwargs: jobs.append(kwargs["kwargs"]))
+    redis_conn = SlowRedis(server=fakeredis.FakeServer())
+    redis_conn.jobs = jobs
+    return redis_conn
+
+def test_concurrent_tickers_process_each_frame_once(conn):
+    session_store.create(conn, "s1", "dev1", "user_dev1", "token")
+    ticked = []
+
+    def ticker(barrier):
+        barrier.wait()
+        ticked.append(dsp_frontend.tick_sessions(conn, conn, ["s1"]))
+
+    for _ in range(ROUNDS):
+        session_store.append_raw(conn, "s1", FRAME)
+        barrier = threading.Barrier(TICKERS)
+        threads = [threading.Thread(target=ticker, args=(barrier,)) for _ in range(TICKERS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    audio = [fields for _, fields in conn.xrange(session_store.stream_key("s1"))
+             if fields[b"t"] == session_store.ENTRY_AUDIO]
+    assert sum(ticked) == ROUNDS
+    assert len(audio) == len(conn.jobs) == ROUNDS
+    assert sum(len(fields[b"d"]) for fields in audio) == ROUNDS * len(FRAME)
+    assert not conn.sismember(session_store.DSP_PENDING_KEY, "s1")
+
+def test_claim_skips_unflagged_sessions(conn):
+    conn.sadd(session_store.DSP_PENDING_KEY, "s1")
+    assert dsp_frontend.claim(conn, ["s1", "s2"]) == ["s1"]
+    assert dsp_frontend.claim(conn, ["s1", "s2"]) == []